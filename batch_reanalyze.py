@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Re-analyze stored clinical summaries with Bedrock batch inference
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from helper.batch_analysis import BatchAnalysisService
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-analyze clinical_summaries rows whose analysis is out of date")
+    parser.add_argument("--run-id", help="resume this run (default: start a new one)")
+    parser.add_argument("--limit", type=int, help="re-analyze at most this many rows")
+    parser.add_argument("--no-wait", action="store_true", help="submit/poll once and exit; rerun with --run-id to continue")
+    parser.add_argument("--status", action="store_true", help="print the run's checkpoint and exit")
+    args = parser.parse_args()
+
+    service = BatchAnalysisService()
+    run_id = args.run_id or datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+
+    if args.status:
+        state = service.load_checkpoint(run_id)
+        if state is None:
+            print(f"No checkpoint for run {run_id}")
+            return 1
+        print(json.dumps(state, indent=2))
+        return 0
+
+    print(f"Run {run_id} -> {service.version}")
+    try:
+        state = asyncio.run(service.run(run_id, limit=args.limit, wait=not args.no_wait))
+    except Exception as e:
+        print(f"❌ Batch re-analysis failed: {str(e)}")
+        return 1
+
+    for part in state["parts"]:
+        print(f"{part['name']}: {part['status']} ({part['records']} records)"
+              + (f" merged={part['merged']} failed={part['failed']} stale={part['stale']}" if part["status"] == "merged" else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Build data/icd10cm_codes.tsv from the CMS ICD-10-CM code descriptions
+"""
+import argparse
+import io
+import os
+import sys
+import urllib.request
+import zipfile
+from typing import Dict, List, Tuple
+from config import settings
+from helper.code_index import load_code_table
+
+# CMS publishes the code descriptions once per fiscal year
+CMS_URL = "https://www.cms.gov/files/zip/{year}-code-descriptions-tabular-order.zip"
+
+HEADER = [
+    "# ICD-10-CM table: code<TAB>description<TAB>alternate terms separated by |",
+    "# Built by build_icd10_codes.py from the CMS code descriptions; the short description is",
+    "# kept as an alternate term, with the alternates of the previous table.",
+]
+
+def open_source(location: str) -> bytes:
+    if location.startswith(("http://", "https://")):
+        with urllib.request.urlopen(location, timeout=120) as response:
+            return response.read()
+    with open(location, "rb") as source:
+        return source.read()
+
+def dotted(code: str) -> str:
+    """CMS files list codes without the dot ("E1165" -> "E11.65")"""
+    return code if len(code) <= 3 else f"{code[:3]}.{code[3:]}"
+
+def order_file_codes(text: str, billable_only: bool) -> List[Tuple[str, str, str]]:
+    """(code, long description, short description) from icd10cm_order_YYYY.txt.
+
+    Fixed width: order number (1-5), code (7-13), billable flag (15),
+    short description (17-76) and long description (78 on).
+    """
+    codes = []
+    for line in text.splitlines():
+        if len(line) < 78:
+            continue
+        if billable_only and line[14] != "1":
+            continue
+        codes.append((dotted(line[6:13].strip()), line[77:].strip(), line[16:76].strip()))
+    return codes
+
+def codes_file_codes(text: str) -> List[Tuple[str, str, str]]:
+    """(code, description, "") from icd10cm_codes_YYYY.txt, which lists billable codes only"""
+    codes = []
+    for line in text.splitlines():
+        fields = line.split(None, 1)
+        if len(fields) == 2:
+            codes.append((dotted(fields[0]), fields[1].strip(), ""))
+    return codes
+
+def read_codes(data: bytes, billable_only: bool) -> List[Tuple[str, str, str]]:
+    """Codes from the CMS zip, or from an order or codes text file on its own"""
+    if data[:2] == b"PK":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = [name for name in archive.namelist() if name.lower().endswith(".txt")]
+            order = [name for name in names if "order" in os.path.basename(name).lower()]
+            listing = [name for name in names if os.path.basename(name).lower().startswith("icd10cm_codes")]
+            if order:
+                return order_file_codes(archive.read(order[0]).decode("latin-1"), billable_only)
+            if listing:
+                return codes_file_codes(archive.read(listing[0]).decode("latin-1"))
+            raise Exception("no icd10cm_order or icd10cm_codes file in the archive")
+    text = data.decode("latin-1")
+    first = next((line for line in text.splitlines() if line.strip()), "")
+    if first[:5].strip().isdigit():
+        return order_file_codes(text, billable_only)
+    return codes_file_codes(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the ICD-10-CM code table from the CMS code descriptions")
+    parser.add_argument("--year", type=int, default=2025, help="fiscal year of the CMS release to download")
+    parser.add_argument("--source", help="CMS zip, icd10cm_order_YYYY.txt or icd10cm_codes_YYYY.txt (path or URL)")
+    parser.add_argument("--all", action="store_true", help="also keep non-billable category headers")
+    parser.add_argument("--output", default=settings.icd10_codes_path)
+    parser.add_argument("--fresh", action="store_true", help="do not carry over alternates from the existing output")
+    args = parser.parse_args()
+
+    source = args.source or CMS_URL.format(year=args.year)
+    try:
+        codes = read_codes(open_source(source), billable_only=not args.all)
+    except Exception as e:
+        print(f"❌ Reading {source} failed: {str(e)}")
+        return 1
+    if not codes:
+        print(f"❌ No codes found in {source}")
+        return 1
+
+    # Curated lay terms ("stomach flu") of the previous table are kept for codes that still exist
+    alternates: Dict[str, List[str]] = {}
+    if not args.fresh and os.path.exists(args.output):
+        alternates = {code: terms for code, _, terms in load_code_table(args.output)}
+
+    temporary = f"{args.output}.tmp"
+    with open(temporary, "w", encoding="utf-8") as table:
+        table.write("\n".join(HEADER) + "\n")
+        for code, description, short in codes:
+            terms = list(alternates.get(code, []))
+            if short and short.lower() != description.lower() and short not in terms:
+                terms.insert(0, short)
+            table.write(f"{code}\t{description}\t{'|'.join(terms)}\n" if terms else f"{code}\t{description}\n")
+    # Replaced in one step so a running server never indexes a half-written table
+    os.replace(temporary, args.output)
+    carried = sum(1 for code, _, _ in codes if alternates.get(code))
+    print(f"Wrote {len(codes)} codes to {args.output} ({carried} with carried-over alternates)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Build data/phi_names.tsv from the SSA first-name and Census surname files
+"""
+import argparse
+import csv
+import io
+import sys
+import urllib.request
+import zipfile
+from collections import Counter
+from typing import Dict, Iterable, Set
+from config import settings
+from helper.fast_extractor import load_drug_terms, load_lexicon
+from helper.phi_scanner import MONTHS, NON_NAME_WORDS, TITLES
+
+SSA_URL = "https://www.ssa.gov/oact/babynames/names.zip"
+CENSUS_URL = "https://www2.census.gov/topics/genealogy/2010surnames/names.zip"
+
+# First names that are also ordinary words, places or product names; a capitalized one starts many
+# sentences. Surnames need not avoid them, a lone surname only counts in the "Smith, John" form
+COMMON_WORD_NAMES = {
+    "will", "may", "june", "april", "august", "jan", "grace", "hope", "faith", "joy", "mark", "bill", "frank",
+    "rose", "dawn", "summer", "autumn", "winter", "spring", "chase", "hunter", "guy", "art", "don", "ray",
+    "pat", "sue", "rich", "dean", "gene", "cole", "jade", "ruby", "amber", "crystal", "holly", "ivy", "iris",
+    "violet", "heather", "olive", "sage", "hazel", "willow", "lily", "daisy", "river", "sky", "skye", "storm",
+    "rain", "royal", "king", "major", "prince", "princess", "queen", "duke", "angel", "precious", "unique",
+    "destiny", "justice", "honor", "true", "blue", "gray", "grey", "brown", "green", "white", "black", "young",
+    "long", "short", "little", "sharp", "strong", "cash", "price", "penny", "buck", "sunny", "sandy", "misty",
+    "stormy", "star", "harmony", "miracle", "heaven", "nova", "lane", "ford", "rocky", "sterling", "stone",
+    "clay", "chip", "bud", "kit", "kitty", "page", "case", "reed", "rod", "tad", "val", "van", "wood", "bob",
+    "dot", "patience", "mercy", "charity", "liberty", "journey", "legend", "kind", "haven", "bay", "cliff",
+    "glen", "branch", "ash", "aspen", "birch", "ember", "fern", "alpha", "echo", "ocean", "raven", "robin",
+    "wren", "jay", "drew", "pierce", "lance", "miles", "bishop", "parish", "pastor", "deacon", "sonny",
+    "junior", "baby", "boy", "girl", "chuck", "israel", "kenya", "india", "china", "asia", "africa",
+    "america", "france", "paris", "london", "dakota", "montana", "nevada", "arizona", "georgia", "carolina",
+    "dallas", "phoenix", "denver", "orlando", "tennessee", "kentucky", "alabama", "memphis", "cairo",
+    "brooklyn", "boston", "cleveland", "memory", "genesis", "temple", "march", "early", "best", "hall",
+    "house", "bank", "banks", "field", "fields", "hill", "hills", "park", "parks", "church", "north", "south",
+    "east", "west", "day", "night", "love", "tiny", "happy", "lucky", "sugar", "honey", "candy", "coy",
+}
+# Two-letter surnames that are also English words ("He, said...")
+SHORT_WORDS = {"da", "de", "do", "du", "he", "ho", "le", "ma", "oh", "so", "su", "lu", "ha", "la", "an", "as", "or", "to", "in", "on", "at", "by", "no", "us", "we", "me", "my", "go", "is", "it", "if", "of", "up", "ye"}
+
+HEADER = [
+    "# PHI name dictionary: name<TAB>F (first name) or L (surname). Ordinary words that double as",
+    "# names (Will, May, Grace, Brown, White, Young...) are left out to avoid redacting clinical text.",
+    "# Built by build_phi_names.py from the SSA first names and the Census 2010 surnames.",
+]
+
+def excluded_first_names() -> Set[str]:
+    """Words never listed as first names: the above, eponyms/institutions, months, titles, lexicon and drugs"""
+    words = set(COMMON_WORD_NAMES) | set(NON_NAME_WORDS) | {word.lower() for word in MONTHS} | {title.lower() for title in TITLES}
+    terms = load_lexicon(settings.medical_lexicon_path) + load_drug_terms(settings.drug_names_path)
+    for term, _ in terms:
+        words.update(term.split())
+    return words
+
+def open_source(location: str) -> bytes:
+    if location.startswith(("http://", "https://")):
+        with urllib.request.urlopen(location, timeout=120) as response:
+            return response.read()
+    with open(location, "rb") as source:
+        return source.read()
+
+def ssa_first_names(data: bytes, min_count: int) -> Dict[str, int]:
+    """Total births per first name over every yobYYYY.txt in the SSA national zip"""
+    counts = Counter()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for member in archive.namelist():
+            if member.startswith("yob") and member.endswith(".txt"):
+                for name, _, count in csv.reader(io.TextIOWrapper(archive.open(member), encoding="utf-8")):
+                    counts[name.lower()] += int(count)
+    return {name: count for name, count in counts.items() if count >= min_count}
+
+def census_surnames(data: bytes, limit: int) -> Iterable[str]:
+    """The most common surnames of the Census 2010 file (zip or csv), in rank order"""
+    if data[:2] == b"PK":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            member = next(name for name in archive.namelist() if name.lower().endswith(".csv"))
+            data = archive.read(member)
+    rows = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    names = []
+    for row in rows:
+        name = row["name"].strip().lower()
+        if name and name != "all other names":
+            names.append((int(row["rank"]), name))
+    return [name for _, name in sorted(names)[:limit]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the PHI name dictionary from SSA and Census name files")
+    parser.add_argument("--ssa", default=SSA_URL, help="SSA national names.zip (path or URL)")
+    parser.add_argument("--census", default=CENSUS_URL, help="Census 2010 surnames zip or csv (path or URL)")
+    parser.add_argument("--min-births", type=int, default=2000, help="keep first names given at least this often")
+    parser.add_argument("--surnames", type=int, default=25000, help="keep this many of the most common surnames")
+    parser.add_argument("--output", default=settings.phi_names_path)
+    parser.add_argument("--keep-existing", action="store_true", help="also keep the entries already in the output")
+    args = parser.parse_args()
+
+    try:
+        first = ssa_first_names(open_source(args.ssa), args.min_births)
+        last = census_surnames(open_source(args.census), args.surnames)
+    except Exception as e:
+        print(f"❌ Reading name sources failed: {str(e)}")
+        return 1
+
+    excluded = excluded_first_names()
+    calendar = {word.lower() for word in MONTHS} | {title.lower() for title in TITLES}
+    entries = {}
+    if args.keep_existing:
+        try:
+            with open(args.output, encoding="utf-8") as table:
+                for line in table:
+                    fields = line.rstrip("\n").split("\t")
+                    if not line.startswith("#") and len(fields) >= 2:
+                        entries[(fields[0], fields[1])] = True
+        except FileNotFoundError:
+            pass
+    for name in sorted(first, key=first.get, reverse=True):
+        if name not in excluded and len(name) > 1:
+            entries[(name, "F")] = True
+    for name in last:
+        if name not in calendar and name not in SHORT_WORDS and len(name) > 1:
+            entries[(name, "L")] = True
+
+    with open(args.output, "w", encoding="utf-8") as table:
+        table.write("\n".join(HEADER) + "\n")
+        for name, kind in entries:
+            table.write(f"{name}\t{kind}\n")
+    kinds = Counter(kind for _, kind in entries)
+    print(f"Wrote {len(entries)} names to {args.output} ({kinds['F']} first names, {kinds['L']} surnames)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +8,143 @@ class Settings(BaseSettings):
     aws_secret_access_key: str #= os.getenv("AWS_SECRET_ACCESS_KEY", "")
     aws_default_region: str #= os.getenv("AWS_DEFAULT_REGION", "")
     s3_bucket_name: str
+    s3_endpoint_url: Optional[str] = None  # e.g. http://localhost:9000 for a local S3 stand-in
+
+    # Concurrency limits for blocking AWS calls (see helper/aws_executor.py)
+    s3_max_concurrency: int = 16
+    transcribe_max_concurrency: int = 8
+    bedrock_max_concurrency: int = 8
+    sqs_max_concurrency: int = 2
+
+    # Streaming multipart upload of audio to S3
+    s3_upload_part_size: int = 8 * 1024 * 1024
+    s3_upload_max_parts_in_flight: int = 4
+    s3_upload_chunk_size: int = 1024 * 1024  # read size from the incoming UploadFile
+    s3_presign_expiry_seconds: int = 3600
+    # HMAC key for the upload tokens /uploads/presign hands out; derived from the AWS secret when empty
+    upload_token_secret: str = ""
+    upload_token_ttl_seconds: int = 24 * 3600
+
+    # Shared Transcribe job poller (see helper/transcribe_poller.py)
+    transcribe_poll_min_interval: float = 2.0
+    transcribe_poll_max_interval: float = 30.0
+    transcribe_poll_backoff: float = 1.5
+    transcribe_poll_batch_threshold: int = 3  # due jobs before switching to list_transcription_jobs
+    transcribe_expected_speed_ratio: float = 0.3  # first check after this fraction of the audio length
+    transcribe_job_timeout_seconds: int = 4 * 3600
+
+    # Transcribe job state-change events (EventBridge -> SQS), polling is used when unset
+    transcribe_events_queue_url: Optional[str] = None
+    sqs_endpoint_url: Optional[str] = None  # e.g. http://localhost:9324 for ElasticMQ
+    transcribe_events_fallback_interval: float = 60.0
+    transcribe_events_max_receives: int = 5
+
+    # Transcript cache keyed on audio SHA-256 (needs the transcription_files table)
+    transcript_cache_enabled: bool = False
+
+    # Parallel chunked transcription of long recordings (needs ffmpeg)
+    transcribe_chunking_enabled: bool = False
+    transcribe_chunking_min_duration: float = 20 * 60  # seconds of audio before splitting
+    transcribe_chunk_length: float = 10 * 60
+    transcribe_chunk_overlap: float = 5.0
+    transcribe_chunk_concurrency: int = 6
+
+    # Downmix/resample/silence-trim audio before upload (needs ffmpeg)
+    audio_preprocess_enabled: bool = False
+    audio_preprocess_format: str = "flac"  # flac (lossless) or ogg (Opus)
+    audio_preprocess_max_silence: float = 2.0
+
+    # Audio processing with ffmpeg
+    ffmpeg_path: str = "ffmpeg"
+    audio_max_processes: int = 4
+    audio_silence_threshold_db: float = -35.0
+    audio_silence_min_duration: float = 0.5
+
+    # Live dictation over WebSocket (Transcribe streaming)
+    transcribe_streaming_endpoint_url: Optional[str] = None  # local stand-in server
+
+    # Bedrock analysis cache: in-process LRU in front of a SQLite file
+    analysis_cache_enabled: bool = True
+    analysis_cache_ttl_seconds: int = 7 * 24 * 3600
+    analysis_cache_memory_entries: int = 512
+    analysis_cache_disk_entries: int = 50000
+    analysis_cache_path: str = "./cache/analysis_cache.sqlite3"
+
+    # Adaptive rate limiting, retries and circuit breaking for Bedrock and Transcribe
+    bedrock_rate_limit: float = 5.0  # starting requests/s; adapts between the min and max
+    bedrock_rate_limit_max: float = 50.0
+    transcribe_rate_limit: float = 10.0
+    transcribe_rate_limit_max: float = 25.0
+    rate_limit_min: float = 0.5
+    rate_limit_increase: float = 0.2  # requests/s added per successful call
+    rate_limit_decrease: float = 0.5  # rate multiplier on a throttle
+    upstream_retry_max_attempts: int = 4
+    upstream_retry_base_delay: float = 0.2
+    upstream_retry_max_delay: float = 8.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+
+    # Bedrock prompt caching of the static system/tool prefix (models that support it)
+    bedrock_prompt_cache_enabled: bool = True
+
+    # Model routing across Nova Micro/Lite/Pro (tiers smallest to largest)
+    model_routing_enabled: bool = True
+    model_router_tiers: str = "amazon.nova-micro-v1:0,amazon.nova-lite-v1:0,amazon.nova-pro-v1:0"
+    model_router_micro_max_chars: int = 1500  # short, sparse notes go to the smallest tier
+    model_router_lite_max_chars: int = 6000  # longer texts go to the largest tier
+    model_router_dense_threshold: float = 8.0  # medical terms per 100 words that skip the smallest tier
+    model_router_escalation_confidence: float = 0.6  # re-run results below this on the next tier
+    analysis_latency_slo_seconds: float = 8.0
+    model_router_latency_window_seconds: float = 600.0  # routing looks at latencies this recent
+    model_router_latency_window_samples: int = 200
+
+    # Local ICD-10-CM / CPT coding of diagnoses and procedures (helper/code_index.py)
+    clinical_coding_enabled: bool = True
+    icd10_codes_path: str = "./data/icd10cm_codes.tsv"  # starter table; build_icd10_codes.py builds the full one
+    cpt_codes_path: str = "./data/cpt_codes.tsv"  # licensed from the AMA, not shipped
+    clinical_synonyms_path: str = "./data/clinical_synonyms.tsv"
+    code_index_dir: str = "./cache/code_index"  # memory-mapped indexes shared by all workers
+    clinical_coding_min_score: float = 0.6
+    clinical_coding_candidates: int = 3
+    clinical_coding_cache_size: int = 4096
+
+    # Local medication normalization: drug dictionary and dose/route/frequency parsing
+    medication_normalization_enabled: bool = True
+    drug_names_path: str = "./data/drug_names.tsv"
+    medication_max_edit_distance: int = 2
+
+    # Deterministic fast path ahead of the model: "llm" (model only), "hybrid" (short
+    # structured notes skip the model, fast-path entities are merged into the rest) or "fast"
+    analysis_mode: str = "hybrid"
+    medical_lexicon_path: str = "./data/medical_lexicon.tsv"
+    fast_path_max_chars: int = 1500
+    fast_path_min_coverage: float = 0.85
+
+    # Local PHI detection: transcripts are redacted before Bedrock and re-hydrated afterwards
+    phi_redaction_enabled: bool = True
+    phi_names_path: str = "./data/phi_names.tsv"
+
+    # Long transcripts: map-reduce analysis over sentence-aligned chunks
+    analysis_chunking_enabled: bool = True
+    analysis_chunking_min_chars: int = 12000
+    analysis_chunk_max_chars: int = 6000
+    analysis_chunk_concurrency: int = 4
+
+    # Offline re-analysis of clinical_summaries with Bedrock batch inference (batch_reanalyze.py)
+    batch_model_id: str = "amazon.nova-pro-v1:0"
+    batch_role_arn: Optional[str] = None  # service role Bedrock assumes to read and write the batch prefix
+    batch_s3_prefix: str = "batch-analysis"
+    batch_job_max_records: int = 20000
+    batch_job_min_records: int = 100  # Bedrock rejects smaller batch jobs
+    batch_job_timeout_hours: int = 72
+    batch_poll_interval: float = 60.0
+    batch_merge_size: int = 500  # rows updated per database transaction
+    batch_checkpoint_dir: str = "./cache/batch"
+    bedrock_endpoint_url: Optional[str] = None  # local stand-in for the Bedrock control plane
+
+    # Async job API
+    job_retention_seconds: int = 3600  # keep finished jobs queryable for an hour
+
     class Config:
         env_file = ".env"
 
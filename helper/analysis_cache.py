@@ -0,0 +1,162 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a note share a key"""
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+class AnalysisCache:
+    """Two-tier cache of Bedrock analyses: in-process LRU in front of SQLite.
+
+    The key covers the normalized text, model id, inference config and the
+    prompt version, so changing any of them (including editing the prompt)
+    naturally misses. Entries expire after analysis_cache_ttl_seconds; each
+    tier evicts its least recently used entries beyond its size limit. The
+    SQLite file is shared by every worker on the box.
+    """
+
+    def __init__(self):
+        self.enabled = settings.analysis_cache_enabled
+        self.ttl = settings.analysis_cache_ttl_seconds
+        self.memory_max_entries = settings.analysis_cache_memory_entries
+        self.disk_max_entries = settings.analysis_cache_disk_entries
+        self.path = settings.analysis_cache_path
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(text: str, model_id: str, inference_config: Dict[str, Any], prompt_version: str) -> str:
+        payload = json.dumps(
+            [normalize_text(text), model_id, inference_config, prompt_version],
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(value)
+            del self._memory[key]
+
+        try:
+            entry = await asyncio.to_thread(self._disk_get, key, now)
+        except Exception as e:
+            logger.warning("Analysis cache read failed: %s", e)
+            self.errors += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, *entry)
+        return copy.deepcopy(entry[1])
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        value = copy.deepcopy(value)
+        self._remember(key, expires_at, value)
+        try:
+            await asyncio.to_thread(self._disk_set, key, expires_at, value)
+        except Exception as e:
+            logger.warning("Analysis cache write failed: %s", e)
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_last_access ON analysis_cache (last_access)")
+            self._db = db
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._db_lock:
+            return self._disk_get_locked(key, now)
+
+    def _disk_get_locked(self, key: str, now: float) -> Optional[tuple]:
+        db = self._connection()
+        row = db.execute("SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[1], json.loads(row[0])
+
+    def _disk_set(self, key: str, expires_at: float, value: Dict[str, Any]):
+        with self._db_lock:
+            self._disk_set_locked(key, expires_at, value)
+
+    def _disk_set_locked(self, key: str, expires_at: float, value: Dict[str, Any]):
+        db = self._connection()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            # Periodic eviction: expired rows first, then least recently used beyond the limit
+            db.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,))
+            db.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                "SELECT key FROM analysis_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
@@ -0,0 +1,106 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+# A boundary is the whitespace after a sentence end, or a line break (speaker turns
+# and pasted notes put each turn on its own line)
+BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+
+def split_text(text: str, max_chars: int) -> List[Tuple[int, str]]:
+    """Split text into chunks of at most max_chars on sentence or line boundaries.
+
+    Returns (start_offset, chunk_text) pairs; start_offset locates the chunk
+    in the original text so entity offsets can be rebased. A single sentence
+    longer than max_chars is cut at the last space before the limit.
+    """
+    segments = []
+    position = 0
+    for match in BOUNDARY_RE.finditer(text):
+        if match.end() > position:
+            segments.append((position, match.end()))
+            position = match.end()
+    if position < len(text):
+        segments.append((position, len(text)))
+
+    chunks = []
+    chunk_start = chunk_end = None
+    for start, end in segments:
+        if chunk_start is not None and end - chunk_start > max_chars:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = None
+        while end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars)
+            cut = cut + 1 if cut > start else start + max_chars
+            chunks.append((start, cut))
+            start = cut
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+    if chunk_start is not None:
+        chunks.append((chunk_start, chunk_end))
+
+    return [(start, text[start:end].rstrip()) for start, end in chunks if text[start:end].strip()]
+
+def item_key(name: str) -> str:
+    """Case- and whitespace-insensitive key of an item name"""
+    return " ".join(name.lower().split())
+
+def merge_named_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Deduplicate diagnoses/medications/procedures by name.
+
+    The highest confidence wins; empty fields (dosage, codes...) are filled
+    from the other copies.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        key = item_key(item.get("name", ""))
+        if not key:
+            continue
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = dict(item)
+            continue
+        best, other = (item, existing) if item.get("confidence", 0.0) > existing.get("confidence", 0.0) else (existing, item)
+        combined = dict(best)
+        for field, value in other.items():
+            if combined.get(field) in (None, "") and value not in (None, ""):
+                combined[field] = value
+        merged[key] = combined
+    return list(merged.values())
+
+def merge_analyses(chunks: List[Tuple[int, str]], analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-chunk analyses into one analysis of the full text (summary excluded).
+
+    Entity offsets are shifted by each chunk's start offset; the same entity
+    at the same position is kept once. Confidence is the chunk confidences
+    weighted by chunk length.
+    """
+    entities: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+    diagnoses, medications, procedures = [], [], []
+    weighted_confidence = 0.0
+    total_length = 0
+    for (offset, chunk_text), analysis in zip(chunks, analyses):
+        for entity in analysis.get("entities", []):
+            if entity.get("end_offset", 0) > entity.get("begin_offset", 0):
+                # 0/0 means the mention was not found; leave it unlocated
+                entity = {
+                    **entity,
+                    "begin_offset": entity["begin_offset"] + offset,
+                    "end_offset": entity["end_offset"] + offset
+                }
+            key = (entity.get("text", "").lower(), entity.get("category", ""), entity["begin_offset"])
+            if key not in entities or entity.get("confidence", 0.0) > entities[key].get("confidence", 0.0):
+                entities[key] = entity
+        diagnoses.extend(analysis.get("diagnoses", []))
+        medications.extend(analysis.get("medications", []))
+        procedures.extend(analysis.get("procedures", []))
+        weighted_confidence += analysis.get("confidence", 0.0) * len(chunk_text)
+        total_length += len(chunk_text)
+
+    return {
+        "entities": sorted(entities.values(), key=lambda entity: entity["begin_offset"]),
+        "diagnoses": merge_named_items(diagnoses),
+        "medications": merge_named_items(medications),
+        "procedures": merge_named_items(procedures),
+        "confidence": round(weighted_confidence / total_length, 4) if total_length else 0.0,
+        "phi_detected": any(analysis.get("phi_detected") for analysis in analyses)
+    }
@@ -0,0 +1,203 @@
+import bisect
+import itertools
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from helper.analysis_chunking import merge_named_items
+from helper.code_index import stem
+from helper.medication_normalizer import osa_distance
+from model.clinical_model import CompactEntity, MedicalEntity, Diagnosis, Medication, Procedure
+
+CATEGORY_CODES = {"C": "MEDICAL_CONDITION", "M": "MEDICATION", "P": "PROCEDURE", "S": "SYMPTOM"}
+
+# Case-folded word tokens; punctuation and whitespace between them are ignored when aligning
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+def tokens(text: str) -> List[str]:
+    return [token.casefold() for token in TOKEN_RE.findall(text)]
+
+def near_match(word: str, other: str) -> bool:
+    """Same word up to inflection or a one-character slip ("headaches"/"headache", "nausia"/"nausea")"""
+    if word == other:
+        return True
+    if len(word) >= 5 and len(other) >= 5:
+        return stem(word) == stem(other) or osa_distance(word, other, 1) <= 1
+    return False
+
+class EntityLocator:
+    """Finds entity mentions in the source text, in order of appearance.
+
+    The text is indexed once as case-folded word tokens with their original
+    offsets, so case, whitespace, line breaks and punctuation between words
+    ("x-ray"/"X ray", "140/90"/"140 / 90") do not matter. A mention matches a
+    run of tokens: exactly, else with near matches per word. Among its
+    occurrences the first one after the previous mention that no other
+    mention took wins, so repeated mentions map to successive occurrences.
+    Mentions that cannot be found get offsets 0/0.
+    """
+
+    def __init__(self, text: str):
+        self.spans: List[Tuple[int, int]] = []
+        self.tokens: List[str] = []
+        self.index: Dict[str, List[int]] = {}
+        self.pairs: Dict[Tuple[str, str], List[int]] = {}  # first position of each word pair
+        for position, match in enumerate(TOKEN_RE.finditer(text)):
+            token = match.group(0).casefold()
+            self.spans.append(match.span())
+            self.tokens.append(token)
+            self.index.setdefault(token, []).append(position)
+            if position:
+                self.pairs.setdefault((self.tokens[-2], token), []).append(position - 1)
+        self.position = 0
+        self.used = set()
+        self._near: Dict[str, set] = {}
+        self._near_index: Dict[str, List[int]] = {}
+
+    def locate(self, mention: str) -> Tuple[int, int]:
+        needle = tokens(mention)
+        if not needle:
+            return 0, 0
+        start = self._find(needle, exact=True)
+        if start is None:
+            start = self._find(needle, exact=False)
+        if start is None:
+            return 0, 0
+        self._take(start, len(needle))
+        return self.spans[start][0], self.spans[start + len(needle) - 1][1]
+
+    def claim(self, begin_offset: int, end_offset: int) -> bool:
+        """Record a mention already placed at these offsets; False unless they span free whole tokens"""
+        first = bisect.bisect_left(self.spans, (begin_offset, 0))
+        last = bisect.bisect_left(self.spans, (end_offset, 0)) - 1
+        if first >= len(self.spans) or self.spans[first][0] != begin_offset or last < first or self.spans[last][1] != end_offset:
+            return False
+        if first in self.used:
+            return False
+        self._take(first, last - first + 1)
+        return True
+
+    def _take(self, start: int, length: int):
+        self.used.add(start)
+        self.position = start + length
+
+    def _find(self, needle: List[str], exact: bool) -> Optional[int]:
+        """First free occurrence after the previous mention, else before it, else any occurrence"""
+        if exact:
+            firsts = self.index.get(needle[0], []) if len(needle) == 1 else self.pairs.get((needle[0], needle[1]), [])
+        else:
+            firsts = self._near_positions(needle[0])
+        split = bisect.bisect_left(firsts, self.position)
+        taken = None
+        for first in itertools.chain(itertools.islice(firsts, split, None), itertools.islice(firsts, split)):
+            if not self._matches(first, needle, exact):
+                continue
+            if first not in self.used:
+                return first
+            if taken is None:
+                taken = first
+        return taken
+
+    def _matches(self, first: int, needle: List[str], exact: bool) -> bool:
+        if first + len(needle) > len(self.tokens):
+            return False
+        for offset, word in enumerate(needle):
+            token = self.tokens[first + offset]
+            if token != word and (exact or token not in self._near_words(word)):
+                return False
+        return True
+
+    def _near_words(self, word: str) -> set:
+        near = self._near.get(word)
+        if near is None:
+            near = self._near[word] = {other for other in self.index if near_match(word, other)}
+        return near
+
+    def _near_positions(self, word: str) -> List[int]:
+        positions = self._near_index.get(word)
+        if positions is None:
+            positions = self._near_index[word] = sorted(
+                position for other in self._near_words(word) for position in self.index[other]
+            )
+        return positions
+
+def align_entities(analysis: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """Give every entity offsets that point at its mention in text, in place.
+
+    Entities already placed on their mention are kept; the others (cached
+    analyses, legacy output with model-written offsets) are located again.
+    """
+    def placed(entity: Dict[str, Any]) -> bool:
+        begin_offset, end_offset = entity.get("begin_offset", 0), entity.get("end_offset", 0)
+        if not 0 <= begin_offset < end_offset <= len(text):
+            return False
+        found, expected = tokens(text[begin_offset:end_offset]), tokens(entity.get("text", ""))
+        return len(found) == len(expected) and all(near_match(word, other) for word, other in zip(expected, found))
+
+    entities = analysis.get("entities", [])
+    if all(placed(entity) for entity in entities):
+        return analysis
+    locator = EntityLocator(text)
+    for entity in entities:
+        if placed(entity) and locator.claim(entity["begin_offset"], entity["end_offset"]):
+            continue
+        entity["begin_offset"], entity["end_offset"] = locator.locate(entity.get("text", ""))
+    return analysis
+
+def compact_entity(data: Any) -> Optional[Dict[str, Any]]:
+    """Validate one compact entity, tolerating a missing confidence; None if unusable"""
+    if not isinstance(data, dict):
+        return None
+    try:
+        return CompactEntity.model_validate({"p": 0.0, **data}).model_dump()
+    except ValidationError:
+        return None
+
+def expand_entity(entity: Dict[str, Any], locator: EntityLocator) -> Dict[str, Any]:
+    category = CATEGORY_CODES[entity["c"]]
+    begin_offset, end_offset = locator.locate(entity["t"])
+    return MedicalEntity(
+        text=entity["t"],
+        category=category,
+        type=entity.get("y") or category,
+        confidence=entity["p"],
+        begin_offset=begin_offset,
+        end_offset=end_offset
+    ).dict()
+
+def entity_item(entity: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """The medication or procedure a compact entity stands for, as (list name, item)"""
+    if entity["c"] == "M":
+        # Dosage and frequency are parsed from the transcript by the medication normalizer
+        return "medications", Medication(name=entity["t"], confidence=entity["p"]).dict()
+    if entity["c"] == "P":
+        return "procedures", Procedure(name=entity["t"], confidence=entity["p"]).dict()
+    return None
+
+def expand_analysis(compact: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """Expand the compact tool output into the entities/diagnoses/medications/procedures shape.
+
+    Medications and procedures are the M and P entities (deduplicated by
+    name), diagnoses are the entities referenced by index in "dx", and all
+    offsets are computed locally against `text`.
+    """
+    locator = EntityLocator(text)
+    compact_entities: List[Dict[str, Any]] = compact["e"]
+    entities = [expand_entity(entity, locator) for entity in compact_entities]
+    items: Dict[str, List[Dict[str, Any]]] = {"medications": [], "procedures": []}
+    for entity in compact_entities:
+        item = entity_item(entity)
+        if item is not None:
+            items[item[0]].append(item[1])
+    diagnoses = [
+        Diagnosis(name=compact_entities[index]["t"], confidence=compact_entities[index]["p"]).dict()
+        for index in compact["dx"]
+        if 0 <= index < len(compact_entities)
+    ]
+    return {
+        "entities": entities,
+        "diagnoses": merge_named_items(diagnoses),
+        "medications": merge_named_items(items["medications"]),
+        "procedures": merge_named_items(items["procedures"]),
+        "summary": compact["s"],
+        "confidence": compact["p"]
+    }
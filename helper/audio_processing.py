@@ -0,0 +1,180 @@
+import asyncio
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import settings
+
+SILENCE_START_RE = re.compile(r"silence_start: (-?\d+(?:\.\d+)?)")
+SILENCE_END_RE = re.compile(r"silence_end: (-?\d+(?:\.\d+)?)")
+PROGRESS_TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+_ffmpeg_slots: Optional[asyncio.Semaphore] = None
+
+def _slots() -> asyncio.Semaphore:
+    """Cap on concurrent ffmpeg processes per worker"""
+    global _ffmpeg_slots
+    if _ffmpeg_slots is None:
+        _ffmpeg_slots = asyncio.Semaphore(settings.audio_max_processes)
+    return _ffmpeg_slots
+
+async def run_ffmpeg(args: List[str]) -> Tuple[bytes, str]:
+    """Run ffmpeg to completion and return (stdout, stderr)"""
+    async with _slots():
+        process = await asyncio.create_subprocess_exec(
+            settings.ffmpeg_path, "-hide_banner", "-nostdin", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed: {stderr.decode(errors='replace')[-500:]}")
+    return stdout, stderr.decode(errors="replace")
+
+async def stream_ffmpeg(args: List[str], chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Run ffmpeg writing to stdout and yield its output as it is produced"""
+    async with _slots():
+        process = await asyncio.create_subprocess_exec(
+            settings.ffmpeg_path, "-hide_banner", "-nostdin", "-loglevel", "error", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            while True:
+                chunk = await process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                raise Exception(f"ffmpeg failed: {stderr.decode(errors='replace')[-500:]}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+async def transcode_stream(chunks: AsyncIterator[bytes], args: List[str], stats: Dict[str, int] = None,
+                           chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Pipe chunks through ffmpeg (stdin -> stdout) and yield the output.
+
+    Input is written by a feeder task while output is read here, so neither
+    side is ever held in memory as a whole. Byte counts in both directions
+    are recorded in `stats` when given.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(input_bytes=0, output_bytes=0)
+    async with _slots():
+        process = await asyncio.create_subprocess_exec(
+            settings.ffmpeg_path, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", "pipe:0", *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        async def feed():
+            try:
+                async for chunk in chunks:
+                    stats["input_bytes"] += len(chunk)
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffmpeg exited early, its exit code reports why
+            finally:
+                process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                chunk = await process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                stats["output_bytes"] += len(chunk)
+                yield chunk
+            await feeder
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                raise Exception(f"ffmpeg failed: {stderr.decode(errors='replace')[-500:]}")
+        finally:
+            feeder.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+def preprocess_args(output_format: str) -> List[str]:
+    """ffmpeg output arguments for Transcribe-ready audio.
+
+    Downmix to mono, resample to 16 kHz, drop leading silence and shorten
+    every silence longer than audio_preprocess_max_silence seconds (which
+    covers trailing silence), then encode as FLAC or Ogg/Opus.
+    """
+    threshold = settings.audio_silence_threshold_db
+    max_silence = settings.audio_preprocess_max_silence
+    silence_filter = (
+        f"silenceremove=start_periods=1:start_threshold={threshold}dB:start_silence=0.25"
+        f":stop_periods=-1:stop_threshold={threshold}dB:stop_duration={max_silence}:stop_silence={max_silence / 2}"
+    )
+    codec = ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"] if output_format == "ogg" else ["-c:a", "flac", "-sample_fmt", "s16", "-f", "flac"]
+    return ["-vn", "-ac", "1", "-ar", "16000", "-af", silence_filter, *codec, "pipe:1"]
+
+async def analyze_silences(source: str) -> Dict[str, object]:
+    """Decode the audio once and return its duration and silent intervals"""
+    _, stderr = await run_ffmpeg([
+        "-i", source,
+        "-af", f"silencedetect=noise={settings.audio_silence_threshold_db}dB:d={settings.audio_silence_min_duration}",
+        "-f", "null", "-"
+    ])
+    silences = []
+    start = None
+    for line in stderr.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            start = max(float(match.group(1)), 0.0)
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+
+    duration = 0.0
+    for match in PROGRESS_TIME_RE.finditer(stderr):
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    if start is not None:
+        silences.append((start, duration))
+    return {"duration": duration, "silences": silences}
+
+def plan_chunks(duration: float, silences: List[Tuple[float, float]], target_length: float, overlap: float) -> List[Dict[str, float]]:
+    """Split [0, duration] into chunks of about target_length, cutting in silences.
+
+    Each cut is placed in the middle of the silence closest to the ideal cut
+    point (searching a third of target_length either side) or exactly at the
+    ideal point when there is no silence nearby. Every chunk is extended by
+    `overlap` seconds past its cuts so words at the edges are never lost;
+    `keep_from`/`keep_until` say which part of the chunk the stitched
+    transcript should take from it.
+    """
+    cuts = [0.0]
+    window = target_length / 3
+    while duration - cuts[-1] > target_length + window:
+        ideal = cuts[-1] + target_length
+        candidates = [
+            (start + end) / 2 for start, end in silences
+            if abs((start + end) / 2 - ideal) <= window and (start + end) / 2 > cuts[-1] + window
+        ]
+        cuts.append(min(candidates, key=lambda cut: abs(cut - ideal)) if candidates else ideal)
+    cuts.append(duration)
+
+    return [
+        {
+            "start": max(cuts[i] - overlap, 0.0),
+            "end": min(cuts[i + 1] + overlap, duration),
+            "keep_from": cuts[i],
+            "keep_until": cuts[i + 1]
+        }
+        for i in range(len(cuts) - 1)
+    ]
+
+def extract_chunk(source: str, start: float, end: float) -> AsyncIterator[bytes]:
+    """Stream [start, end) of the source as mono FLAC"""
+    return stream_ffmpeg([
+        "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", source,
+        "-vn", "-ac", "1", "-c:a", "flac", "-f", "flac", "pipe:1"
+    ])
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from botocore.config import Config
+from config import settings
+from helper.resilience import AdaptiveRateLimiter, CircuitBreaker, UpstreamGuard
+
+class AwsExecutor:
+    """Runs blocking boto3/requests calls on a bounded thread pool.
+
+    boto3 has no native asyncio support, so every AWS round trip is handed to
+    a dedicated pool and awaited. A semaphore per service caps how many calls
+    of that kind can be in flight, so a burst of slow Bedrock calls cannot
+    starve S3 or Transcribe calls (or the event loop) on the same worker.
+    Bedrock and Transcribe calls additionally go through an UpstreamGuard
+    (adaptive rate limit, jittered retries, circuit breaker).
+    """
+
+    def __init__(self):
+        self.limits = {
+            "s3": settings.s3_max_concurrency,
+            "transcribe": settings.transcribe_max_concurrency,
+            "bedrock": settings.bedrock_max_concurrency,
+            "sqs": settings.sqs_max_concurrency,
+        }
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(self.limits.values()),
+            thread_name_prefix="aws-io"
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting = {name: 0 for name in self.limits}
+        self._in_flight = {name: 0 for name in self.limits}
+        self.guards = {
+            "bedrock": self._guard(settings.bedrock_rate_limit, settings.bedrock_rate_limit_max),
+            "transcribe": self._guard(settings.transcribe_rate_limit, settings.transcribe_rate_limit_max),
+        }
+
+    async def run(self, service: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) in the pool under the service's concurrency limit"""
+        guard = self.guards.get(service)
+        if guard is not None:
+            return await guard.call(lambda: self._run(service, fn, *args, **kwargs))
+        return await self._run(service, fn, *args, **kwargs)
+
+    async def _run(self, service: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        semaphore = self._semaphore(service)
+        self._waiting[service] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[service] -= 1
+
+        self._in_flight[service] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._in_flight[service] -= 1
+            semaphore.release()
+
+    def client_config(self, service: str) -> Config:
+        """botocore config whose connection pool matches the service's limit"""
+        if service in self.guards:
+            # Retries are done by the guard, which also sees the throttles
+            return Config(max_pool_connections=self.limits[service], retries={"mode": "standard", "total_max_attempts": 1})
+        return Config(max_pool_connections=self.limits[service])
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {
+            name: {
+                "limit": limit,
+                "in_flight": self._in_flight[name],
+                "waiting": self._waiting[name]
+            }
+            for name, limit in self.limits.items()
+        }
+        for name, guard in self.guards.items():
+            stats[name]["upstream"] = guard.stats()
+        return stats
+
+    def _guard(self, rate: float, max_rate: float) -> UpstreamGuard:
+        return UpstreamGuard(
+            AdaptiveRateLimiter(
+                rate, max_rate, settings.rate_limit_min,
+                settings.rate_limit_increase, settings.rate_limit_decrease
+            ),
+            CircuitBreaker(settings.circuit_failure_threshold, settings.circuit_reset_seconds),
+            settings.upstream_retry_max_attempts,
+            settings.upstream_retry_base_delay,
+            settings.upstream_retry_max_delay
+        )
+
+    def _semaphore(self, service: str) -> asyncio.Semaphore:
+        if service not in self.limits:
+            raise KeyError(f"Unknown AWS service limit: {service}")
+        if service not in self._semaphores:
+            self._semaphores[service] = asyncio.Semaphore(self.limits[service])
+        return self._semaphores[service]
+
+aws_executor = AwsExecutor()
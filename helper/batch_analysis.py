@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import boto3
+from botocore.exceptions import ClientError
+from sqlalchemy import or_
+from config import settings
+from database import SessionLocal
+from models import ClinicalSummary as ClinicalSummaryRow
+from helper.aws_executor import aws_executor
+from helper.s3_service import S3Service
+from helper.phi_scanner import Redaction
+from helper.comprehend_service import (
+    ComprehendService, INFERENCE_CONFIG, PROMPT_VERSION, SYSTEM_PROMPT, TOOL_CONFIG,
+    TRANSCRIPT_PREFIX, TRANSCRIPT_SUFFIX
+)
+
+logger = logging.getLogger(__name__)
+
+# Bedrock model invocation job states
+MERGEABLE_STATUSES = {"Completed", "PartiallyCompleted"}
+FAILED_STATUSES = {"Failed", "Stopped", "Expired"}
+
+def analysis_version(model_id: str) -> str:
+    """Identifies the model and prompt a stored analysis came from"""
+    return f"{model_id}:{PROMPT_VERSION}"
+
+def record_id(row_id: int, text: str) -> str:
+    """Batch record id: the row id plus a digest of the text that was exported"""
+    return f"{row_id}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+def batch_model_input(text: str) -> Dict[str, Any]:
+    """Nova InvokeModel body with the same prompt, tool and parameters as the online analysis"""
+    return {
+        "schemaVersion": "messages-v1",
+        "system": [{"text": SYSTEM_PROMPT}],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "text": TRANSCRIPT_PREFIX + text + TRANSCRIPT_SUFFIX
+                    }
+                ]
+            }
+        ],
+        "inferenceConfig": {
+            "max_new_tokens": INFERENCE_CONFIG["maxTokens"],
+            "temperature": INFERENCE_CONFIG["temperature"],
+            "top_p": INFERENCE_CONFIG["topP"]
+        },
+        "toolConfig": TOOL_CONFIG
+    }
+
+class BatchAnalysisService:
+    """Re-analyzes stored clinical_summaries rows with Bedrock batch inference.
+
+    A run plans the pending rows (analysis_version differs from the current
+    model/prompt) into parts of at most batch_job_max_records, then for each
+    part exports the texts as JSONL to S3, submits a model invocation job,
+    polls it and merges the outputs back into the table in small
+    transactions. Progress is checkpointed to a JSON file after every step,
+    so an interrupted run resumes where it stopped. Batch jobs run on
+    Bedrock's batch capacity, not the on-demand quota the API uses.
+    """
+
+    def __init__(self, comprehend_service: ComprehendService = None):
+        self.s3_service = S3Service()
+        self.bedrock_client = boto3.client(
+            'bedrock',
+            aws_access_key_id=settings.aws_access_key_id,
+            aws_secret_access_key=settings.aws_secret_access_key,
+            region_name=settings.aws_default_region,
+            endpoint_url=settings.bedrock_endpoint_url,
+            config=aws_executor.client_config('bedrock')
+        )
+        self.bucket_name = settings.s3_bucket_name
+        self.prefix = settings.batch_s3_prefix.strip("/")
+        self.model_id = settings.batch_model_id
+        self.version = analysis_version(self.model_id)
+        # Used only to parse and expand the tool output, exactly as online analyses are
+        self.comprehend_service = comprehend_service or ComprehendService()
+
+    async def run(self, run_id: str, limit: int = None, wait: bool = True) -> Dict[str, Any]:
+        """Start or resume a run; with wait=False return after one round of submitting and polling"""
+        state = self.load_checkpoint(run_id)
+        if state is None:
+            state = await self.plan(run_id, limit)
+        while True:
+            quota_full = False
+            for part in state["parts"]:
+                if part["status"] == "planned":
+                    await self._export(state, part)
+                if part["status"] == "exported" and not quota_full:
+                    quota_full = not await self._submit(state, part)
+                if part["status"] == "submitted":
+                    await self._refresh(state, part)
+                if part["status"] == "completed":
+                    await self._merge(state, part)
+            if not wait or all(part["status"] in ("merged", "failed", "skipped") for part in state["parts"]):
+                return state
+            await asyncio.sleep(settings.batch_poll_interval)
+
+    async def plan(self, run_id: str, limit: int = None) -> Dict[str, Any]:
+        """Split the pending rows into evenly sized parts by id range"""
+        ids = await asyncio.to_thread(self._pending_ids, limit)
+        if len(ids) < settings.batch_job_min_records:
+            raise Exception(
+                f"Batch inference needs at least {settings.batch_job_min_records} pending rows, found {len(ids)}"
+            )
+        part_count = math.ceil(len(ids) / settings.batch_job_max_records)
+        part_size = math.ceil(len(ids) / part_count)
+        parts = []
+        for index, start in enumerate(range(0, len(ids), part_size)):
+            part_ids = ids[start:start + part_size]
+            parts.append({
+                "name": f"part-{index + 1:05d}",
+                "first_id": part_ids[0],
+                "last_id": part_ids[-1],
+                "records": len(part_ids),
+                "status": "planned"
+            })
+        state = {
+            "run_id": run_id,
+            "model_id": self.model_id,
+            "analysis_version": self.version,
+            "limit": limit,
+            "parts": parts
+        }
+        self.save_checkpoint(state)
+        return state
+
+    def checkpoint_path(self, run_id: str) -> str:
+        return os.path.join(settings.batch_checkpoint_dir, f"{run_id}.json")
+
+    def load_checkpoint(self, run_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_path(run_id)) as checkpoint:
+                state = json.load(checkpoint)
+        except FileNotFoundError:
+            return None
+        if state["analysis_version"] != self.version:
+            raise Exception(
+                f"Run {run_id} was planned for {state['analysis_version']}, current version is {self.version}"
+            )
+        return state
+
+    def save_checkpoint(self, state: Dict[str, Any]):
+        path = self.checkpoint_path(state["run_id"])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        with open(path + ".tmp", "w") as checkpoint:
+            json.dump(state, checkpoint, indent=2)
+        os.replace(path + ".tmp", path)
+
+    async def _export(self, state: Dict[str, Any], part: Dict[str, Any]):
+        rows = await asyncio.to_thread(self._pending_rows, part["first_id"], part["last_id"])
+        if not rows:
+            part["status"] = "skipped"
+            self.save_checkpoint(state)
+            return
+        lines = [
+            # Same local PHI redaction as the online path; records stay keyed on the stored text
+            json.dumps({"recordId": record_id(row_id, text), "modelInput": batch_model_input(self._redact(text).text)})
+            for row_id, text in rows
+        ]
+        base_key = f"{self.prefix}/{state['run_id']}"
+        input_key = f"{base_key}/input/{part['name']}.jsonl"
+        await aws_executor.run(
+            "s3",
+            self.s3_service.s3_client.put_object,
+            Bucket=self.bucket_name,
+            Key=input_key,
+            Body=("\n".join(lines) + "\n").encode("utf-8"),
+            ContentType="application/jsonl"
+        )
+        part["records"] = len(rows)
+        part["input_uri"] = f"s3://{self.bucket_name}/{input_key}"
+        part["output_uri"] = f"s3://{self.bucket_name}/{base_key}/output/{part['name']}/"
+        part["status"] = "exported"
+        self.save_checkpoint(state)
+
+    async def _submit(self, state: Dict[str, Any], part: Dict[str, Any]) -> bool:
+        """Create the part's batch job; False when the concurrent job quota is used up"""
+        if not settings.batch_role_arn:
+            raise Exception("BATCH_ROLE_ARN is required to submit Bedrock batch inference jobs")
+        try:
+            response = await aws_executor.run(
+                "bedrock",
+                self.bedrock_client.create_model_invocation_job,
+                jobName=f"reanalyze-{state['run_id']}-{part['name']}",
+                roleArn=settings.batch_role_arn,
+                modelId=self.model_id,
+                inputDataConfig={"s3InputDataConfig": {"s3Uri": part["input_uri"], "s3InputFormat": "JSONL"}},
+                outputDataConfig={"s3OutputDataConfig": {"s3Uri": part["output_uri"]}},
+                timeoutDurationInHours=settings.batch_job_timeout_hours
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ServiceQuotaExceededException":
+                return False
+            part["status"] = "failed"
+            part["message"] = str(e)
+            self.save_checkpoint(state)
+            return True
+        part["job_arn"] = response["jobArn"]
+        part["job_status"] = "Submitted"
+        part["status"] = "submitted"
+        self.save_checkpoint(state)
+        return True
+
+    async def _refresh(self, state: Dict[str, Any], part: Dict[str, Any]):
+        response = await aws_executor.run(
+            "bedrock", self.bedrock_client.get_model_invocation_job, jobIdentifier=part["job_arn"]
+        )
+        if response["status"] == part.get("job_status"):
+            return
+        part["job_status"] = response["status"]
+        if response["status"] in MERGEABLE_STATUSES:
+            part["status"] = "completed"
+        elif response["status"] in FAILED_STATUSES:
+            part["status"] = "failed"
+            part["message"] = response.get("message")
+        self.save_checkpoint(state)
+
+    async def _merge(self, state: Dict[str, Any], part: Dict[str, Any]):
+        """Write the part's outputs back; rows whose text changed since export stay pending"""
+        outputs = await self._read_outputs(part["output_uri"])
+        counts = {"merged": 0, "failed": 0, "stale": 0}
+        records = list(outputs.items())
+        for start in range(0, len(records), settings.batch_merge_size):
+            batch = records[start:start + settings.batch_merge_size]
+            texts = await asyncio.to_thread(self._texts, [int(record.split("-")[0]) for record, _ in batch])
+            mappings = []
+            for record, model_output in batch:
+                row_id = int(record.split("-")[0])
+                text = texts.get(row_id)
+                if text is None or record_id(row_id, text) != record:
+                    counts["stale"] += 1
+                    continue
+                analysis = self._parse_output(model_output, text)
+                if analysis is None:
+                    counts["failed"] += 1
+                    continue
+                mappings.append({
+                    "id": row_id,
+                    "medical_entities": json.dumps(analysis["entities"]),
+                    "diagnoses": json.dumps(analysis["diagnoses"]),
+                    "medications": json.dumps(analysis["medications"]),
+                    "procedures": json.dumps(analysis["procedures"]),
+                    "clinical_summary": analysis["summary"],
+                    "confidence_score": analysis["confidence"],
+                    "analysis_version": self.version
+                })
+            if mappings:
+                await asyncio.to_thread(self._update, mappings)
+            counts["merged"] += len(mappings)
+        counts["failed"] += max(0, part["records"] - len(records))
+        part.update(counts)
+        part["status"] = "merged"
+        self.save_checkpoint(state)
+        logger.info("Merged %s: %s", part["name"], counts)
+
+    async def _read_outputs(self, output_uri: str) -> Dict[str, Optional[Dict[str, Any]]]:
+        """recordId -> modelOutput (None for records that errored) from the job's .jsonl.out files"""
+        prefix = output_uri.split(f"s3://{self.bucket_name}/", 1)[1]
+        keys: List[str] = []
+        token = None
+        while True:
+            kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+            if token:
+                kwargs["ContinuationToken"] = token
+            response = await aws_executor.run("s3", self.s3_service.s3_client.list_objects_v2, **kwargs)
+            keys.extend(item["Key"] for item in response.get("Contents", []) if item["Key"].endswith(".jsonl.out"))
+            if not response.get("IsTruncated"):
+                break
+            token = response["NextContinuationToken"]
+
+        outputs: Dict[str, Optional[Dict[str, Any]]] = {}
+        for key in keys:
+            response = await aws_executor.run("s3", self.s3_service.s3_client.get_object, Bucket=self.bucket_name, Key=key)
+            body = await asyncio.to_thread(response["Body"].read)
+            for line in body.decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                outputs[record["recordId"]] = record.get("modelOutput") if "error" not in record else None
+        return outputs
+
+    def _parse_output(self, model_output: Optional[Dict[str, Any]], text: str) -> Optional[Dict[str, Any]]:
+        if not model_output:
+            return None
+        try:
+            output = self.comprehend_service._tool_output(model_output)
+            # Redaction is deterministic, so this reproduces the text the model saw
+            redaction = self._redact(text)
+            analysis = redaction.rehydrate_analysis(self.comprehend_service._parse_analysis(output, redaction.text))
+            return self.comprehend_service.postprocess(analysis, text, bool(redaction.spans))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _redact(self, text: str) -> Redaction:
+        return self.comprehend_service.phi_scanner.redact(text)
+
+    def _pending_filter(self):
+        return or_(ClinicalSummaryRow.analysis_version.is_(None), ClinicalSummaryRow.analysis_version != self.version)
+
+    def _pending_ids(self, limit: int = None) -> List[int]:
+        db = SessionLocal()
+        try:
+            query = db.query(ClinicalSummaryRow.id).filter(self._pending_filter()).order_by(ClinicalSummaryRow.id)
+            if limit:
+                query = query.limit(limit)
+            return [row_id for (row_id,) in query]
+        finally:
+            db.close()
+
+    def _pending_rows(self, first_id: int, last_id: int) -> List[Tuple[int, str]]:
+        db = SessionLocal()
+        try:
+            query = (
+                db.query(ClinicalSummaryRow.id, ClinicalSummaryRow.original_text)
+                .filter(ClinicalSummaryRow.id.between(first_id, last_id), self._pending_filter())
+                .order_by(ClinicalSummaryRow.id)
+            )
+            return [(row_id, text) for row_id, text in query]
+        finally:
+            db.close()
+
+    def _texts(self, ids: List[int]) -> Dict[int, str]:
+        db = SessionLocal()
+        try:
+            query = db.query(ClinicalSummaryRow.id, ClinicalSummaryRow.original_text).filter(ClinicalSummaryRow.id.in_(ids))
+            return {row_id: text for row_id, text in query}
+        finally:
+            db.close()
+
+    def _update(self, mappings: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            db.bulk_update_mappings(ClinicalSummaryRow, mappings)
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,443 @@
+import heapq
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from math import log
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "at", "by", "classified", "elsewhere", "for", "in", "not", "of", "on", "or",
+    "other", "site", "specified", "the", "to", "unspecified", "with", "without"
+}
+# Suffixes folded together so "hypertensive" meets "hypertension" and "infectious" meets "infection"
+STEM_SUFFIXES = ("ation", "ious", "ion", "ive", "ous", "ic", "al")
+
+# File layout (native byte order; the index is built on the host that serves it):
+# header, entries sorted by code, term documents, vocabulary sorted by token,
+# vocabulary sorted by reversed token, postings (document ids, shortest
+# documents first), document tokens (sorted token ids per document), string blob
+MAGIC = b"CODEIDX3"
+HEADER = struct.Struct("=8sIIIIII")
+ENTRY = struct.Struct("=IHIH")  # code offset/length, description offset/length
+DOCUMENT = struct.Struct("=IHI")  # entry, token count, first document token
+TOKEN = struct.Struct("=IHII")  # token offset/length, first posting, posting count
+
+# Documents taken from one posting list; lists are ordered shortest document
+# first, so a common token contributes its tightest matches
+CANDIDATE_POSTINGS = 300
+# Documents fully scored per lookup, picked by their raw token score
+SCORED_DOCUMENTS = 50
+
+def stem(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        token = token[:-1]
+    for suffix in STEM_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 5:
+            return token[:-len(suffix)]
+    return token
+
+def words(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower().replace("'s", ""))
+
+def index_tokens(words_: List[str]) -> List[str]:
+    """Stopwords removed and stemmed, in order"""
+    return [stem(word) for word in words_ if word not in STOPWORDS]
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def load_code_table(path: str) -> List[Tuple[str, str, List[str]]]:
+    """(code, description, alternate terms) rows from a code<TAB>description<TAB>a|b|c file"""
+    entries = []
+    with open(path, encoding="utf-8") as table:
+        for line in table:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2:
+                continue
+            terms = [term.strip() for term in fields[2].split("|") if term.strip()] if len(fields) > 2 else []
+            entries.append((fields[0].strip(), fields[1].strip(), terms))
+    return entries
+
+def load_synonyms(path: str) -> Dict[Tuple[str, ...], Tuple[str, ...]]:
+    """Phrase (as words) -> replacement words, from a phrase<TAB>replacement file"""
+    synonyms = {}
+    if not path or not os.path.exists(path):
+        return synonyms
+    with open(path, encoding="utf-8") as table:
+        for line in table:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 2 and words(fields[0]) and words(fields[1]):
+                synonyms[tuple(words(fields[0]))] = tuple(words(fields[1]))
+    return synonyms
+
+def build_code_index(entries: List[Tuple[str, str, List[str]]], path: str):
+    """Write the memory-mappable index of a code table to path (atomically)"""
+    unique = {}
+    for code, description, terms in entries:
+        unique.setdefault(code, (code, description, terms))
+    entries = sorted(unique.values(), key=lambda entry: entry[0].encode("utf-8"))
+
+    blob = bytearray()
+
+    def add_string(value: str) -> Tuple[int, int]:
+        data = value.encode("utf-8")
+        blob.extend(data)
+        return len(blob) - len(data), len(data)
+
+    entry_records = bytearray()
+    documents: List[Tuple[int, List[str]]] = []
+    postings: Dict[str, List[int]] = defaultdict(list)
+    for index, (code, description, terms) in enumerate(entries):
+        entry_records += ENTRY.pack(*add_string(code), *add_string(description))
+        for term in [description, *terms]:
+            tokens = index_tokens(words(term))
+            if not tokens:
+                continue
+            tokens = list(dict.fromkeys(tokens))
+            for token in tokens:
+                postings[token].append(len(documents))
+            documents.append((index, tokens))
+
+    vocabulary = sorted(postings, key=lambda token: token.encode("utf-8"))
+    token_ids = {token: token_id for token_id, token in enumerate(vocabulary)}
+    token_records = bytearray()
+    posting_ids = array("I")
+    for token in vocabulary:
+        token_records += TOKEN.pack(*add_string(token), len(posting_ids), len(postings[token]))
+        posting_ids.extend(sorted(postings[token], key=lambda document: (len(documents[document][1]), document)))
+    reversed_order = array("I", sorted(range(len(vocabulary)), key=lambda index: vocabulary[index][::-1].encode("utf-8")))
+    document_records = bytearray()
+    document_tokens = array("I")
+    for index, tokens in documents:
+        document_records += DOCUMENT.pack(index, min(len(tokens), 0xFFFF), len(document_tokens))
+        document_tokens.extend(sorted({token_ids[token] for token in tokens}))
+
+    header = HEADER.pack(
+        MAGIC, len(entries), len(documents), len(vocabulary), len(posting_ids), len(document_tokens), len(blob)
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as index_file:
+        for section in (header, entry_records, document_records, token_records, reversed_order.tobytes(),
+                        posting_ids.tobytes(), document_tokens.tobytes(), blob):
+            index_file.write(section)
+    # Workers starting together may all build; each rename is atomic
+    os.replace(temporary, path)
+
+class CodeIndex:
+    """Read-only, memory-mapped code index.
+
+    All workers map the same file, so the operating system keeps one copy
+    of it in the page cache. Token lookups binary-search the sorted
+    vocabulary (a flattened trie: a prefix is a contiguous range of it);
+    misspellings are matched within a small edit distance among tokens that
+    share the first or the last half of the query token.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as index_file:
+            self.buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.entry_count, self.document_count, self.token_count, posting_count, document_token_count, _ = (
+            HEADER.unpack_from(self.buffer, 0)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a code index")
+        self.entries_at = HEADER.size
+        self.documents_at = self.entries_at + self.entry_count * ENTRY.size
+        self.tokens_at = self.documents_at + self.document_count * DOCUMENT.size
+        reversed_at = self.tokens_at + self.token_count * TOKEN.size
+        postings_at = reversed_at + self.token_count * 4
+        document_tokens_at = postings_at + posting_count * 4
+        self.blob_at = document_tokens_at + document_token_count * 4
+        view = memoryview(self.buffer)
+        self.reversed_order = view[reversed_at:postings_at].cast("I")
+        self.postings = view[postings_at:document_tokens_at].cast("I")
+        self.document_tokens = view[document_tokens_at:self.blob_at].cast("I")
+        self.max_idf = log(1 + self.document_count)
+
+    def entry(self, index: int) -> Tuple[str, str]:
+        code_offset, code_length, description_offset, description_length = ENTRY.unpack_from(
+            self.buffer, self.entries_at + index * ENTRY.size
+        )
+        return self._string(code_offset, code_length), self._string(description_offset, description_length)
+
+    def lookup(self, code: str) -> Optional[str]:
+        """Description of an exact code"""
+        lo, hi = 0, self.entry_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[0] < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.entry_count and self.entry(lo)[0] == code:
+            return self.entry(lo)[1]
+        return None
+
+    def search(self, tokens: Tuple[str, ...], limit: int) -> List[Dict[str, Any]]:
+        """Entries ranked by how much of the query they cover (idf-weighted) and how tightly"""
+        query = []
+        for token in tokens:
+            matches = self._resolve(token)
+            if matches:
+                exact = max(matches, key=lambda match: match[1])[0]
+                query.append((self._idf(self._token(exact)[2]), matches))
+            else:
+                query.append((self.max_idf, []))
+        total = sum(idf for idf, _ in query)
+        if not total:
+            return []
+
+        # Rarest tokens first; a token with a long posting list then only
+        # rescores the documents found so far plus its shortest documents
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = defaultdict(int)
+        for idf, matches in sorted(query, key=lambda item: -item[0]):
+            best: Dict[int, float] = {}
+            for token_index, weight in matches:
+                _, first, count = self._token(token_index)
+                documents = list(self.postings[first:first + min(count, CANDIDATE_POSTINGS)])
+                if count > CANDIDATE_POSTINGS:
+                    documents.extend(document for document in scores if self._has_token(document, token_index))
+                for document in documents:
+                    if weight > best.get(document, 0.0):
+                        best[document] = weight
+            for document, weight in best.items():
+                scores[document] = scores.get(document, 0.0) + idf * weight
+                matched[document] += 1
+
+        ranked: Dict[int, float] = {}
+        for document in heapq.nlargest(SCORED_DOCUMENTS, scores, key=scores.get):
+            entry, token_count, _ = DOCUMENT.unpack_from(self.buffer, self.documents_at + document * DOCUMENT.size)
+            score = scores[document] / total * (0.8 + 0.2 * min(1.0, matched[document] / max(token_count, 1)))
+            ranked[entry] = max(ranked.get(entry, 0.0), score)
+        results = []
+        for entry, score in sorted(ranked.items(), key=lambda item: (-item[1], item[0]))[:limit]:
+            code, description = self.entry(entry)
+            results.append({"code": code, "description": description, "score": round(score, 3)})
+        return results
+
+    def _resolve(self, token: str) -> List[Tuple[int, float]]:
+        """Vocabulary tokens standing for a query token, with match weights"""
+        index = self._lower_bound(token)
+        if index < self.token_count and self._token_text(index) == token:
+            return [(index, 1.0)]
+        matches = []
+        if len(token) >= 4:
+            # Truncated words: "pneumon" -> "pneumonia"
+            while index < self.token_count and len(matches) < 8 and self._token_text(index).startswith(token):
+                matches.append((index, 0.8))
+                index += 1
+            limit = 1 if len(token) <= 6 else 2
+            for candidate in self._fuzzy_candidates(token):
+                distance = edit_distance(token, self._token_text(candidate), limit)
+                if distance <= limit:
+                    matches.append((candidate, 0.9 - 0.1 * distance))
+        return matches
+
+    def _fuzzy_candidates(self, token: str) -> set:
+        """Tokens sharing the first or last half of token: one typo leaves one half intact"""
+        half = (len(token) + 1) // 2
+        candidates = set()
+        head = token[:half]
+        index = self._lower_bound(head)
+        while index < self.token_count and len(candidates) < 64 and self._token_text(index).startswith(head):
+            candidates.add(index)
+            index += 1
+        tail = token[-half:][::-1]
+        lo, hi = 0, self.token_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._token_text(self.reversed_order[mid])[::-1] < tail:
+                lo = mid + 1
+            else:
+                hi = mid
+        seen = 0
+        while lo < self.token_count and seen < 64 and self._token_text(self.reversed_order[lo])[::-1].startswith(tail):
+            candidates.add(self.reversed_order[lo])
+            lo += 1
+            seen += 1
+        return candidates
+
+    def _lower_bound(self, token: str) -> int:
+        lo, hi = 0, self.token_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._token_text(mid) < token:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _token(self, index: int) -> Tuple[str, int, int]:
+        offset, length, first, count = TOKEN.unpack_from(self.buffer, self.tokens_at + index * TOKEN.size)
+        return self._string(offset, length), first, count
+
+    def _token_text(self, index: int) -> str:
+        offset, length, _, _ = TOKEN.unpack_from(self.buffer, self.tokens_at + index * TOKEN.size)
+        return self._string(offset, length)
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self.blob_at + offset
+        return self.buffer[start:start + length].decode("utf-8")
+
+    def _idf(self, count: int) -> float:
+        return log(1 + self.document_count / max(count, 1))
+
+    def _has_token(self, document: int, token_index: int) -> bool:
+        _, token_count, first = DOCUMENT.unpack_from(self.buffer, self.documents_at + document * DOCUMENT.size)
+        tokens = self.document_tokens[first:first + token_count]
+        index = bisect_left(tokens, token_index)
+        return index < len(tokens) and tokens[index] == token_index
+
+def open_code_index(source_path: str, index_path: str) -> Optional[CodeIndex]:
+    """Map the index of a code table, (re)building it when missing or older than the table"""
+    if not source_path or not os.path.exists(source_path):
+        logger.warning("Code table %s not found; its codes will not be filled", source_path)
+        return None
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(source_path):
+        build_code_index(load_code_table(source_path), index_path)
+    try:
+        return CodeIndex(index_path)
+    except ValueError:
+        # Written by an older version of this module
+        build_code_index(load_code_table(source_path), index_path)
+        return CodeIndex(index_path)
+
+class ClinicalCoder:
+    """Fills Diagnosis.icd10_code and Procedure.cpt_code from local code tables.
+
+    Each diagnosis/procedure name is normalized (synonyms and abbreviations
+    expanded, stopwords dropped, stemmed) and searched in the ICD-10-CM or
+    CPT index; the ranked matches above clinical_coding_min_score are kept
+    as candidates and the best one becomes the code. Lookups are cached per
+    normalized name and timed against a one millisecond budget.
+    """
+
+    BUDGET_SECONDS = 0.001
+
+    def __init__(self):
+        self.enabled = settings.clinical_coding_enabled
+        self.indexes: Dict[str, Optional[CodeIndex]] = {}
+        self.synonyms: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._search = lru_cache(maxsize=settings.clinical_coding_cache_size)(self._search_uncached)
+        self.lookups = 0
+        self.coded = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.over_budget = 0
+
+    def load(self):
+        """Open (building if needed) the code indexes; called at startup or on first use"""
+        with self._lock:
+            if self.loaded or not self.enabled:
+                return
+            self.synonyms = load_synonyms(settings.clinical_synonyms_path)
+            for kind, source_path in (("icd10", settings.icd10_codes_path), ("cpt", settings.cpt_codes_path)):
+                try:
+                    self.indexes[kind] = open_code_index(source_path, os.path.join(settings.code_index_dir, f"{kind}.idx"))
+                except Exception as e:
+                    logger.warning("Could not load the %s code index: %s", kind, e)
+                    self.indexes[kind] = None
+            self.loaded = True
+
+    def annotate(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill codes and candidates of the analysis' diagnoses and procedures in place"""
+        for diagnosis in analysis.get("diagnoses", []):
+            self.code_diagnosis(diagnosis)
+        for procedure in analysis.get("procedures", []):
+            self.code_procedure(procedure)
+        return analysis
+
+    def code_diagnosis(self, diagnosis: Dict[str, Any]) -> Dict[str, Any]:
+        return self._code_item(diagnosis, "icd10", "icd10_code", "icd10_candidates")
+
+    def code_procedure(self, procedure: Dict[str, Any]) -> Dict[str, Any]:
+        return self._code_item(procedure, "cpt", "cpt_code", "cpt_candidates")
+
+    def _code_item(self, item: Dict[str, Any], kind: str, code_field: str, candidates_field: str) -> Dict[str, Any]:
+        if not self.enabled:
+            return item
+        if not self.loaded:
+            self.load()
+        if self.indexes.get(kind) is None or not item.get("name"):
+            return item
+        started = time.perf_counter()
+        candidates = self._search(kind, self.normalize(item["name"]))
+        elapsed = time.perf_counter() - started
+        self.lookups += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        if elapsed > self.BUDGET_SECONDS:
+            self.over_budget += 1
+        item[candidates_field] = [dict(candidate) for candidate in candidates]
+        if candidates and not item.get(code_field):
+            item[code_field] = candidates[0]["code"]
+            self.coded += 1
+        return item
+
+    def normalize(self, name: str) -> Tuple[str, ...]:
+        """Query tokens of a name: longest synonym phrases replaced, then stopwords and stems"""
+        source = words(name)
+        expanded: List[str] = []
+        position = 0
+        while position < len(source):
+            for length in (3, 2, 1):
+                replacement = self.synonyms.get(tuple(source[position:position + length]))
+                if replacement is not None and position + length <= len(source):
+                    expanded.extend(replacement)
+                    position += length
+                    break
+            else:
+                expanded.append(source[position])
+                position += 1
+        return tuple(dict.fromkeys(index_tokens(expanded)))
+
+    def _search_uncached(self, kind: str, tokens: Tuple[str, ...]) -> Tuple[Dict[str, Any], ...]:
+        if not tokens:
+            return ()
+        results = self.indexes[kind].search(tokens, settings.clinical_coding_candidates)
+        return tuple(result for result in results if result["score"] >= settings.clinical_coding_min_score)
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self._search.cache_info()
+        return {
+            "enabled": self.enabled,
+            "indexes": {kind: index.entry_count if index else None for kind, index in self.indexes.items()},
+            "lookups": self.lookups,
+            "coded": self.coded,
+            "mean_lookup_ms": round(1000 * self.total_seconds / self.lookups, 3) if self.lookups else 0.0,
+            "max_lookup_ms": round(1000 * self.max_seconds, 3),
+            "over_budget": self.over_budget,
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses
+        }
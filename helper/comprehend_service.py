@@ -1,8 +1,135 @@
+import asyncio
 import boto3
+import copy
+import hashlib
 import json
-from typing import Dict, Any, List
+import threading
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from config import settings
-from model.clinical_model import MedicalEntity, Diagnosis, Medication, Procedure
+from helper.aws_executor import aws_executor
+from helper.resilience import CircuitOpenError
+from helper.analysis_cache import AnalysisCache
+from helper.single_flight import SingleFlight
+from helper.analysis_chunking import split_text, merge_analyses
+from helper.model_router import MODEL_NAMES, ModelRouter
+from helper.code_index import ClinicalCoder
+from helper.medication_normalizer import MedicationNormalizer
+from helper.fast_extractor import FastExtractor
+from helper.phi_scanner import PHIScanner
+from helper.json_stream import JsonStreamScanner, parse_partial_json
+from helper.analysis_expansion import EntityLocator, align_entities, compact_entity, entity_item, expand_analysis, expand_entity
+from model.clinical_model import CompactAnalysis
+from pydantic import ValidationError
+
+def compact_prompt(prompt: str) -> str:
+    """Strip indentation and blank lines so no input tokens are spent on layout"""
+    return "\n".join(line.strip() for line in prompt.strip().splitlines() if line.strip())
+
+# Static prefix (tools + system), identical for every request and cached by Bedrock
+SYSTEM_PROMPT = compact_prompt("""
+            You are a medical AI assistant specialized in analyzing clinical transcriptions.
+            Extract structured medical information and record it with the record_clinical_analysis tool.
+            
+            Extract:
+            - Medical conditions/diagnoses mentioned
+            - Medications (drug name only; dosage and frequency are read from the transcript)
+            - Medical procedures performed or planned
+            - Symptoms described by patient
+            - Generate a concise clinical summary
+            - Provide confidence scores (0.0-1.0) for each item
+            
+            List each entity once in e and refer to diagnoses by their index in e.
+            """)
+
+# Variable suffix: the user message is just the transcript between these
+TRANSCRIPT_PREFIX = 'Analyze this medical transcription:\n"'
+TRANSCRIPT_SUFFIX = '"'
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+# Model families that accept Converse cachePoint blocks
+PROMPT_CACHE_MODEL_MARKERS = ("amazon.nova-", "anthropic.claude-3-7", "anthropic.claude-sonnet-4", "anthropic.claude-opus-4")
+
+def supports_prompt_caching(model_id: str) -> bool:
+    return any(marker in model_id for marker in PROMPT_CACHE_MODEL_MARKERS)
+
+# Converse API inference parameters
+INFERENCE_CONFIG = {
+    "maxTokens": 2000,
+    "temperature": 0.1,
+    "topP": 0.9
+}
+
+# Reduce step of the chunked analysis: one summary from the per-chunk summaries
+SUMMARY_PROMPT_TEMPLATE = compact_prompt("""
+            These are clinical summaries of consecutive parts of one medical transcription:
+            
+            {summaries}
+            
+            Write one concise clinical summary of the whole encounter.
+            Return only the summary text.
+            """)
+
+SUMMARY_INFERENCE_CONFIG = {
+    "maxTokens": 600,
+    "temperature": 0.1,
+    "topP": 0.9
+}
+
+def tool_input_schema(model) -> Dict[str, Any]:
+    """JSON schema of a pydantic model in the plain form tool input schemas expect.
+
+    $defs references are inlined, Optional[X] becomes X (optional fields are
+    simply not required) and titles/defaults are dropped to save tokens.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def simplify(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            node = definitions[node["$ref"].split("/")[-1]]
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            if len(options) == 1:
+                node = {**{key: value for key, value in node.items() if key != "anyOf"}, **options[0]}
+        simplified = {}
+        for key, value in node.items():
+            if key in ("title", "default"):
+                continue
+            if key == "properties":
+                simplified[key] = {name: simplify(field) for name, field in value.items()}
+            elif key == "items":
+                simplified[key] = simplify(value)
+            else:
+                simplified[key] = value
+        return simplified
+
+    return simplify(schema)
+
+ANALYSIS_TOOL_NAME = "record_clinical_analysis"
+
+# Forcing this tool makes Bedrock return the analysis as a parsed JSON object
+TOOL_CONFIG = {
+    "tools": [
+        {
+            "toolSpec": {
+                "name": ANALYSIS_TOOL_NAME,
+                "description": "Record the structured clinical analysis of a medical transcription",
+                "inputSchema": {"json": tool_input_schema(CompactAnalysis)}
+            }
+        }
+    ],
+    "toolChoice": {"tool": {"name": ANALYSIS_TOOL_NAME}}
+}
+
+# Event names used when streaming completed list items
+ITEM_EVENTS = {"medications": "medication", "procedures": "procedure"}
+
+# Changes whenever the prompt does, so cached analyses of an older prompt are never reused
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + TRANSCRIPT_PREFIX + TRANSCRIPT_SUFFIX + SUMMARY_PROMPT_TEMPLATE + json.dumps(TOOL_CONFIG, sort_keys=True)).encode()
+).hexdigest()[:12]
 
 class ComprehendService:
     def __init__(self):
@@ -11,176 +138,457 @@ class ComprehendService:
             'bedrock-runtime',
             aws_access_key_id=settings.aws_access_key_id,
             aws_secret_access_key=settings.aws_secret_access_key,
-            region_name=settings.aws_default_region
+            region_name=settings.aws_default_region,
+            config=aws_executor.client_config('bedrock')
         )
-        # Using Amazon Nova Pro for medical analysis
-        self.model_id = "amazon.nova-pro-v1:0"
+        # Amazon Nova models for medical analysis, picked per request by the router
+        self.router = ModelRouter()
+        self.coder = ClinicalCoder()
+        self.medication_normalizer = MedicationNormalizer()
+        self.fast_extractor = FastExtractor()
+        self.phi_scanner = PHIScanner()
+        self.analysis_cache = AnalysisCache()
+        self.inflight = SingleFlight("analysis")
+        self.prompt_caching = settings.bedrock_prompt_cache_enabled
+        self.usage = {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+            "cache_hits": 0
+        }
     
     async def analyze_medical_text(self, text: str) -> Dict[str, Any]:
-        """Analyze medical text using Amazon Nova Pro"""
-        try:
-            system_prompt = """You are a medical AI assistant specialized in analyzing clinical transcriptions. 
-            Extract structured medical information and return it as valid JSON only."""
-            
-            user_prompt = f"""
-            Analyze this medical transcription and extract structured information:
-            
-            "{text}"
-            
-            Return ONLY valid JSON with this exact structure:
-            {{
-                "entities": [
-                    {{"text": "entity_text", "category": "MEDICAL_CONDITION|MEDICATION|PROCEDURE|SYMPTOM", "type": "specific_type", "confidence": 0.95, "begin_offset": 0, "end_offset": 10}}
-                ],
-                "diagnoses": [
-                    {{"name": "diagnosis_name", "confidence": 0.90}}
-                ],
-                "medications": [
-                    {{"name": "medication_name", "dosage": "dosage_info", "frequency": "frequency", "confidence": 0.85}}
-                ],
-                "procedures": [
-                    {{"name": "procedure_name", "confidence": 0.88}}
-                ],
-                "summary": "Clinical summary text",
-                "confidence": 0.87
-            }}
-            
-            Extract:
-            - Medical conditions/diagnoses mentioned
-            - Medications with dosage and frequency if available
-            - Medical procedures performed or planned
-            - Symptoms described by patient
-            - Generate a concise clinical summary
-            - Provide confidence scores (0.0-1.0) for each item
-            """
-
-            # Nova Pro request format
-            body = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "text": user_prompt
-                            }
-                        ]
-                    }
-                ],
-                "system": [
-                    {
-                        "text": system_prompt
-                    }
-                ],
-                "inferenceConfig": {
-                    "max_new_tokens": 2000,
-                    "temperature": 0.1,
-                    "top_p": 0.9
+        """Analyze medical text on the Nova model the router picks (escalating to a larger tier if needed)"""
+        redaction = self.phi_scanner.redact(text)
+        fast = self._fast_path(text)
+        if fast is not None and (self.fast_extractor.mode == "fast" or fast["structured"]):
+            self.fast_extractor.count("served")
+            return self.postprocess(fast["analysis"], text, bool(redaction.spans))
+        # Only the redacted transcript is sent (and cached); PHI is put back locally
+        analysis, ok = await self._analyze_cached(redaction.text)
+        analysis = redaction.rehydrate_analysis(analysis)
+        if fast is not None:
+            analysis = self._with_fast_path(analysis, ok, fast["analysis"])
+        return self.postprocess(analysis, text, bool(redaction.spans))
+
+    def _fast_path(self, text: str) -> Optional[Dict[str, Any]]:
+        """Deterministic extraction, or None in "llm" mode"""
+        if not self.fast_extractor.enabled:
+            return None
+        return self.fast_extractor.extract(text)
+
+    def _with_fast_path(self, analysis: Dict[str, Any], ok: bool, fast: Dict[str, Any]) -> Dict[str, Any]:
+        """Model analysis with the fast-path findings merged in; the fast-path one if the model failed"""
+        if not ok and fast["entities"]:
+            self.fast_extractor.count("fallback")
+            return fast
+        self.fast_extractor.count("merged")
+        return self.fast_extractor.merge(analysis, fast)
+
+    def postprocess(self, analysis: Dict[str, Any], text: str, phi_detected: Optional[bool] = None) -> Dict[str, Any]:
+        """Offset alignment, local coding and medication normalization, applied in place.
+
+        Runs on every response rather than before caching, so cached
+        analyses pick up code table and drug dictionary updates.
+        """
+        if phi_detected is None:
+            phi_detected = self.phi_scanner.enabled and bool(self.phi_scanner.scan(text))
+        analysis["phi_detected"] = phi_detected
+        align_entities(analysis, text)
+        self.coder.annotate(analysis)
+        self.medication_normalizer.annotate(analysis, text)
+        return analysis
+
+    async def _analyze_cached(self, text: str) -> Tuple[Dict[str, Any], bool]:
+        """Cached, coalesced analysis; the flag says whether it is a real (cacheable) result"""
+        chunked = settings.analysis_chunking_enabled and len(text) > max(
+            settings.analysis_chunking_min_chars, settings.analysis_chunk_max_chars
+        )
+        inference_config = INFERENCE_CONFIG
+        if chunked:
+            inference_config = {**INFERENCE_CONFIG, "chunk_max_chars": settings.analysis_chunk_max_chars}
+        cache_key = AnalysisCache.make_key(text, self.router.cache_id(), inference_config, PROMPT_VERSION)
+        cached = await self.analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+
+        # Identical text already being analyzed shares that Bedrock call
+        if chunked:
+            (analysis, ok), _ = await self.inflight.do(cache_key, lambda: self._analyze_chunked(text, cache_key))
+        else:
+            (analysis, ok), _ = await self.inflight.do(cache_key, lambda: self._analyze(text, cache_key))
+        return copy.deepcopy(analysis), ok
+
+    async def _analyze_chunked(self, text: str, cache_key: str) -> Tuple[Dict[str, Any], bool]:
+        """Map-reduce analysis of a long transcript.
+
+        The text is split on sentence/line boundaries, the chunks are analyzed
+        concurrently (each one cached and coalesced on its own), the results
+        merged with offsets rebased onto the full text, and the summary written
+        from the chunk summaries.
+        """
+        chunks = split_text(text, settings.analysis_chunk_max_chars)
+        slots = asyncio.Semaphore(settings.analysis_chunk_concurrency)
+
+        async def analyze_chunk(chunk_text: str) -> Tuple[Dict[str, Any], bool]:
+            async with slots:
+                return await self._analyze_cached(chunk_text)
+
+        results = await asyncio.gather(*[analyze_chunk(chunk_text) for _, chunk_text in chunks])
+        analyses = [analysis for analysis, _ in results]
+        merged = merge_analyses(chunks, analyses)
+        summary, summary_ok = await self._summarize([analysis["summary"] for analysis in analyses])
+        result = {
+            "entities": merged["entities"],
+            "diagnoses": merged["diagnoses"],
+            "medications": merged["medications"],
+            "procedures": merged["procedures"],
+            "summary": summary,
+            "confidence": merged["confidence"],
+            "phi_detected": merged["phi_detected"]
+        }
+        ok = summary_ok and all(chunk_ok for _, chunk_ok in results)
+        if ok:
+            await self.analysis_cache.set(cache_key, result)
+        return result, ok
+
+    async def _summarize(self, summaries: List[str]) -> Tuple[str, bool]:
+        """Reduce chunk summaries to one; falls back to joining them"""
+        parts = "\n\n".join(f"Part {index + 1}: {summary}" for index, summary in enumerate(summaries))
+        request = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "text": SUMMARY_PROMPT_TEMPLATE.format(summaries=parts)
+                        }
+                    ]
                 }
-            }
+            ],
+            "inferenceConfig": SUMMARY_INFERENCE_CONFIG
+        }
+        try:
+            response = await self._call_converse(request, self.router.choose(parts)["model"])
+            return response['output']['message']['content'][0]['text'].strip(), True
+        except Exception:
+            return " ".join(summaries), False
 
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(body)
-            )
+    async def _analyze(self, text: str, cache_key: str) -> Tuple[Dict[str, Any], bool]:
+        """Analyze on the routed model, escalating weak or failed results to larger ones"""
+        decision = self.router.choose(text)
+        started = time.perf_counter()
+        while True:
+            result, ok = await self._analyze_with(text, decision["model"])
+            if not self.router.escalate(decision, result["confidence"], ok, time.perf_counter() - started):
+                break
+        if ok:
+            # Only usable analyses are cached; fallbacks are retried next time
+            await self.analysis_cache.set(cache_key, result)
+        return result, ok
 
-            response_body = json.loads(response['body'].read())
-            content = response_body['output']['message']['content'][0]['text']
+    async def _analyze_with(self, text: str, model_id: str) -> Tuple[Dict[str, Any], bool]:
+        try:
+            response = await self._call_converse(self._request(text, model_id), model_id)
+            output = self._tool_output(response)
             
             try:
-                # Parse Nova Pro's JSON response
-                analysis_data = json.loads(content)
-                
-                # Convert to our model format
-                medical_entities = []
-                diagnoses = []
-                medications = []
-                procedures = []
-                
-                # Process entities
-                for entity_data in analysis_data.get("entities", []):
-                    entity = MedicalEntity(
-                        text=entity_data.get("text", ""),
-                        category=entity_data.get("category", "UNKNOWN"),
-                        type=entity_data.get("type", "UNKNOWN"),
-                        confidence=entity_data.get("confidence", 0.0),
-                        begin_offset=entity_data.get("begin_offset", 0),
-                        end_offset=entity_data.get("end_offset", 0)
-                    )
-                    medical_entities.append(entity)
+                return self._parse_analysis(output, text), True
                 
-                # Process diagnoses
-                for diag_data in analysis_data.get("diagnoses", []):
-                    diagnosis = Diagnosis(
-                        name=diag_data.get("name", ""),
-                        confidence=diag_data.get("confidence", 0.0)
-                    )
-                    diagnoses.append(diagnosis)
-                
-                # Process medications
-                for med_data in analysis_data.get("medications", []):
-                    medication = Medication(
-                        name=med_data.get("name", ""),
-                        dosage=med_data.get("dosage"),
-                        frequency=med_data.get("frequency"),
-                        confidence=med_data.get("confidence", 0.0)
-                    )
-                    medications.append(medication)
-                
-                # Process procedures
-                for proc_data in analysis_data.get("procedures", []):
-                    procedure = Procedure(
-                        name=proc_data.get("name", ""),
-                        confidence=proc_data.get("confidence", 0.0)
-                    )
-                    procedures.append(procedure)
-                
-                return {
-                    "entities": [entity.dict() for entity in medical_entities],
-                    "diagnoses": [diagnosis.dict() for diagnosis in diagnoses],
-                    "medications": [medication.dict() for medication in medications],
-                    "procedures": [procedure.dict() for procedure in procedures],
-                    "summary": analysis_data.get("summary", "No summary available"),
-                    "confidence": analysis_data.get("confidence", 0.0),
-                    "phi_detected": False  # Bedrock doesn't detect PHI directly
-                }
-                
-            except json.JSONDecodeError:
-                # Fallback if Nova Pro doesn't return valid JSON
-                return {
-                    "entities": [],
-                    "diagnoses": [],
-                    "medications": [],
-                    "procedures": [],
-                    "summary": content,  # Use raw response as summary
-                    "confidence": 0.5,
-                    "phi_detected": False
-                }
+            except ValueError:
+                # Fallback if Nova Pro returns nothing we can recover structure from
+                return self._raw_text_result(output if isinstance(output, str) else json.dumps(output)), False
         
         except Exception as e:
-            error_msg = str(e)
-            # Handle specific Nova Pro errors
-            if "ValidationException" in error_msg:
-                error_msg = "Nova Pro model validation error - check model availability in your region"
-            elif "AccessDeniedException" in error_msg:
-                error_msg = "Nova Pro access denied - check IAM permissions for bedrock:InvokeModel"
-            elif "ThrottlingException" in error_msg:
-                error_msg = "Nova Pro rate limit exceeded - please retry"
-            
-            return {
-                "entities": [],
-                "diagnoses": [],
-                "medications": [],
-                "procedures": [],
-                "summary": f"Nova Pro analysis unavailable: {error_msg}",
-                "confidence": 0.0,
-                "phi_detected": False
+            return self._error_result(e), False
+
+    async def stream_medical_analysis(self, text: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream an analysis as Nova Pro generates it.
+
+        Yields ("summary_delta", text) for each piece of the summary,
+        ("entity" | "diagnosis" | "medication" | "procedure", item) as soon as
+        each element is complete, and finally ("analysis", result) with the
+        same dict analyze_medical_text returns. Cached analyses and notes
+        answered by the fast path are replayed as a single "analysis" event.
+        The model only sees the redacted transcript; every event is
+        rehydrated before it is yielded.
+        """
+        redaction = self.phi_scanner.redact(text)
+        fast = self._fast_path(text)
+        if fast is not None and (self.fast_extractor.mode == "fast" or fast["structured"]):
+            self.fast_extractor.count("served")
+            yield "analysis", self.postprocess(fast["analysis"], text, bool(redaction.spans))
+            return
+
+        def finish(result: Dict[str, Any], ok: bool) -> Dict[str, Any]:
+            result = redaction.rehydrate_analysis(result)
+            if fast is not None:
+                result = self._with_fast_path(result, ok, fast["analysis"])
+            return self.postprocess(result, text, bool(redaction.spans))
+
+        cache_key = AnalysisCache.make_key(redaction.text, self.router.cache_id(), INFERENCE_CONFIG, PROMPT_VERSION)
+        cached = await self.analysis_cache.get(cache_key)
+        if cached is not None:
+            yield "analysis", finish(copy.deepcopy(cached), True)
+            return
+
+        scanner = JsonStreamScanner(string_keys=["s"], array_keys=["e"])
+        locator = EntityLocator(redaction.text)
+        rehydrate_summary, flush_summary = redaction.stream_rehydrator()
+        model_id = self.router.choose(redaction.text)["model"]
+        content_parts = []
+        try:
+            async for delta in self._stream_model(self._request(redaction.text, model_id), model_id):
+                content_parts.append(delta)
+                for kind, _, value in scanner.feed(delta):
+                    if kind == "delta":
+                        value = rehydrate_summary(value)
+                        if value:
+                            yield "summary_delta", value
+                        continue
+                    entity = compact_entity(value)
+                    if entity is None:
+                        continue
+                    expanded = redaction.rehydrate_entity(expand_entity(entity, locator))
+                    yield "entity", expanded
+                    item = entity_item(entity)
+                    if item is not None:
+                        list_name, value = item
+                        value["name"] = redaction.rehydrate(value["name"])
+                        if list_name == "procedures":
+                            value = self.coder.code_procedure(value)
+                        else:
+                            mention = expanded if expanded["end_offset"] > expanded["begin_offset"] else None
+                            value = self.medication_normalizer.normalize(value, text, mention)
+                        yield ITEM_EVENTS[list_name], value
+        except Exception as e:
+            yield "analysis", finish(self._error_result(e), False)
+            return
+
+        rest = flush_summary()
+        if rest:
+            yield "summary_delta", rest
+        content = "".join(content_parts)
+        try:
+            result = self._parse_analysis(content, redaction.text)
+        except ValueError:
+            yield "analysis", finish(self._raw_text_result(content), False)
+            return
+        # Streamed output cannot be re-run on a larger tier; keep a weak result out of the
+        # cache so /analyze escalates it instead of serving it
+        if self.router.is_final(model_id, result["confidence"]):
+            await self.analysis_cache.set(cache_key, result)
+        result = finish(copy.deepcopy(result), True)
+        # Diagnoses are references into the entity list, known only at the end
+        for diagnosis in result["diagnoses"]:
+            yield "diagnosis", diagnosis
+        yield "analysis", result
+
+    def _request(self, text: str, model_id: str) -> Dict[str, Any]:
+        """Converse request asking for the analysis as a record_clinical_analysis tool call.
+
+        Tools and system prompt form a static prefix; with prompt caching a
+        cache point after the system prompt lets Bedrock reuse it, so only the
+        transcript is processed as new input.
+        """
+        system = [{"text": SYSTEM_PROMPT}]
+        if self.prompt_caching and supports_prompt_caching(model_id):
+            system.append(CACHE_POINT)
+        return {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "text": TRANSCRIPT_PREFIX + text + TRANSCRIPT_SUFFIX
+                        }
+                    ]
+                }
+            ],
+            "system": system,
+            "inferenceConfig": INFERENCE_CONFIG,
+            "toolConfig": TOOL_CONFIG
+        }
+
+    def _tool_output(self, response: Dict[str, Any]) -> Any:
+        """The tool call's input object, or the text the model wrote instead"""
+        content = response['output']['message']['content']
+        for block in content:
+            if "toolUse" in block:
+                return block["toolUse"].get("input", {})
+        return "".join(block.get("text", "") for block in content)
+
+    def _parse_analysis(self, output: Any, text: str) -> Dict[str, Any]:
+        """Convert the compact model output (tool input object or JSON text) to our format.
+
+        Well-formed output is validated in a single pydantic pass. Otherwise
+        the JSON is recovered with parse_partial_json (fenced or truncated
+        text) and rebuilt entity by entity, skipping entities that do not
+        validate. The compact form is then expanded with offsets located in
+        `text`. Raises ValueError when no analysis object can be recovered.
+        """
+        try:
+            if isinstance(output, str):
+                compact = CompactAnalysis.model_validate_json(output).model_dump()
+            else:
+                compact = CompactAnalysis.model_validate(output).model_dump()
+        except ValidationError:
+            data = parse_partial_json(output) if isinstance(output, str) else output
+            if not isinstance(data, dict):
+                raise ValueError("Model output is not an analysis object")
+            raw_entities = data.get("e") if isinstance(data.get("e"), list) else []
+            raw_references = data.get("dx") if isinstance(data.get("dx"), list) else []
+            entities = [compact_entity(entity) for entity in raw_entities]
+            summary, confidence = data.get("s"), data.get("p")
+            compact = {
+                "e": [entity for entity in entities if entity is not None],
+                "dx": [index for index in raw_references if isinstance(index, int)],
+                "s": summary if isinstance(summary, str) and summary else "No summary available",
+                "p": confidence if isinstance(confidence, (int, float)) else 0.0
             }
+        analysis_data = expand_analysis(compact, text)
+        return {
+            "entities": analysis_data["entities"],
+            "diagnoses": analysis_data["diagnoses"],
+            "medications": analysis_data["medications"],
+            "procedures": analysis_data["procedures"],
+            "summary": analysis_data["summary"],
+            "confidence": analysis_data["confidence"],
+            "phi_detected": False  # Bedrock doesn't detect PHI directly
+        }
+
+    def _raw_text_result(self, content: str) -> Dict[str, Any]:
+        return {
+            "entities": [],
+            "diagnoses": [],
+            "medications": [],
+            "procedures": [],
+            "summary": content,  # Use raw response as summary
+            "confidence": 0.5,
+            "phi_detected": False
+        }
+
+    def _error_result(self, e: Exception) -> Dict[str, Any]:
+        error_msg = str(e)
+        # Handle specific Nova Pro errors
+        if "ValidationException" in error_msg:
+            error_msg = "Nova Pro model validation error - check model availability in your region"
+        elif "AccessDeniedException" in error_msg:
+            error_msg = "Nova Pro access denied - check IAM permissions for bedrock:InvokeModel"
+        elif "ThrottlingException" in error_msg:
+            error_msg = "Nova Pro rate limit exceeded - please retry"
+        elif isinstance(e, CircuitOpenError):
+            error_msg = "Nova Pro temporarily unavailable after repeated failures - please retry shortly"
+        
+        return {
+            "entities": [],
+            "diagnoses": [],
+            "medications": [],
+            "procedures": [],
+            "summary": f"Nova Pro analysis unavailable: {error_msg}",
+            "confidence": 0.0,
+            "phi_detected": False
+        }
     
-    def get_model_info(self) -> Dict[str, str]:
-        """Get information about the current model"""
+    async def _call_converse(self, request: Dict[str, Any], model_id: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        response = await aws_executor.run("bedrock", self._converse, request, model_id)
+        self.router.record_latency(model_id, time.perf_counter() - started)
+        self._record_usage(response.get("usage"))
+        return response
+
+    def _converse(self, request: Dict[str, Any], model_id: str) -> Dict[str, Any]:
+        """Blocking Converse call, run on the AWS executor"""
+        return self.bedrock_client.converse(modelId=model_id, **request)
+
+    def _record_usage(self, usage: Dict[str, int] = None):
+        if not usage:
+            return
+        self.usage["requests"] += 1
+        self.usage["input_tokens"] += usage.get("inputTokens", 0)
+        self.usage["output_tokens"] += usage.get("outputTokens", 0)
+        self.usage["cache_read_tokens"] += usage.get("cacheReadInputTokens", 0)
+        self.usage["cache_write_tokens"] += usage.get("cacheWriteInputTokens", 0)
+        if usage.get("cacheReadInputTokens"):
+            self.usage["cache_hits"] += 1
+
+    def usage_stats(self) -> Dict[str, Any]:
+        """Token usage and prompt cache effectiveness since startup"""
+        prompt_tokens = self.usage["input_tokens"] + self.usage["cache_read_tokens"] + self.usage["cache_write_tokens"]
+        return {
+            **self.usage,
+            "prompt_caching": self.prompt_caching,
+            "request_hit_ratio": round(self.usage["cache_hits"] / self.usage["requests"], 4) if self.usage["requests"] else 0.0,
+            "token_hit_ratio": round(self.usage["cache_read_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+        }
+
+    async def _stream_model(self, request: Dict[str, Any], model_id: str) -> AsyncIterator[str]:
+        """Yield generated pieces (tool input JSON or text) from ConverseStream.
+
+        The blocking event stream is consumed on the AWS executor (holding a
+        bedrock slot for the whole generation) and handed to the event loop
+        through a queue.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def consume():
+            response = self.bedrock_client.converse_stream(modelId=model_id, **request)
+            stream = response['stream']
+            emitted = False
+            try:
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    if "metadata" in event:
+                        loop.call_soon_threadsafe(self._record_usage, event["metadata"].get("usage"))
+                        continue
+                    delta = event.get("contentBlockDelta", {}).get("delta", {})
+                    text = delta.get("toolUse", {}).get("input") or delta.get("text")
+                    if text:
+                        emitted = True
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                if not emitted:
+                    raise
+                # Text already went to the client, so this must not be retried
+                raise Exception(f"Nova Pro stream interrupted: {str(e)}")
+            finally:
+                stream.close()
+
+        def finished(done: asyncio.Future):
+            if not done.cancelled():
+                done.exception()  # retrieved here too in case nobody awaits it
+            queue.put_nowait(None)
+
+        started = time.perf_counter()
+        producer = asyncio.ensure_future(aws_executor.run("bedrock", consume))
+        producer.add_done_callback(finished)
+        try:
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                yield text
+            await producer
+            self.router.record_latency(model_id, time.perf_counter() - started)
+        finally:
+            # Client went away: let the worker thread stop at the next event
+            stop.set()
+
+    def get_model_info(self) -> Dict[str, Any]:
+        """Get information about the models analyses run on"""
+        models = self.router.active_models()
+        # The largest tier is the default model; the routed tiers are listed under "models"
+        default = self.router.models[-1]
         return {
-            "model_id": self.model_id,
-            "model_name": "Amazon Nova Pro",
+            "model_id": default,
+            "model_name": MODEL_NAMES.get(default, default),
+            "models": [{"model_id": model, "model_name": MODEL_NAMES.get(model, model)} for model in models],
             "provider": "Amazon",
-            "capabilities": "Medical text analysis, entity extraction, clinical summarization"
+            "capabilities": "Medical text analysis, entity extraction, clinical summarization",
+            "routing": self.router.stats()
         }
\ No newline at end of file
@@ -5,4 +5,9 @@ ALLOWED_AUDIO_TYPES = {
     "audio/flac",      # flac
     "audio/ogg",       # ogg
     "audio/x-aac",     # aac
-}
\ No newline at end of file
+}
+
+# S3 multipart limit
+S3_MAX_PARTS = 10000
+# Largest media file an Amazon Transcribe batch job accepts
+TRANSCRIBE_MAX_MEDIA_SIZE = 2 * 1024 ** 3  # 2 GB
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Dict, List
+from fastapi import WebSocket
+from amazon_transcribe.auth import StaticCredentialResolver
+from amazon_transcribe.client import TranscribeStreamingClient
+from amazon_transcribe.endpoints import StaticEndpointResolver
+from amazon_transcribe.model import TranscriptEvent
+from config import settings
+
+STREAMING_ENCODINGS = {"pcm", "ogg-opus", "flac"}
+
+class DictationService:
+    """Relays live audio from a WebSocket to Amazon Transcribe streaming.
+
+    The client sends binary audio frames (16-bit little-endian PCM, Ogg/Opus
+    or FLAC) and a text frame "end" when done. It receives JSON messages:
+    {"type": "partial" | "final", "text", "start_time", "end_time", "result_id"}
+    as Transcribe produces them, {"type": "analysis", "result_id", "analysis"}
+    for every finalized segment, and {"type": "complete", "transcription"}
+    after the stream ends.
+    """
+
+    def __init__(self, comprehend_service):
+        self.comprehend_service = comprehend_service
+        endpoint_resolver = None
+        if settings.transcribe_streaming_endpoint_url:
+            # Local stand-in streaming server
+            endpoint_resolver = StaticEndpointResolver(settings.transcribe_streaming_endpoint_url)
+        self.client = TranscribeStreamingClient(
+            region=settings.aws_default_region,
+            endpoint_resolver=endpoint_resolver,
+            credential_resolver=StaticCredentialResolver(
+                settings.aws_access_key_id,
+                settings.aws_secret_access_key
+            )
+        )
+        self.active_sessions = 0
+
+    async def run_session(self, websocket: WebSocket, media_encoding: str = "pcm", sample_rate: int = 16000):
+        """Serve one dictation session until the client ends it or disconnects"""
+        stream = await self.client.start_stream_transcription(
+            language_code="en-US",
+            media_sample_rate_hz=sample_rate,
+            media_encoding=media_encoding,
+            show_speaker_label=True,
+            enable_partial_results_stabilization=True,
+            partial_results_stability="high"
+        )
+        self.active_sessions += 1
+        finals: List[str] = []
+        analysis_slot = asyncio.Semaphore(1)  # analyze segments in order, one at a time
+        analysis_tasks = set()
+
+        async def send_audio():
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("bytes"):
+                        await stream.input_stream.send_audio_event(audio_chunk=message["bytes"])
+                    elif message.get("text") == "end":
+                        break
+            finally:
+                await stream.input_stream.end_stream()
+
+        async def analyze_segment(result_id: str, text: str):
+            async with analysis_slot:
+                analysis = await self.comprehend_service.analyze_medical_text(text)
+                await websocket.send_json({"type": "analysis", "result_id": result_id, "analysis": analysis})
+
+        async def receive_transcripts():
+            async for event in stream.output_stream:
+                if not isinstance(event, TranscriptEvent):
+                    continue
+                for result in event.transcript.results:
+                    if not result.alternatives:
+                        continue
+                    text = result.alternatives[0].transcript
+                    await websocket.send_json({
+                        "type": "partial" if result.is_partial else "final",
+                        "text": text,
+                        "start_time": result.start_time,
+                        "end_time": result.end_time,
+                        "result_id": result.result_id
+                    })
+                    if not result.is_partial and text.strip():
+                        finals.append(text)
+                        task = asyncio.create_task(analyze_segment(result.result_id, text))
+                        analysis_tasks.add(task)
+                        task.add_done_callback(analysis_tasks.discard)
+
+        sender = asyncio.create_task(send_audio())
+        receiver = asyncio.create_task(receive_transcripts())
+        try:
+            await asyncio.gather(sender, receiver)
+            await asyncio.gather(*analysis_tasks)
+            await websocket.send_json({"type": "complete", "transcription": " ".join(finals)})
+        except BaseException:
+            for task in (sender, receiver, *analysis_tasks):
+                task.cancel()
+            raise
+        finally:
+            self.active_sessions -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active_sessions": self.active_sessions}
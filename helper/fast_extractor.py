@@ -0,0 +1,355 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config import settings
+from helper.analysis_chunking import item_key, merge_named_items
+from helper.analysis_expansion import CATEGORY_CODES
+from helper.medication_normalizer import DOSE_RE, FREQUENCY_RE, PRN_RE, ROUTE_RE, MedicationNormalizer
+from model.clinical_model import Diagnosis, Medication, Procedure
+
+logger = logging.getLogger(__name__)
+
+MODES = ("llm", "hybrid", "fast")
+LEXICON_CONFIDENCE = 0.9
+VITAL_CONFIDENCE = 0.95
+
+# "BP 140/90", "blood pressure of 140/90 mmHg", "heart rate: 85 bpm", "temp 98.6 F", "sats 97% on room air"
+LINK = r"[\s:=]*(?:(?:of|is|was|at|measured\s+at)\s+)?"
+VITAL_PATTERNS = [
+    ("BLOOD_PRESSURE", rf"\b(?:blood\s+pressure|bp)\b{LINK}\d{{2,3}}\s*/\s*\d{{2,3}}(?:\s*mm\s*hg\b)?"),
+    ("HEART_RATE", rf"\b(?:heart\s+rate|pulse(?:\s+rate)?|hr)\b{LINK}\d{{2,3}}(?:\s*(?:bpm\b|beats\s+per\s+minute\b|/\s*min\b))?"),
+    ("HEART_RATE", r"\b\d{2,3}\s*(?:bpm|beats\s+per\s+minute)\b"),
+    ("RESPIRATORY_RATE", rf"\b(?:respiratory\s+rate|resp(?:iratory)?\s+rate|respirations|rr)\b{LINK}\d{{1,2}}(?:\s*(?:breaths\s+per\s+minute\b|/\s*min\b))?"),
+    ("TEMPERATURE", rf"\b(?:temperature|temp)\b{LINK}\d{{2,3}}(?:\.\d+)?(?:\s*(?:°\s*[fc]\b|degrees(?:\s+(?:fahrenheit|celsius|f|c)\b)?|[fc]\b))?"),
+    ("OXYGEN_SATURATION", rf"\b(?:oxygen\s+saturation|o2\s+sat(?:uration)?s?|spo2|sats?|pulse\s+ox)\b{LINK}\d{{2,3}}\s*(?:%|percent\b)(?:\s+on\s+room\s+air\b)?"),
+    ("WEIGHT", rf"\b(?:weight|weighs|wt)\b{LINK}\d{{2,3}}(?:\.\d+)?\s*(?:kg|kilograms|lbs?|pounds)\b"),
+    ("BLOOD_GLUCOSE", rf"\b(?:blood\s+(?:sugar|glucose)|glucose|fingerstick)\b{LINK}\d{{2,3}}(?:\s*mg\s*/\s*dl\b)?"),
+    ("BMI", rf"\bbmi\b{LINK}\d{{2}}(?:\.\d+)?"),
+]
+# One alternation over lowered text, so it is scanned once; group vN is VITAL_PATTERNS[N].
+# The lookahead (first characters of all the patterns) skips most positions cheaply.
+VITAL_RE = re.compile(
+    r"\b(?=[bfghoprstw\d])(?:" + "|".join(f"(?P<v{index}>{pattern})" for index, (_, pattern) in enumerate(VITAL_PATTERNS)) + ")"
+)
+
+# NegEx-style cue in the same clause before a mention: "denies chest pain", "no history of asthma"
+NEGATION_RE = re.compile(
+    r"\b(?:no|not|denies|denied|denying|without|negative\s+for|ruled\s+out|rules\s+out|free\s+of|absence\s+of|never\s+had)\b",
+    re.IGNORECASE
+)
+CLAUSE_BREAK_RE = re.compile(r"[.;:\n]|\bbut\b|\bhowever\b", re.IGNORECASE)
+NEGATION_WINDOW = 60
+
+WORD_RE = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+# Words that carry no clinical fact of their own when measuring how much of a note was understood
+FILLER_WORDS = set("""
+a an the and or but of with without on in at to for from by as per about after before since than then also
+is are was were be been being has have had do does did will would should can could may might
+he she they it his her their its them him this that these those there here who which
+patient pt patients mr mrs ms male female man woman year years yo old
+presents presented presenting reports reported reporting states stated complains complaining complaint
+notes noted feels feeling felt has having
+start started starting continue continued continuing prescribed prescribe ordered order ordering
+scheduled schedule referred refer recommend recommended plan planned take taking takes took given
+history hx today yesterday currently current recent recently new now last past
+day days week weeks month months hour hours
+mild moderate severe chronic acute intermittent occasional persistent worsening improving
+left right bilateral vital vitals signs sign exam examination assessment follow up
+denies denied no not negative ruled out free absence never
+""".split())
+
+def lowered(text: str) -> str:
+    """Lower-cased text with the same length as text, so offsets carry over"""
+    lower = text.lower()
+    if len(lower) == len(text):
+        return lower
+    return "".join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+class AhoCorasick:
+    """Aho-Corasick automaton over words: every dictionary term found in one pass over a token list.
+
+    Working on whole words keeps the walk to one step per word and only
+    ever matches on word boundaries ("echo" never fires inside "echocardiogram").
+    """
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Tuple[int, ...]] = [()]
+        self.terms: List[Tuple[int, Any]] = []  # (length in words, payload)
+
+    def add(self, words: List[str], payload: Any):
+        state = 0
+        for word in words:
+            following = self.goto[state].get(word)
+            if following is None:
+                following = len(self.goto)
+                self.goto[state][word] = following
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = following
+        self.output[state] += (len(self.terms),)
+        self.terms.append((len(words), payload))
+
+    def build(self):
+        """Compute failure links breadth-first; call once after the last add"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0) if state else 0
+                self.fail[following] = target
+                self.output[following] += self.output[target]
+
+    def iter(self, words: List[str]) -> Iterator[Tuple[int, int, Any]]:
+        """(first word, last word + 1, payload) of every occurrence, overlapping ones included"""
+        goto, fail, output, terms = self.goto, self.fail, self.output, self.terms
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for term in output[state]:
+                length, payload = terms[term]
+                yield position + 1 - length, position + 1, payload
+
+def load_lexicon(path: str) -> List[Tuple[str, str]]:
+    """(term, category code) rows of a term<TAB>C|M|P|S table"""
+    rows = []
+    with open(path, encoding="utf-8") as table:
+        for line in table:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 2 and fields[1].strip() in CATEGORY_CODES:
+                rows.append((fields[0].strip().lower(), fields[1].strip()))
+    return rows
+
+def load_drug_terms(path: str) -> List[Tuple[str, str]]:
+    """Every spelling in the drug dictionary table as a medication term"""
+    rows = []
+    with open(path, encoding="utf-8") as table:
+        for line in table:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2:
+                continue
+            for spelling in [fields[1]] + (fields[2].split("|") if len(fields) > 2 else []):
+                if spelling.strip():
+                    rows.append((spelling.strip().lower(), "M"))
+    return rows
+
+class FastExtractor:
+    """Deterministic extraction of vitals, medications and common entities.
+
+    Lexicon terms (medical_lexicon.tsv plus every drug dictionary spelling)
+    are found with one Aho-Corasick pass, vitals with compiled regexes;
+    overlaps keep the leftmost-longest match and negated mentions are left
+    out. Coverage is the share of informative words inside a match or a
+    dose/route/frequency; short notes covered well enough are "structured"
+    and can be answered without the model.
+    """
+
+    def __init__(self):
+        mode = settings.analysis_mode.lower()
+        if mode not in MODES:
+            logger.warning("Unknown analysis_mode %r; using llm", settings.analysis_mode)
+            mode = "llm"
+        self.mode = mode
+        self.automaton: Optional[AhoCorasick] = None
+        self.loaded = False
+        self._lock = threading.Lock()
+        self.extractions = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.outcomes = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "llm"
+
+    def load(self):
+        with self._lock:
+            if self.loaded or not self.enabled:
+                return
+            terms = []
+            for path, loader in ((settings.medical_lexicon_path, load_lexicon), (settings.drug_names_path, load_drug_terms)):
+                if path and os.path.exists(path):
+                    terms.extend(loader(path))
+                else:
+                    logger.warning("Lexicon %s not found; fast-path extraction will miss its terms", path)
+            automaton = AhoCorasick()
+            seen = set()
+            for term, code in terms:
+                words = WORD_RE.findall(term)
+                if words and term not in seen:
+                    seen.add(term)
+                    automaton.add(words, code)
+            automaton.build()
+            self.automaton = automaton
+            self.loaded = True
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """{"analysis": ..., "coverage": 0-1, "structured": bool} for text"""
+        if not self.loaded:
+            self.load()
+        started = time.perf_counter()
+        lower = lowered(text)
+        words = list(WORD_RE.finditer(lower))
+        spans = self._vital_spans(lower) + self._lexicon_spans(words)
+        spans.sort(key=lambda span: (span[0], span[0] - span[1]))
+
+        cues = [match.end() for match in NEGATION_RE.finditer(lower)]
+        breaks = [match.end() for match in CLAUSE_BREAK_RE.finditer(lower)] if cues else []
+        entities, negated, covered = [], [], []
+        last_end = 0
+        for start, end, category, kind in spans:
+            if start < last_end:
+                continue
+            last_end = end
+            covered.append((start, end))
+            if category != "VITAL_SIGN" and self._negated(start, cues, breaks):
+                negated.append(text[start:end])
+                continue
+            # MedicalEntity fields, built directly: validation would cost more than the match
+            entities.append({
+                "text": text[start:end],
+                "category": category,
+                "type": kind,
+                "confidence": VITAL_CONFIDENCE if category == "VITAL_SIGN" else LEXICON_CONFIDENCE,
+                "begin_offset": start,
+                "end_offset": end
+            })
+            if category == "MEDICATION":
+                # The dose, route and frequency after a medication are understood too
+                context = MedicationNormalizer.context(text, end)
+                for pattern in (DOSE_RE, ROUTE_RE, FREQUENCY_RE, PRN_RE):
+                    covered.extend((end + match.start(), end + match.end()) for match in pattern.finditer(context))
+
+        coverage = self._coverage(words, covered, len(lower))
+        analysis = self._analysis(text, entities, negated, coverage)
+        structured = bool(entities) and len(text) <= settings.fast_path_max_chars and coverage >= settings.fast_path_min_coverage
+
+        elapsed = time.perf_counter() - started
+        self.extractions += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        return {"analysis": analysis, "coverage": round(coverage, 3), "structured": structured}
+
+    def merge(self, analysis: Dict[str, Any], fast: Dict[str, Any]) -> Dict[str, Any]:
+        """Add fast-path entities, medications and procedures the model missed, in place.
+
+        Diagnoses stay the model's call; entities overlapping a located model
+        entity are dropped, and so are the medications and procedures they
+        stand for, or that a model item already names ("lisinopril" next to
+        "lisinopril 10 mg daily").
+        """
+        located = [
+            (entity["begin_offset"], entity["end_offset"]) for entity in analysis.get("entities", [])
+            if entity.get("end_offset", 0) > entity.get("begin_offset", 0)
+        ]
+        added = [
+            entity for entity in fast["entities"]
+            if not any(entity["begin_offset"] < end and begin < entity["end_offset"] for begin, end in located)
+        ]
+        if added:
+            analysis["entities"] = sorted(analysis.get("entities", []) + added, key=lambda entity: entity["begin_offset"])
+        for field, category in (("medications", "MEDICATION"), ("procedures", "PROCEDURE")):
+            kept = {item_key(entity["text"]) for entity in added if entity["category"] == category}
+            named = [item_key(item.get("name", "")) + " " for item in analysis.get(field, [])]
+            items = [
+                item for item in fast[field]
+                if item_key(item["name"]) in kept and not any(name.startswith(item_key(item["name"]) + " ") for name in named)
+            ]
+            analysis[field] = merge_named_items(analysis.get(field, []) + items)
+        return analysis
+
+    def count(self, outcome: str):
+        self.outcomes[outcome] += 1
+
+    def _vital_spans(self, lower: str) -> List[Tuple[int, int, str, str]]:
+        return [
+            (match.start(), match.end(), "VITAL_SIGN", VITAL_PATTERNS[int(match.lastgroup[1:])][0])
+            for match in VITAL_RE.finditer(lower)
+        ]
+
+    def _lexicon_spans(self, words: List[re.Match]) -> List[Tuple[int, int, str, str]]:
+        if self.automaton is None:
+            return []
+        return [
+            (words[first].start(), words[last - 1].end(), CATEGORY_CODES[code], CATEGORY_CODES[code])
+            for first, last, code in self.automaton.iter([word.group(0) for word in words])
+        ]
+
+    @staticmethod
+    def _negated(start: int, cues: List[int], breaks: List[int]) -> bool:
+        """Whether a negation cue ends within NEGATION_WINDOW before start, in the same clause"""
+        index = bisect.bisect_right(cues, start) - 1
+        if index < 0 or start - cues[index] > NEGATION_WINDOW:
+            return False
+        return bisect.bisect_right(breaks, start) == bisect.bisect_right(breaks, cues[index])
+
+    @staticmethod
+    def _coverage(words: List[re.Match], covered: List[Tuple[int, int]], length: int) -> float:
+        mask = bytearray(length)
+        for begin, end in covered:
+            mask[begin:end] = b"\x01" * (end - begin)
+        informative = covered_words = 0
+        for word in words:
+            if word.group(0) in FILLER_WORDS:
+                continue
+            informative += 1
+            covered_words += mask[word.start()]
+        return covered_words / informative if informative else 0.0
+
+    def _analysis(self, text: str, entities: List[Dict[str, Any]], negated: List[str], coverage: float) -> Dict[str, Any]:
+        """Analysis dict in the ComprehendService shape, with a templated summary"""
+        by_category: Dict[str, List[Dict[str, Any]]] = {}
+        for entity in entities:
+            by_category.setdefault(entity["category"], []).append(entity)
+        conditions = by_category.get("MEDICAL_CONDITION", [])
+        medications = by_category.get("MEDICATION", [])
+        procedures = by_category.get("PROCEDURE", [])
+
+        sections = [
+            ("Conditions", [entity["text"] for entity in conditions]),
+            ("Symptoms", [entity["text"] for entity in by_category.get("SYMPTOM", [])]),
+            ("Medications", [
+                " ".join(f"{entity['text']} {MedicationNormalizer.context(text, entity['end_offset'])}".split())
+                for entity in medications
+            ]),
+            ("Procedures", [entity["text"] for entity in procedures]),
+            ("Vitals", [entity["text"] for entity in by_category.get("VITAL_SIGN", [])]),
+            ("Negative for", negated),
+        ]
+        summary = " ".join(f"{title}: {', '.join(dict.fromkeys(items))}." for title, items in sections if items)
+        return {
+            "entities": entities,
+            "diagnoses": merge_named_items([Diagnosis(name=entity["text"], confidence=entity["confidence"]).model_dump() for entity in conditions]),
+            "medications": merge_named_items([Medication(name=entity["text"], confidence=entity["confidence"]).model_dump() for entity in medications]),
+            "procedures": merge_named_items([Procedure(name=entity["text"], confidence=entity["confidence"]).model_dump() for entity in procedures]),
+            "summary": summary or "No clinical findings were extracted.",
+            "confidence": round(min(coverage, LEXICON_CONFIDENCE), 2),
+            "phi_detected": False
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "lexicon_terms": len(self.automaton.terms) if self.automaton else None,
+            "extractions": self.extractions,
+            "mean_us": round(1e6 * self.total_seconds / self.extractions, 1) if self.extractions else 0.0,
+            "max_us": round(1e6 * self.max_seconds, 1),
+            "outcomes": dict(self.outcomes)
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import settings
+from model.clinical_model import ClinicalSummary, JobStage, JobStatus
+
+TRANSCRIBE_AND_ANALYZE_STAGES = ["upload", "transcribe", "analyze"]
+
+class JobService:
+    """In-process registry of long-running transcription/analysis jobs.
+
+    Jobs live in this worker's memory, so GET /jobs/{id} must reach the same
+    worker that accepted the job (the default single-worker deployment does).
+    """
+
+    def __init__(self, transcribe_service, comprehend_service):
+        self.transcribe_service = transcribe_service
+        self.comprehend_service = comprehend_service
+        self.jobs: Dict[str, JobStatus] = {}
+        self._tasks = set()
+
+    def create_job(self, patient_id: Optional[str] = None, stages: List[str] = TRANSCRIBE_AND_ANALYZE_STAGES) -> JobStatus:
+        """Register a new job with all stages pending"""
+        self._prune_finished_jobs()
+        now = datetime.now()
+        job = JobStatus(
+            job_id=uuid.uuid4().hex,
+            patient_id=patient_id,
+            created_at=now,
+            updated_at=now,
+            stages=[JobStage(name=name) for name in stages]
+        )
+        self.jobs[job.job_id] = job
+        return job
+
+    def get_job(self, job_id: str) -> Optional[JobStatus]:
+        return self.jobs.get(job_id)
+
+    def start_stage(self, job: JobStatus, name: str, **detail):
+        stage = self._stage(job, name)
+        stage.status = "running"
+        stage.started_at = datetime.now()
+        stage.detail.update(detail)
+        job.status = "running"
+        job.updated_at = stage.started_at
+
+    def complete_stage(self, job: JobStatus, name: str, **detail):
+        stage = self._stage(job, name)
+        stage.status = "completed"
+        stage.finished_at = datetime.now()
+        stage.detail.update(detail)
+        job.updated_at = stage.finished_at
+
+    def fail_job(self, job: JobStatus, error: str):
+        """Mark the running stage (if any) and the job as failed"""
+        now = datetime.now()
+        for stage in job.stages:
+            if stage.status == "running":
+                stage.status = "failed"
+                stage.finished_at = now
+        job.status = "failed"
+        job.error = error
+        job.updated_at = now
+
+    def submit_transcription(self, job: JobStatus, uploaded: Dict[str, str]):
+        """Transcribe and analyze an uploaded recording in the background"""
+        task = asyncio.create_task(self._run_transcription(job, uploaded))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_transcription(self, job: JobStatus, uploaded: Dict[str, str]):
+        try:
+            self.start_stage(job, "transcribe", job_name=uploaded["job_name"])
+            transcription = await self.transcribe_service.transcribe_uploaded(uploaded, patient_id=job.patient_id)
+            job.transcription = transcription
+            self.complete_stage(
+                job, "transcribe", characters=len(transcription), cache_hit=uploaded.get("cache_hit", False)
+            )
+
+            self.start_stage(job, "analyze")
+            patient_id = job.patient_id or f"patient_{uuid.uuid4().hex[:8]}"
+            analysis = await self.comprehend_service.analyze_medical_text(transcription)
+            job.result = ClinicalSummary.from_analysis(patient_id, transcription, analysis)
+            self.complete_stage(job, "analyze", entities=len(job.result.medical_entities))
+
+            job.status = "completed"
+            job.updated_at = datetime.now()
+        except Exception as e:
+            self.fail_job(job, str(e))
+
+    def _stage(self, job: JobStatus, name: str) -> JobStage:
+        for stage in job.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(f"Unknown job stage: {name}")
+
+    def _prune_finished_jobs(self):
+        """Forget completed/failed jobs older than the retention window"""
+        cutoff = datetime.now() - timedelta(seconds=settings.job_retention_seconds)
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.status in ("completed", "failed") and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -0,0 +1,164 @@
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class JsonStreamScanner:
+    """Incremental scanner over a JSON object that arrives in pieces.
+
+    Feed it text as the model generates it. For top-level string values
+    whose key is in `string_keys` it reports ("delta", key, text) as the
+    characters arrive; for top-level arrays whose key is in `array_keys` it
+    reports ("item", key, element) as soon as each object element is closed.
+    Anything before the first "{" (such as a markdown fence) is skipped and
+    the scan stops when that object closes.
+    """
+
+    def __init__(self, string_keys: Iterable[str] = (), array_keys: Iterable[str] = ()):
+        self.string_keys = set(string_keys)
+        self.array_keys = set(array_keys)
+        self.depth = 0
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.escape: Optional[str] = None
+        self.string_role: Optional[str] = None  # "key", "stream" or None
+        self.expect_key = False
+        self.key: Optional[str] = None
+        self.key_chars: List[str] = []
+        self.array_key: Optional[str] = None
+        self.item: Optional[List[str]] = None
+
+    def feed(self, text: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        for char in text:
+            if self.done:
+                break
+            self._step(char, events)
+        return events
+
+    def _step(self, char: str, events: List[Tuple[str, str, Any]]):
+        if self.item is not None:
+            self.item.append(char)
+
+        if self.in_string:
+            if self.escape is not None:
+                self.escape += char
+                if self.escape[0] == "u":
+                    if len(self.escape) < 5:
+                        return
+                    decoded = chr(int(self.escape[1:], 16))
+                else:
+                    decoded = ESCAPES.get(char, char)
+                self.escape = None
+                self._string_char(decoded, events)
+            elif char == "\\":
+                self.escape = ""
+            elif char == '"':
+                self.in_string = False
+                if self.string_role == "key":
+                    self.key = "".join(self.key_chars)
+            else:
+                self._string_char(char, events)
+            return
+
+        if not self.started:
+            if char == "{":
+                self.started = True
+                self.depth = 1
+                self.expect_key = True
+            return
+
+        if char == '"':
+            self.in_string = True
+            self.string_role = None
+            if self.depth == 1 and self.expect_key:
+                self.string_role = "key"
+                self.key_chars = []
+            elif self.depth == 1 and self.key in self.string_keys:
+                self.string_role = "stream"
+        elif char in "{[":
+            if self.depth == 2 and self.array_key and char == "{" and self.item is None:
+                self.item = [char]
+            self.depth += 1
+            if self.depth == 2:
+                self.array_key = self.key if char == "[" and self.key in self.array_keys else None
+        elif char in "}]":
+            self.depth -= 1
+            if self.depth == 2 and self.item is not None:
+                try:
+                    events.append(("item", self.array_key, json.loads("".join(self.item))))
+                except json.JSONDecodeError:
+                    pass
+                self.item = None
+            elif self.depth == 1:
+                self.array_key = None
+            elif self.depth == 0:
+                self.done = True
+        elif self.depth == 1:
+            if char == ",":
+                self.expect_key = True
+            elif char == ":":
+                self.expect_key = False
+
+    def _string_char(self, char: str, events: List[Tuple[str, str, Any]]):
+        if self.string_role == "key":
+            self.key_chars.append(char)
+        elif self.string_role == "stream":
+            if events and events[-1][0] == "delta" and events[-1][1] == self.key:
+                events[-1] = ("delta", self.key, events[-1][2] + char)
+            else:
+                events.append(("delta", self.key, char))
+
+CLOSERS = {"{": "}", "[": "]"}
+
+def parse_partial_json(text: str) -> Any:
+    """Parse JSON that may be wrapped in prose or markdown fences or cut off.
+
+    Parsing starts at the first "{". If the document is incomplete (output
+    stopped at the token limit) it is cut back to the last complete value
+    and the open arrays/objects are closed, so everything generated before
+    the cut survives. Raises ValueError when there is nothing to recover.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in model output")
+    stack: List[str] = []
+    object_expects_value: List[bool] = []
+    in_string = escaped = False
+    cut: Optional[Tuple[int, str]] = None
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if stack[-1] == "[" or object_expects_value[-1]:
+                    cut = (index + 1, "".join(CLOSERS[opener] for opener in reversed(stack)))
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            object_expects_value.append(False)
+            if char == "[" or len(stack) == 1:
+                cut = (index + 1, "".join(CLOSERS[opener] for opener in reversed(stack)))
+        elif char in "}]":
+            stack.pop()
+            object_expects_value.pop()
+            if not stack:
+                return json.loads(text[start:index + 1])
+            cut = (index + 1, "".join(CLOSERS[opener] for opener in reversed(stack)))
+        elif char == ":":
+            object_expects_value[-1] = True
+        elif char == ",":
+            if stack[-1] == "{":
+                object_expects_value[-1] = False
+            cut = (index, "".join(CLOSERS[opener] for opener in reversed(stack)))
+
+    if cut is None:
+        raise ValueError("No complete JSON value in model output")
+    return json.loads(text[start:cut[0]] + cut[1])
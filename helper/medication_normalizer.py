@@ -0,0 +1,333 @@
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+NAME_WORD_RE = re.compile(r"[a-z][a-z\-]*[a-z]|[a-z]")
+
+NUMBER_WORDS = {
+    "half": 0.5, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "sixty": 60, "eighty": 80, "hundred": 100
+}
+UNITS = {
+    "mg": "mg", "milligram": "mg", "milligrams": "mg",
+    "mcg": "mcg", "ug": "mcg", "µg": "mcg", "microgram": "mcg", "micrograms": "mcg",
+    "g": "g", "gm": "g", "gram": "g", "grams": "g",
+    "ml": "mL", "cc": "mL", "milliliter": "mL", "milliliters": "mL",
+    "unit": "unit", "units": "unit", "iu": "unit", "u": "unit",
+    "meq": "mEq",
+    "puff": "puff", "puffs": "puff",
+    "tab": "tablet", "tabs": "tablet", "tablet": "tablet", "tablets": "tablet",
+    "cap": "capsule", "caps": "capsule", "capsule": "capsule", "capsules": "capsule",
+    "drop": "drop", "drops": "drop", "gtt": "drop", "gtts": "drop",
+    "spray": "spray", "sprays": "spray",
+    "patch": "patch", "patches": "patch",
+    "%": "%"
+}
+ROUTES = {
+    "po": "oral", "by mouth": "oral", "orally": "oral", "oral": "oral",
+    "iv": "intravenous", "intravenous": "intravenous", "intravenously": "intravenous",
+    "im": "intramuscular", "intramuscular": "intramuscular", "intramuscularly": "intramuscular",
+    "sc": "subcutaneous", "sq": "subcutaneous", "subq": "subcutaneous", "subcut": "subcutaneous",
+    "subcutaneous": "subcutaneous", "subcutaneously": "subcutaneous",
+    "sl": "sublingual", "sublingual": "sublingual", "sublingually": "sublingual", "under the tongue": "sublingual",
+    "inhaled": "inhalation", "inhaler": "inhalation", "nebulized": "inhalation", "nebulizer": "inhalation",
+    "topical": "topical", "topically": "topical",
+    "pr": "rectal", "rectal": "rectal", "rectally": "rectal",
+    "nasal": "nasal", "intranasal": "nasal", "nasally": "nasal",
+    "transdermal": "transdermal", "ophthalmic": "ophthalmic"
+}
+# Fixed frequency phrases -> (code, doses per day)
+FREQUENCIES = {
+    "qd": ("QD", 1.0), "daily": ("QD", 1.0), "once daily": ("QD", 1.0), "once a day": ("QD", 1.0),
+    "every day": ("QD", 1.0), "once per day": ("QD", 1.0),
+    "bid": ("BID", 2.0), "twice daily": ("BID", 2.0), "twice a day": ("BID", 2.0), "twice per day": ("BID", 2.0),
+    "tid": ("TID", 3.0), "three times daily": ("TID", 3.0), "three times a day": ("TID", 3.0), "thrice daily": ("TID", 3.0),
+    "qid": ("QID", 4.0), "four times daily": ("QID", 4.0), "four times a day": ("QID", 4.0),
+    "qhs": ("QHS", 1.0), "at bedtime": ("QHS", 1.0), "nightly": ("QHS", 1.0), "at night": ("QHS", 1.0),
+    "every night": ("QHS", 1.0),
+    "qam": ("QAM", 1.0), "every morning": ("QAM", 1.0), "in the morning": ("QAM", 1.0),
+    "qod": ("QOD", 0.5), "every other day": ("QOD", 0.5),
+    "weekly": ("QWK", 1 / 7), "once a week": ("QWK", 1 / 7), "once weekly": ("QWK", 1 / 7), "every week": ("QWK", 1 / 7)
+}
+
+def alternation(phrases) -> str:
+    """Regex alternation that tries longer phrases first and allows any whitespace inside them"""
+    return "|".join(r"\s+".join(map(re.escape, phrase.split())) for phrase in sorted(phrases, key=len, reverse=True))
+
+NUMBER = r"\d+(?:\.\d+)?|\d+/\d+|" + alternation(NUMBER_WORDS)
+DOSE_RE = re.compile(
+    rf"(?<![\w.])(?P<value>{NUMBER})\s*-?\s*(?P<unit>{alternation(UNITS)})(?:\s*/\s*(?P<per>ml|tab(?:let)?|dose))?(?![\w])",
+    re.IGNORECASE
+)
+ROUTE_RE = re.compile(rf"(?<![\w])(?:{alternation(ROUTES)})(?![\w])", re.IGNORECASE)
+FREQUENCY_RE = re.compile(
+    rf"(?<![\w])(?:"
+    rf"(?P<fixed>{alternation(FREQUENCIES)})"
+    rf"|q\s*(?P<q_hours>\d+)\s*h(?:rs?|ours?)?"
+    rf"|every\s+(?P<every_hours>{NUMBER})(?:\s*(?:-|to)\s*\d+)?\s+hours?"
+    rf"|(?P<times>{NUMBER})\s+times\s+(?:a|per)\s+day"
+    rf")(?![\w])",
+    re.IGNORECASE
+)
+PRN_RE = re.compile(r"(?<![\w])(?:prn|as needed|when needed|if needed)(?![\w])", re.IGNORECASE)
+# The signature of a medication ends at the end of its sentence or clause
+CONTEXT_END_RE = re.compile(r"[.;\n]|(?:,|\band\b)\s*(?:and\s+)?(?=[a-z]{4,}\s+\d)", re.IGNORECASE)
+CONTEXT_CHARS = 80
+
+def parse_number(value: str) -> Optional[float]:
+    value = value.lower()
+    if value in NUMBER_WORDS:
+        return float(NUMBER_WORDS[value])
+    if "/" in value:
+        numerator, denominator = value.split("/")
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(value)
+
+def parse_sig(text: str) -> Dict[str, Any]:
+    """Dose, unit, route and frequency found in a medication signature such as "81mg PO daily".
+
+    Returns only the fields that were found, plus the matched dose and
+    frequency text (dosage/frequency) as written.
+    """
+    sig: Dict[str, Any] = {}
+    dose = DOSE_RE.search(text)
+    if dose:
+        sig["dose_value"] = parse_number(dose.group("value"))
+        unit = UNITS[dose.group("unit").lower()]
+        if dose.group("per"):
+            unit = f"{unit}/{'mL' if dose.group('per').lower() == 'ml' else dose.group('per').lower()}"
+        sig["dose_unit"] = unit
+        sig["dosage"] = dose.group(0).strip()
+    route = ROUTE_RE.search(text)
+    if route:
+        sig["route"] = ROUTES[" ".join(route.group(0).lower().split())]
+    frequency = FREQUENCY_RE.search(text)
+    if frequency:
+        if frequency.group("fixed"):
+            code, per_day = FREQUENCIES[" ".join(frequency.group("fixed").lower().split())]
+        else:
+            hours = frequency.group("q_hours") or frequency.group("every_hours")
+            if hours:
+                hours = parse_number(hours)
+                code, per_day = f"Q{hours:g}H", 24 / hours if hours else None
+            else:
+                times = parse_number(frequency.group("times"))
+                code, per_day = f"{times:g}X_DAILY", times
+        sig["frequency_code"] = code
+        sig["doses_per_day"] = round(per_day, 4) if per_day else None
+        sig["frequency"] = frequency.group(0).strip()
+    prn = PRN_RE.search(text)
+    if prn:
+        sig["as_needed"] = True
+        sig["frequency"] = f"{sig['frequency']} {prn.group(0)}" if "frequency" in sig else prn.group(0)
+    return sig
+
+def osa_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count once), capped at limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    two_back: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        char_a = a[i - 1]
+        for j in range(1, len(b) + 1):
+            best = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < best:
+                best = previous[j] + 1
+            if current[j - 1] + 1 < best:
+                best = current[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == b[j - 1] and two_back[j - 2] + 1 < best:
+                best = two_back[j - 2] + 1
+            current[j] = best
+        if min(current) > limit:
+            return limit + 1
+        two_back, previous = previous, current
+    return previous[-1]
+
+class DrugDictionary:
+    """Drug names with a symmetric-delete index for misspellings.
+
+    Every name is stored with all its deletions of up to max_distance
+    characters, taken from its first prefix_length characters only (the
+    SymSpell prefix trick keeps the index a few times the vocabulary). A
+    query generates its own deletions the same way, and candidates sharing a
+    deletion are verified with the real edit distance.
+    """
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.concepts: List[Tuple[str, str]] = []  # (rxcui, canonical name)
+        self.names: Dict[str, int] = {}  # spelling -> concept
+        self.deletes: Dict[str, Any] = {}  # deletion -> spelling or tuple of spellings
+        self.max_words = 1
+
+    @classmethod
+    def load(cls, path: str, max_distance: int = 2) -> "DrugDictionary":
+        dictionary = cls(max_distance)
+        with open(path, encoding="utf-8") as table:
+            for line in table:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 2:
+                    continue
+                spellings = [fields[1]] + (fields[2].split("|") if len(fields) > 2 else [])
+                dictionary.add(fields[0].strip(), fields[1].strip(), spellings)
+        return dictionary
+
+    def add(self, rxcui: str, name: str, spellings: List[str]):
+        concept = len(self.concepts)
+        self.concepts.append((rxcui, name))
+        for spelling in spellings:
+            spelling = " ".join(NAME_WORD_RE.findall(spelling.lower()))
+            if not spelling or spelling in self.names:
+                continue
+            self.names[spelling] = concept
+            self.max_words = max(self.max_words, len(spelling.split()))
+            for deletion in self._deletions(spelling):
+                existing = self.deletes.get(deletion)
+                if existing is None:
+                    self.deletes[deletion] = spelling
+                elif isinstance(existing, str):
+                    self.deletes[deletion] = (existing, spelling)
+                else:
+                    self.deletes[deletion] = existing + (spelling,)
+
+    def lookup(self, phrase: str) -> Optional[Tuple[str, str, int]]:
+        """(rxcui, canonical name, edit distance) of the closest spelling, or None"""
+        concept = self.names.get(phrase)
+        if concept is not None:
+            return (*self.concepts[concept], 0)
+        # Very short words are too ambiguous to correct
+        if len(phrase) < 5:
+            return None
+        limit = 1 if len(phrase) < 8 else self.max_distance
+        candidates = set()
+        for deletion in self._deletions(phrase, limit):
+            spellings = self.deletes.get(deletion)
+            if spellings is not None:
+                candidates.update((spellings,) if isinstance(spellings, str) else spellings)
+        best = None
+        for spelling in candidates:
+            distance = osa_distance(phrase, spelling, limit)
+            if distance <= limit and (best is None or (distance, spelling) < best):
+                best = (distance, spelling)
+        if best is None:
+            return None
+        return (*self.concepts[self.names[best[1]]], best[0])
+
+    def _deletions(self, word: str, limit: int = None) -> set:
+        limit = self.max_distance if limit is None else limit
+        deletions = {word[:self.prefix_length]}
+        frontier = deletions
+        for _ in range(limit):
+            frontier = {
+                candidate[:index] + candidate[index + 1:]
+                for candidate in frontier if len(candidate) > 1
+                for index in range(len(candidate))
+            }
+            deletions |= frontier
+        return deletions
+
+class MedicationNormalizer:
+    """Canonical drug, dose, route and frequency for each extracted medication.
+
+    Runs after the analysis, outside the model: the drug name is matched
+    against the dictionary (exact, then misspellings via the symmetric-delete
+    index, longest word n-gram first), and the signature is parsed from the
+    transcript right after the medication's mention, falling back to the
+    dosage/frequency text already on the item.
+    """
+
+    def __init__(self):
+        self.enabled = settings.medication_normalization_enabled
+        self.dictionary: Optional[DrugDictionary] = None
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._match = lru_cache(maxsize=8192)(self._match_uncached)
+        self.normalized = 0
+        self.matched = 0
+        self.corrected = 0
+
+    def load(self):
+        with self._lock:
+            if self.loaded or not self.enabled:
+                return
+            path = settings.drug_names_path
+            if path and os.path.exists(path):
+                self.dictionary = DrugDictionary.load(path, settings.medication_max_edit_distance)
+            else:
+                logger.warning("Drug dictionary %s not found; medications will not be matched", path)
+            self.loaded = True
+
+    def annotate(self, analysis: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """Normalize the analysis' medications in place, reading signatures from text"""
+        mentions = [
+            entity for entity in analysis.get("entities", [])
+            if entity.get("category") == "MEDICATION" and entity.get("end_offset", 0) > entity.get("begin_offset", 0)
+        ]
+        for medication in analysis.get("medications", []):
+            name = medication.get("name", "").lower()
+            mention = next((entity for entity in mentions if entity["text"].lower() == name), None)
+            self.normalize(medication, text, mention)
+        return analysis
+
+    def normalize(self, medication: Dict[str, Any], text: str = "", mention: Dict[str, Any] = None) -> Dict[str, Any]:
+        if not self.enabled:
+            return medication
+        if not self.loaded:
+            self.load()
+        self.normalized += 1
+        match = self._match(medication.get("name", "").lower())
+        if match is not None:
+            medication["rxcui"], medication["normalized_name"], distance = match
+            self.matched += 1
+            if distance:
+                self.corrected += 1
+
+        # The item's own dosage/frequency win; the transcript fills what they lack
+        sig = parse_sig(" ".join(filter(None, [medication.get("name"), medication.get("dosage"), medication.get("frequency")])))
+        if mention is not None:
+            context = self.context(text, mention["end_offset"])
+            sig = {**parse_sig(context), **sig}
+        for field, value in sig.items():
+            if medication.get(field) in (None, ""):
+                medication[field] = value
+        return medication
+
+    @staticmethod
+    def context(text: str, position: int) -> str:
+        """Text after a mention up to the end of its clause"""
+        window = text[position:position + CONTEXT_CHARS]
+        end = CONTEXT_END_RE.search(window)
+        return window[:end.start()] if end else window
+
+    def _match_uncached(self, name: str) -> Optional[Tuple[str, str, int]]:
+        if self.dictionary is None:
+            return None
+        tokens = NAME_WORD_RE.findall(name)
+        # Longest run of words that names a drug, so "insulin glargine" beats "insulin"
+        for size in range(min(len(tokens), self.dictionary.max_words), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                match = self.dictionary.lookup(" ".join(tokens[start:start + size]))
+                if match is not None:
+                    return match
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "dictionary_names": len(self.dictionary.names) if self.dictionary else None,
+            "normalized": self.normalized,
+            "matched": self.matched,
+            "spelling_corrected": self.corrected
+        }
@@ -0,0 +1,195 @@
+import bisect
+import math
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List
+from config import settings
+
+MODEL_NAMES = {
+    "amazon.nova-micro-v1:0": "Amazon Nova Micro",
+    "amazon.nova-lite-v1:0": "Amazon Nova Lite",
+    "amazon.nova-pro-v1:0": "Amazon Nova Pro",
+}
+
+# Cheap stand-in for entity density: doses/vitals and common clinical word endings
+MEDICAL_TERM_RE = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|units?|iu|mmhg|bpm|%)(?!\w)"
+    r"|\b\w+(?:itis|osis|emia|algia|ectomy|otomy|oscopy|plasty|pathy|oma|pril|sartan|olol|statin"
+    r"|cillin|mycin|azole|prazole|formin|gliptin|dipine|tidine)\b",
+    re.IGNORECASE
+)
+
+def entity_density(text: str) -> float:
+    """Medical-looking terms per 100 words"""
+    words = len(text.split())
+    if not words:
+        return 0.0
+    return 100.0 * len(MEDICAL_TERM_RE.findall(text)) / words
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (seconds) with bucket-resolution percentiles"""
+
+    BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the percentile; 0.0 without samples"""
+        if not self.count:
+            return 0.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return self.BUCKETS[index] if index < len(self.BUCKETS) else self.maximum
+        return self.maximum
+
+    def stats(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self.BUCKETS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": buckets
+        }
+
+class LatencyWindow:
+    """Latencies (seconds) of the last window_seconds, at most max_samples of them.
+
+    Routing uses these rather than the all-time histogram so a tier that
+    recovers, or one that starts to slow down, is noticed quickly. Samples
+    expire even without traffic, so a skipped tier is tried again.
+    """
+
+    def __init__(self, window_seconds: float, max_samples: int):
+        self.window_seconds = window_seconds
+        self.samples = deque(maxlen=max_samples)  # (monotonic time, seconds)
+
+    def observe(self, seconds: float):
+        self.samples.append((time.monotonic(), seconds))
+
+    def percentile(self, fraction: float) -> float:
+        """Nearest-rank percentile of the samples still in the window; 0.0 without any"""
+        cutoff = time.monotonic() - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        if not self.samples:
+            return 0.0
+        values = sorted(seconds for _, seconds in self.samples)
+        return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {"count": len(self.samples), "p50": p50, "p90": p90}
+
+class ModelRouter:
+    """Picks the Nova model for each analysis and decides on escalation.
+
+    Tiers are ordered smallest to largest (model_router_tiers). Short, sparse
+    notes go to the smallest tier, dense or medium notes to the middle one
+    and long transcripts to the largest. A tier whose recent p90 latency
+    (model_router_latency_window_seconds) breaks the latency SLO is skipped
+    in favour of a smaller one that meets it. Results below model_router_escalation_confidence (or failures) are
+    re-run on the next tier when its typical latency still fits the SLO;
+    failures are always escalated.
+    """
+
+    def __init__(self):
+        self.enabled = settings.model_routing_enabled
+        self.models: List[str] = [model.strip() for model in settings.model_router_tiers.split(",") if model.strip()]
+        self.slo = settings.analysis_latency_slo_seconds
+        self.histograms = {model: LatencyHistogram() for model in self.models}
+        self.windows = {model: self._window() for model in self.models}
+        self.routed = Counter()
+        self.escalations = Counter()
+        self.recent = deque(maxlen=50)
+
+    def cache_id(self) -> str:
+        """Identifies the routing setup in analysis cache keys"""
+        return "router:" + ",".join(self.models) if self.enabled else self.models[-1]
+
+    def choose(self, text: str) -> Dict[str, Any]:
+        """Routing decision for one analysis; its "model" is the model to call"""
+        if not self.enabled:
+            return {"chars": len(text), "model": self.models[-1]}
+        density = entity_density(text)
+        if len(text) <= settings.model_router_micro_max_chars and density < settings.model_router_dense_threshold:
+            tier = 0
+        elif len(text) <= settings.model_router_lite_max_chars:
+            tier = 1
+        else:
+            tier = 2
+        tier = min(tier, len(self.models) - 1)
+        while tier > 0 and self._p90(tier) > self.slo and self._p90(tier - 1) <= self.slo:
+            tier -= 1
+        decision = {"chars": len(text), "density": round(density, 2), "model": self.models[tier]}
+        self.routed[decision["model"]] += 1
+        self.recent.append(decision)
+        return decision
+
+    def escalate(self, decision: Dict[str, Any], confidence: float, ok: bool, elapsed: float) -> bool:
+        """Move the decision to the next larger model if the result should be re-run there"""
+        model = decision["model"]
+        if not self.enabled or model not in self.models:
+            return False
+        tier = self.models.index(model)
+        if tier == len(self.models) - 1:
+            return False
+        if ok and confidence >= settings.model_router_escalation_confidence:
+            return False
+        larger = self.models[tier + 1]
+        if ok and elapsed + self.windows[larger].percentile(0.5) > self.slo:
+            return False
+        self.escalations[f"{model}->{larger}"] += 1
+        decision.setdefault("escalated_from", []).append(model)
+        decision["model"] = larger
+        return True
+
+    def is_final(self, model: str, confidence: float) -> bool:
+        """Whether a result of model would stand, i.e. _analyze would not escalate it for confidence"""
+        if not self.enabled or model not in self.models or model == self.models[-1]:
+            return True
+        return confidence >= settings.model_router_escalation_confidence
+
+    def active_models(self) -> List[str]:
+        """Models analyses can run on: every tier when routing, else the largest"""
+        return list(self.models) if self.enabled else self.models[-1:]
+
+    def record_latency(self, model: str, seconds: float):
+        if model not in self.histograms:
+            self.histograms[model] = LatencyHistogram()
+            self.windows[model] = self._window()
+        self.histograms[model].observe(seconds)
+        self.windows[model].observe(seconds)
+
+    def _window(self) -> LatencyWindow:
+        return LatencyWindow(settings.model_router_latency_window_seconds, settings.model_router_latency_window_samples)
+
+    def _p90(self, tier: int) -> float:
+        return self.windows[self.models[tier]].percentile(0.9)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tiers": [{"model_id": model, "model_name": MODEL_NAMES.get(model, model)} for model in self.models],
+            "latency_slo_seconds": self.slo,
+            "routed": dict(self.routed),
+            "escalations": dict(self.escalations),
+            "latency": {model: histogram.stats() for model, histogram in self.histograms.items()},
+            "recent_latency": {model: window.stats() for model, window in self.windows.items()},
+            "recent_decisions": list(self.recent)
+        }
@@ -0,0 +1,426 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from config import settings
+from helper.fast_extractor import AhoCorasick, load_drug_terms, load_lexicon, lowered
+
+logger = logging.getLogger(__name__)
+
+NAME_PART = r"[A-Z][A-Za-z'’\-]+"
+MONTHS = {
+    "Jan": 1, "January": 1, "Feb": 2, "February": 2, "Mar": 3, "March": 3, "Apr": 4, "April": 4, "May": 5,
+    "Jun": 6, "June": 6, "Jul": 7, "July": 7, "Aug": 8, "August": 8, "Sep": 9, "Sept": 9, "September": 9,
+    "Oct": 10, "October": 10, "Nov": 11, "November": 11, "Dec": 12, "December": 12
+}
+TITLES = {"Mr", "Mrs", "Ms", "Miss", "Mx", "Dr", "Prof"}
+MONTH = "(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+
+# (kind, pattern); when a pattern has a group named "phi" only that part is PHI (the rest is its cue).
+# Patterns are only tried where they can start, so each group is matched at its own anchors:
+# digit runs (or the "(" / "+" before one), capitalized words, and cue keywords.
+DIGIT_PATTERNS = [
+    ("SSN", r"\b\d{3}-\d{2}-\d{4}\b"),
+    ("PHONE", r"(?<![\w)])(?:\+?1[\s.\-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.\-])\d{3}[\s.\-]\d{4}\b"),
+    ("DATE", r"\b(?:\d{1,2}[/\-.]\d{1,2}[/\-.](?:\d{4}|\d{2})|\d{4}-\d{2}-\d{2})\b"),
+    ("DATE", rf"\b\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{MONTH}(?:,?\s+\d{{4}})?\b"),
+    ("ADDRESS", rf"\b\d{{1,5}}\s+(?:{NAME_PART}\s+){{1,3}}(?i:street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|court|ct|way|place|pl|terrace|parkway|pkwy|circle|cir)\b\.?"
+                rf"(?:,?\s+(?i:apt|suite|unit|#)\.?\s*\w+)?(?:,\s+{NAME_PART}(?:\s+{NAME_PART})?)?(?:,?\s+[A-Z]{{2}})?(?:\s+\d{{5}}(?:-\d{{4}})?)?"),
+    ("AGE", r"\b(?:9\d|1[0-4]\d)(?=[\s\-]*(?:years?|yrs?|y/?o)\b)"),
+]
+CAPITALIZED_PATTERNS = [
+    ("DATE", rf"\b{MONTH}\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?\b"),
+    ("NAME", rf"\b(?:{'|'.join(TITLES)})\.?\s+(?P<phi>{NAME_PART}(?:\s+{NAME_PART})?)"),
+]
+# Relations and roles that introduce a name ("Daughter Keisha is the contact", "Pt John Smith")
+RELATIONS = (
+    "daughter", "son", "wife", "husband", "mother", "father", "brother", "sister", "spouse", "partner",
+    "caregiver", "guardian", "patient", "pt"
+)
+CUE_KEYWORDS = ("mrn", "medical", "record", "account", "acct", "patient id", "name", "age") + RELATIONS
+CUE_PATTERNS = [
+    ("MRN", r"(?i:\b(?:mrn|medical\s+record(?:\s+(?:number|no\.?|#))?|record\s+(?:number|no\.?|#)|account\s+(?:number|no\.?|#)|acct\.?(?:\s*(?:number|no\.?|#))?|patient\s+id)\s*(?:is\s+)?[:#]?\s*)"
+            r"(?P<phi>[A-Za-z]{0,3}-?\d[\d\-]{3,}\d)\b"),
+    ("AGE", r"(?i:\baged?\b[ \t]*(?:of[ \t]+|:[ \t]*)?)(?P<phi>9\d|1[0-4]\d)\b"),
+    ("NAME", rf"(?i:\bname\s*(?:is|:))\s*(?P<phi>{NAME_PART}(?:\s+[A-Z]\.)?(?:\s+{NAME_PART})?)"),
+    ("NAME", rf"(?i:\b(?:{'|'.join(RELATIONS)}|pt\.)(?:'s)?(?:\s+(?:is|named|called))?[,:]?[ \t]+)"
+             rf"(?P<phi>{NAME_PART}(?:[ \t]+[A-Z]\.)?(?:[ \t]+{NAME_PART})?)"),
+]
+
+class PHISpan(NamedTuple):
+    start: int
+    end: int
+    kind: str
+
+class PatternGroup:
+    """Patterns compiled as one alternation, matched at a given position"""
+
+    def __init__(self, patterns: List[Tuple[str, str]]):
+        self.kinds = [kind for kind, _ in patterns]
+        self.phi_groups = {index for index, (_, pattern) in enumerate(patterns) if "(?P<phi>" in pattern}
+        self.regex = re.compile("|".join(
+            f"(?P<p{index}>{pattern.replace('(?P<phi>', f'(?P<h{index}>')})" for index, (_, pattern) in enumerate(patterns)
+        ))
+
+    def match(self, text: str, position: int) -> Optional[PHISpan]:
+        match = self.regex.match(text, position)
+        if match is None:
+            return None
+        index = int(match.lastgroup[1:])
+        group = f"h{index}" if index in self.phi_groups else match.lastgroup
+        return PHISpan(match.start(group), match.end(group), self.kinds[index])
+
+DIGIT_GROUP = PatternGroup(DIGIT_PATTERNS)
+CAPITALIZED_GROUP = PatternGroup(CAPITALIZED_PATTERNS)
+CUE_GROUP = PatternGroup(CUE_PATTERNS)
+DIGITS_RE = re.compile(r"[0-9]+")
+CAPITALIZED_WORD_RE = re.compile(r"[A-Z][A-Za-z'’\-]*")
+CAPITALIZED_RUN_RE = re.compile(r"[A-Z][A-Za-z'’\-]*(?:[ \t]+[A-Z][A-Za-z'’\-]*)*")
+RUN_WORD_RE = re.compile(r"[A-Za-z'’\-]+")
+# Emails are expanded around each "@": the local part backwards, the domain forwards
+EMAIL_LOCAL_RE = re.compile(r"[\w.+\-]{1,64}$")
+EMAIL_DOMAIN_RE = re.compile(r"@[\w\-]+(?:\.[\w\-]+)+")
+LAST_FIRST_RE = re.compile(rf",\s*{NAME_PART}")
+# "Tomasz Kowalski, 67, presents...": two capitalized words before a comma and an age
+NAME_BEFORE_AGE_RE = re.compile(rf"({NAME_PART})[ \t]+(?:[A-Z]\.[ \t]+)?({NAME_PART}),[ \t]*(?i:aged?[ \t]+)?$")
+AGE_AFTER_NAME_RE = re.compile(r"\d{1,3}(?:[,;)]|[\s\-]*(?:years?|yrs?|y/?o)\b)")
+# A dictionary name followed by one of these is an eponym ("Addison disease", "Austin Flint murmur"), not a person
+EPONYM_NOUNS = (
+    "disease", "syndrome", "disorder", "sign", "signs", "phenomenon", "triad", "murmur", "reflex", "reflexes",
+    "palsy", "chorea", "aphasia", "ataxia", "dystrophy", "anomaly", "deformity", "contracture", "fever",
+    "lymphoma", "sarcoma", "tumor", "tumour", "ulcer", "fracture", "node", "nodes", "cell", "cells", "body",
+    "bodies", "duct", "canal", "gland", "sinus", "space", "point", "line", "lines", "block", "test",
+    "maneuver", "manoeuvre", "procedure", "operation", "repair", "incision", "technique", "method",
+    "catheter", "tube", "needle", "forceps", "position", "stain", "solution", "criteria", "score", "scale",
+    "classification", "index", "ratio", "rule", "law", "protocol", "regimen"
+)
+EPONYM_RE = re.compile(r"(?:'s)?\s+(?:" + "|".join(EPONYM_NOUNS) + r")\b", re.IGNORECASE)
+# Capitalized words that follow a first name without being a surname ("Christian Science");
+# medical lexicon and drug dictionary words are added on load
+NON_NAME_WORDS = set(EPONYM_NOUNS) | {
+    "science", "scientist", "church", "faith", "witness", "witnesses", "hospital", "clinic", "center",
+    "centre", "health", "healthcare", "medical", "medicine", "memorial", "university", "college", "school",
+    "county", "city", "state", "street", "avenue", "road", "unit", "ward", "department", "emergency",
+    "care", "home", "house", "nursing", "services", "pharmacy", "insurance", "foundation", "institute",
+    # note headings and verbs that start clinical sentences ("Patient Education", "Pt Denies")
+    "patient", "pt", "education", "instructions", "history", "reports", "report", "denies", "states",
+    "presents", "presented", "notes", "complains", "plan", "assessment", "summary", "portal", "status",
+    "follow", "followup", "visit", "chart", "exam", "review", "results", "was", "is", "has", "had", "and",
+    "the", "he", "she", "they", "his", "her", "who", "will", "with", "for", "not", "today", "also"
+}
+PLACEHOLDER_RE = re.compile(r"\[([A-Z]+)_(\d+)\]")
+
+class Redaction:
+    """A transcript with its PHI replaced by typed placeholders ("[NAME_1]"), and the way back.
+
+    The same value always gets the same placeholder. Offsets convert both
+    ways through the span map; an offset inside a placeholder maps to the
+    end of the original value.
+    """
+
+    def __init__(self, text: str, spans: List[PHISpan], placeholders: Dict[str, str] = None):
+        self.original = text
+        self.spans = spans
+        self.placeholders = placeholders if placeholders is not None else {}  # value -> placeholder
+        self.values: Dict[str, str] = {}  # placeholder -> value
+        counts = Counter(PLACEHOLDER_RE.fullmatch(placeholder).group(1) for placeholder in self.placeholders.values())
+        parts: List[str] = []
+        self.original_starts: List[int] = []
+        self.original_ends: List[int] = []
+        self.redacted_starts: List[int] = []
+        self.redacted_ends: List[int] = []
+        position = length = 0
+        for span in spans:
+            value = text[span.start:span.end]
+            placeholder = self.placeholders.get(value)
+            if placeholder is None:
+                counts[span.kind] += 1
+                placeholder = self.placeholders[value] = f"[{span.kind}_{counts[span.kind]}]"
+            self.values[placeholder] = value
+            parts.append(text[position:span.start])
+            length += span.start - position
+            self.original_starts.append(span.start)
+            self.original_ends.append(span.end)
+            self.redacted_starts.append(length)
+            parts.append(placeholder)
+            length += len(placeholder)
+            self.redacted_ends.append(length)
+            position = span.end
+        parts.append(text[position:])
+        self.text = "".join(parts)
+
+    def to_original(self, offset: int) -> int:
+        return self._convert(offset, self.redacted_starts, self.redacted_ends, self.original_starts, self.original_ends)
+
+    def to_redacted(self, offset: int) -> int:
+        return self._convert(offset, self.original_starts, self.original_ends, self.redacted_starts, self.redacted_ends)
+
+    @staticmethod
+    def _convert(offset: int, starts: List[int], ends: List[int], target_starts: List[int], target_ends: List[int]) -> int:
+        index = bisect.bisect_right(starts, offset) - 1
+        if index < 0:
+            return offset
+        if offset == starts[index]:
+            return target_starts[index]
+        if offset < ends[index]:
+            return target_ends[index]
+        return target_ends[index] + offset - ends[index]
+
+    def rehydrate(self, value: str) -> str:
+        """Placeholders in value put back to the original text"""
+        if not self.values or "[" not in value:
+            return value
+        return PLACEHOLDER_RE.sub(lambda match: self.values.get(match.group(0), match.group(0)), value)
+
+    def rehydrate_analysis(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Analysis of the redacted text turned into one of the original text, in place"""
+        if not self.spans:
+            return analysis
+        for entity in analysis.get("entities", []):
+            self.rehydrate_entity(entity)
+        for field in ("diagnoses", "medications", "procedures"):
+            for item in analysis.get(field, []):
+                for key, value in item.items():
+                    if isinstance(value, str):
+                        item[key] = self.rehydrate(value)
+        if isinstance(analysis.get("summary"), str):
+            analysis["summary"] = self.rehydrate(analysis["summary"])
+        return analysis
+
+    def rehydrate_entity(self, entity: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.spans:
+            return entity
+        entity["text"] = self.rehydrate(entity["text"])
+        if entity.get("end_offset", 0) > entity.get("begin_offset", 0):
+            entity["begin_offset"] = self.to_original(entity["begin_offset"])
+            entity["end_offset"] = self.to_original(entity["end_offset"])
+        return entity
+
+    def stream_rehydrator(self):
+        """Rehydrate text arriving in pieces: feed(piece) -> text safe to emit; flush() -> the rest"""
+        pending = ""
+
+        def feed(piece: str) -> str:
+            nonlocal pending
+            pending += piece
+            # Hold back a "[" that may start a placeholder not complete yet
+            cut = pending.rfind("[")
+            if cut < 0 or "]" in pending[cut:] or len(pending) - cut > 16:
+                cut = len(pending)
+            ready, pending = pending[:cut], pending[cut:]
+            return self.rehydrate(ready)
+
+        def flush() -> str:
+            nonlocal pending
+            rest, pending = pending, ""
+            return self.rehydrate(rest)
+
+        return feed, flush
+
+class PHIScanner:
+    """Local PHI detection: compiled patterns plus a name dictionary automaton.
+
+    Patterns cover SSNs, phone numbers, dates, street addresses, ages over
+    89, MRN/account numbers, titled names ("Dr. Smith"), "name is ..."
+    cues and names after a relation ("Daughter Keisha ...") or before an
+    age ("Tomasz Kowalski, 67,"). They are tried only at digit runs,
+    capitalized words and cue keywords. Each of those is still visited in
+    Python, so the cost grows with how many there are: about 5 ms for 10k
+    words of clinical prose with vitals and doses, 15-25 ms when nearly
+    every sentence holds PHI (measured on one CPython core).
+    Dictionary names (phi_names.tsv) are matched with the word automaton
+    on runs of capitalized words: a first name takes up to two capitalized
+    words after it as the surname, a lone surname only counts as "Smith,
+    John". A first name followed by a medical or institutional word
+    ("Christian Science", "Austin Flint murmur") is not a name. Overlaps
+    keep the leftmost-longest span.
+    """
+
+    def __init__(self):
+        self.enabled = settings.phi_redaction_enabled
+        self.automaton: Optional[AhoCorasick] = None
+        self.name_starts = set()
+        self.name_words = set()
+        self.non_name_words = set(NON_NAME_WORDS)
+        self.loaded = False
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.found = Counter()
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            automaton = AhoCorasick()
+            name_words = set()
+            path = settings.phi_names_path
+            if path and os.path.exists(path):
+                with open(path, encoding="utf-8") as table:
+                    for line in table:
+                        if not line.strip() or line.startswith("#"):
+                            continue
+                        fields = line.rstrip("\n").split("\t")
+                        if len(fields) >= 2 and fields[1].strip() in ("F", "L"):
+                            words = fields[0].strip().lower().split()
+                            automaton.add(words, fields[1].strip())
+                            self.name_starts.add(words[0])
+                            name_words.update(words)
+            else:
+                logger.warning("PHI name dictionary %s not found; only titled and cued names will be found", path)
+            terms = []
+            if settings.medical_lexicon_path and os.path.exists(settings.medical_lexicon_path):
+                terms += load_lexicon(settings.medical_lexicon_path)
+            if settings.drug_names_path and os.path.exists(settings.drug_names_path):
+                terms += load_drug_terms(settings.drug_names_path)
+            for term, _ in terms:
+                self.non_name_words.update(term.split())
+            # A word that is also a name ("Ray" besides "X ray") can still be a surname
+            self.non_name_words -= name_words
+            self.name_words = name_words
+            automaton.build()
+            self.automaton = automaton
+            self.loaded = True
+
+    def scan(self, text: str) -> List[PHISpan]:
+        """PHI spans in text, sorted and non-overlapping"""
+        if not self.loaded:
+            self.load()
+        started = time.perf_counter()
+        spans: List[PHISpan] = []
+
+        covered = 0
+        for digits in DIGITS_RE.finditer(text):
+            position = digits.start()
+            if position < covered:
+                continue
+            if position and text[position - 1] in "(+":
+                # "(555) 123-4567", "+1 555 123 4567"
+                position -= 1
+            span = DIGIT_GROUP.match(text, position)
+            if span is not None:
+                spans.append(span)
+                covered = span.end
+            if text.rfind(",", max(0, position - 8), position) >= 0 and AGE_AFTER_NAME_RE.match(text, digits.start()):
+                name = self._name_before_age(text, digits.start())
+                if name is not None:
+                    spans.append(name)
+
+        covered = 0
+        for word in CAPITALIZED_WORD_RE.finditer(text):
+            position = word.start()
+            # A capital inside a word ("iPhone") does not start one
+            if position < covered or (position and text[position - 1].isalnum()):
+                continue
+            value = word.group(0)
+            span = CAPITALIZED_GROUP.match(text, position) if value in TITLES or value in MONTHS else None
+            if span is None and value.lower() in self.name_starts:
+                span = self._name_at(text, position)
+            if span is not None:
+                spans.append(span)
+                covered = span.end
+
+        lower = lowered(text)
+        for keyword in CUE_KEYWORDS:
+            position = lower.find(keyword)
+            while position >= 0:
+                span = CUE_GROUP.match(text, position)
+                if span is not None and keyword in RELATIONS:
+                    span = self._cued_name(text, span)
+                if span is not None:
+                    spans.append(span)
+                position = lower.find(keyword, position + 1)
+
+        position = text.find("@")
+        while position >= 0:
+            local = EMAIL_LOCAL_RE.search(text, max(0, position - 64), position)
+            domain = EMAIL_DOMAIN_RE.match(text, position)
+            if local is not None and domain is not None:
+                spans.append(PHISpan(local.start(), domain.end(), "EMAIL"))
+            position = text.find("@", position + 1)
+
+        spans.sort(key=lambda span: (span.start, -span.end))
+        kept: List[PHISpan] = []
+        for span in spans:
+            if not kept or span.start >= kept[-1].end:
+                kept.append(span)
+
+        elapsed = time.perf_counter() - started
+        self.scans += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        self.found.update(span.kind for span in kept)
+        return kept
+
+    def redact(self, text: str, placeholders: Dict[str, str] = None) -> Redaction:
+        """Redaction of text; pass the placeholders of an earlier one to keep numbering consistent"""
+        return Redaction(text, self.scan(text) if self.enabled else [], placeholders)
+
+    def _name_at(self, text: str, position: int) -> Optional[PHISpan]:
+        """The dictionary name starting at position, with its surname"""
+        run = CAPITALIZED_RUN_RE.match(text, position)
+        words = list(RUN_WORD_RE.finditer(text, position, run.end()))
+        hits = [
+            (last, kind == "F", kind) for first, last, kind in self.automaton.iter([word.group(0).lower() for word in words])
+            if first == 0
+        ]
+        if not hits:
+            return None
+        last, _, kind = max(hits)
+        end = words[last - 1].end()
+        if kind == "F":
+            following = [word.group(0).lower() for word in words[last:last + 2]]
+            if following and following[0] in self.non_name_words:
+                return None
+            for index, word in enumerate(following):
+                if word in self.non_name_words:
+                    break
+                end = words[last + index].end()
+        else:
+            following = LAST_FIRST_RE.match(text, end)
+            if following is None:
+                return None
+            end = following.end()
+        if EPONYM_RE.match(text, end):
+            return None
+        return PHISpan(position, end, "NAME")
+
+    def _cued_name(self, text: str, span: PHISpan) -> Optional[PHISpan]:
+        """The name after a relation cue, cut at the first non-name word; it needs a dictionary word"""
+        if span.kind != "NAME":
+            return span
+        words = list(RUN_WORD_RE.finditer(text, span.start, span.end))
+        end = None
+        known = False
+        for word in words:
+            value = word.group(0).lower()
+            if value in self.non_name_words:
+                break
+            known = known or value in self.name_words
+            end = word.end()
+        if end is None or not known:
+            return None
+        return PHISpan(span.start, end, "NAME")
+
+    def _name_before_age(self, text: str, position: int) -> Optional[PHISpan]:
+        """The two capitalized words before ", 67" if neither is a medical or heading word"""
+        match = NAME_BEFORE_AGE_RE.search(text, max(0, position - 64), position)
+        if match is None or (match.start() and text[match.start() - 1].isalnum()):
+            return None
+        if match.group(1).lower() in self.non_name_words or match.group(2).lower() in self.non_name_words:
+            return None
+        return PHISpan(match.start(), match.end(2), "NAME")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "scans": self.scans,
+            "mean_ms": round(1000 * self.total_seconds / self.scans, 3) if self.scans else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 3),
+            "found": dict(self.found)
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+
+# Error codes meaning "slow down" (Transcribe reports its job quota as LimitExceededException)
+THROTTLE_CODES = {
+    "ThrottlingException", "Throttling", "TooManyRequestsException",
+    "LimitExceededException", "RequestLimitExceeded", "SlowDown"
+}
+# Error codes worth retrying because the upstream itself is struggling
+TRANSIENT_CODES = {
+    "InternalServerException", "InternalFailure", "InternalServerError", "ServiceUnavailableException",
+    "ServiceUnavailable", "ModelNotReadyException", "ModelTimeoutException"
+}
+CONNECTION_ERRORS = (EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError)
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while its circuit breaker is open"""
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'throttle', 'transient' or None (a real answer from upstream, e.g. a validation error)"""
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        if code in THROTTLE_CODES:
+            return "throttle"
+        if code in TRANSIENT_CODES or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500:
+            return "transient"
+        return None
+    if isinstance(error, CONNECTION_ERRORS):
+        return "transient"
+    return None
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate adapts AIMD-style to throttling.
+
+    Every success adds `increase` requests/s (up to max_rate); a throttle
+    multiplies the rate by `decrease` (down to min_rate), at most once per
+    second so one burst of rejections counts as a single signal. The bucket
+    holds one second's worth of tokens.
+    """
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float, increase: float, decrease: float):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self.last_decrease >= 1.0:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.last_decrease = now
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures.
+
+    After `failure_threshold` consecutive failed calls the circuit opens and
+    calls are rejected for `reset_seconds`. Then one probe call is let
+    through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.rejected = 0
+
+    def before_call(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "open" or (self.state == "half_open" and self.probe_in_flight):
+            self.rejected += 1
+            raise CircuitOpenError("circuit open - upstream is failing, retry shortly")
+        if self.state == "half_open":
+            self.probe_in_flight = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The probe was cancelled before it finished; let another call probe"""
+        self.probe_in_flight = False
+
+class UpstreamGuard:
+    """Rate limiter, retry with jittered backoff and circuit breaker for one service"""
+
+    def __init__(self, limiter: AdaptiveRateLimiter, breaker: CircuitBreaker, max_attempts: int,
+                 base_delay: float, max_delay: float):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self.failures = 0
+
+    async def call(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.breaker.before_call()
+        self.calls += 1
+        attempt = 0
+        try:
+            while True:
+                await self.limiter.acquire()
+                try:
+                    result = await factory()
+                except Exception as e:
+                    kind = classify_error(e)
+                    if kind is None:
+                        # Upstream answered (validation, access denied...); it is healthy
+                        self.breaker.record_success()
+                        raise
+                    if kind == "throttle":
+                        self.throttles += 1
+                        self.limiter.on_throttle()
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        self.failures += 1
+                        self.breaker.record_failure()
+                        raise
+                    self.retries += 1
+                    # Full jitter keeps retries of a burst from arriving together
+                    await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+                    continue
+                self.limiter.on_success()
+                self.breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_limit": round(self.limiter.rate, 3),
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "failures": self.failures
+        }
@@ -0,0 +1,254 @@
+import asyncio
+import boto3
+import hashlib
+import hmac
+import time
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import UploadFile
+from config import settings
+from helper.aws_executor import aws_executor
+from helper.constant import S3_MAX_PARTS
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects non-final multipart parts below 5 MiB
+
+async def iter_upload_file(upload_file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    """Yield an UploadFile's content chunk by chunk"""
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+async def hash_chunks(chunks: AsyncIterator[bytes], digest) -> AsyncIterator[bytes]:
+    """Pass chunks through unchanged while feeding them to a hashlib digest"""
+    async for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+class S3Service:
+    def __init__(self):
+        self.s3_client = boto3.client('s3',
+                                      aws_access_key_id=settings.aws_access_key_id,
+                                      aws_secret_access_key=settings.aws_secret_access_key,
+                                      region_name=settings.aws_default_region,
+                                      endpoint_url=settings.s3_endpoint_url,
+                                      # SigV4, so presigned URLs can sign Content-Length
+                                      config=aws_executor.client_config('s3').merge(Config(signature_version='s3v4')))
+        self.bucket_name = settings.s3_bucket_name
+        self.part_size = max(settings.s3_upload_part_size, MIN_PART_SIZE)
+        self.max_parts_in_flight = settings.s3_upload_max_parts_in_flight
+
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_key: str, content_type: str = None) -> Dict[str, Any]:
+        """Stream chunks into an S3 object using multipart upload.
+
+        At most max_parts_in_flight parts are uploading while the next one is
+        being filled, so memory per upload is bounded by the part size rather
+        than the object size. Objects smaller than one part use put_object.
+        """
+        extra_args = {"ContentType": content_type} if content_type else {}
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        tasks: List[asyncio.Task] = []
+        slots = asyncio.Semaphore(self.max_parts_in_flight)
+
+        async def upload_part(part_number: int, data: bytes) -> Dict[str, Any]:
+            try:
+                response = await aws_executor.run(
+                    "s3",
+                    self.s3_client.upload_part,
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data
+                )
+                return {"PartNumber": part_number, "ETag": response["ETag"]}
+            finally:
+                slots.release()
+
+        async def flush_part(data: bytes):
+            nonlocal upload_id
+            if upload_id is None:
+                response = await aws_executor.run(
+                    "s3",
+                    self.s3_client.create_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    **extra_args
+                )
+                upload_id = response["UploadId"]
+            # Stop reading the body as soon as a part has failed
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+            await slots.acquire()
+            tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, data)))
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                buffer.extend(chunk)
+                while len(buffer) >= self.part_size:
+                    await flush_part(bytes(buffer[:self.part_size]))
+                    del buffer[:self.part_size]
+
+            if upload_id is None:
+                # Whole object fits in one part
+                await aws_executor.run(
+                    "s3",
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=bytes(buffer),
+                    **extra_args
+                )
+                return {"s3_key": s3_key, "size": size, "parts": 1}
+
+            if buffer:
+                await flush_part(bytes(buffer))
+                buffer.clear()
+
+            parts = await asyncio.gather(*tasks)
+            await aws_executor.run(
+                "s3",
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+            return {"s3_key": s3_key, "size": size, "parts": len(parts)}
+
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if upload_id is not None:
+                await self._abort_multipart_upload(s3_key, upload_id)
+            raise
+
+    async def presign_upload(self, s3_key: str, content_type: str, size: int) -> Dict[str, Any]:
+        """Presigned URLs for uploading an object straight from the client.
+
+        Files up to one part get a single PUT URL. Larger files get a
+        multipart upload with one presigned URL per part; the client PUTs
+        each part and then calls complete_multipart_upload. Every URL has its
+        exact Content-Length signed in, so S3 rejects a body of any other
+        size. The upload token identifies the key in later calls.
+        """
+        expires_in = settings.s3_presign_expiry_seconds
+        token = self.upload_token(s3_key)
+        if size <= self.part_size:
+            url = self.s3_client.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": self.bucket_name, "Key": s3_key, "ContentType": content_type, "ContentLength": size},
+                ExpiresIn=expires_in
+            )
+            return {"s3_key": s3_key, "method": "PUT", "url": url, "upload_token": token, "expires_in": expires_in}
+
+        response = await aws_executor.run(
+            "s3",
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=content_type
+        )
+        upload_id = response["UploadId"]
+        # Larger parts for files that would exceed S3's part limit at the configured size
+        part_size = max(self.part_size, -(-size // S3_MAX_PARTS))
+        part_count = -(-size // part_size)
+
+        def sign_parts() -> List[str]:
+            return [
+                self.s3_client.generate_presigned_url(
+                    "upload_part",
+                    Params={
+                        "Bucket": self.bucket_name,
+                        "Key": s3_key,
+                        "UploadId": upload_id,
+                        "PartNumber": part_number,
+                        "ContentLength": min(part_size, size - (part_number - 1) * part_size)
+                    },
+                    ExpiresIn=expires_in
+                )
+                for part_number in range(1, part_count + 1)
+            ]
+
+        # Signing is local but CPU-bound; thousands of parts would stall the event loop
+        part_urls = await aws_executor.run("s3", sign_parts)
+        return {
+            "s3_key": s3_key,
+            "method": "MULTIPART",
+            "upload_id": upload_id,
+            "upload_token": token,
+            "part_size": part_size,
+            "part_urls": part_urls,
+            "expires_in": expires_in
+        }
+
+    async def complete_multipart_upload(self, s3_key: str, upload_id: str, parts: List[Dict[str, Any]]):
+        """Finish a client-driven multipart upload from its part ETags"""
+        await aws_executor.run(
+            "s3",
+            self.s3_client.complete_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])}
+        )
+
+    def upload_token(self, s3_key: str) -> str:
+        """Token proving s3_key was issued by presign_upload: "<expiry>.<hmac>"."""
+        expires = int(time.time()) + settings.upload_token_ttl_seconds
+        return f"{expires}.{self._token_signature(s3_key, expires)}"
+
+    def verify_upload_token(self, s3_key: str, token: str) -> bool:
+        expires, _, signature = token.partition(".")
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._token_signature(s3_key, int(expires)))
+
+    @staticmethod
+    def _token_signature(s3_key: str, expires: int) -> str:
+        # Every worker shares the AWS secret, so tokens verify on any of them
+        secret = settings.upload_token_secret or "upload-token:" + settings.aws_secret_access_key
+        return hmac.new(secret.encode(), f"{s3_key}\n{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def presign_download(self, s3_key: str) -> str:
+        """Short-lived GET URL, e.g. for ffmpeg to read an object directly"""
+        return self.s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket_name, "Key": s3_key},
+            ExpiresIn=settings.s3_presign_expiry_seconds
+        )
+
+    async def object_size(self, s3_key: str) -> Optional[int]:
+        """Size of an object in bytes, None if it does not exist"""
+        try:
+            response = await aws_executor.run("s3", self.s3_client.head_object, Bucket=self.bucket_name, Key=s3_key)
+            return response["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def object_exists(self, s3_key: str) -> bool:
+        return await self.object_size(s3_key) is not None
+
+    async def delete_object(self, s3_key: str):
+        await aws_executor.run("s3", self.s3_client.delete_object, Bucket=self.bucket_name, Key=s3_key)
+
+    async def _abort_multipart_upload(self, s3_key: str, upload_id: str):
+        try:
+            await aws_executor.run(
+                "s3",
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id
+            )
+        except Exception:
+            pass  # Bucket lifecycle rules clean up anything left behind
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Coalesces identical concurrent work into one upstream call.
+
+    The first caller for a key starts the work as its own task; callers
+    arriving while it runs wait on the same task and receive the same result
+    or exception. A waiter being cancelled (client gone) does not cancel the
+    shared work for the others. The key is forgotten as soon as the work
+    finishes, so later calls start fresh (caching is left to the caller).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run factory() once per key at a time; returns (result, shared)"""
+        future = self._inflight.get(key)
+        shared = future is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(future), shared
+
+    def _finished(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()  # mark as retrieved even if every waiter went away
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
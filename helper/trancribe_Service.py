@@ -1,92 +1,262 @@
 import time
 import boto3
+import requests
 from config import settings
-import aiofiles
+from helper.aws_executor import aws_executor
+from helper.s3_service import S3Service, hash_chunks, iter_upload_file
+from helper.transcript_cache import TranscriptCache
+from helper.single_flight import SingleFlight
+from helper.transcribe_poller import TranscribeJobPoller, estimate_audio_duration, JOB_NAME_PREFIX
+from helper.transcribe_events import TranscribeEventListener
+from helper.transcript_stitching import stitch_transcripts
+import helper.audio_processing as audio_processing
 import asyncio, os
+import hashlib
 from fastapi import UploadFile
+from typing import Dict, Any, Optional
 import uuid
+import logging
+
+logger = logging.getLogger(__name__)
 
 class TranscribeService:
     def __init__(self):
         self.transcribe_client = boto3.client('transcribe',
                                               aws_access_key_id=settings.aws_access_key_id,
                                               aws_secret_access_key=settings.aws_secret_access_key,
-                                              region_name=settings.aws_default_region)
-        self.s3_client = boto3.client('s3'
-                                        ,aws_access_key_id=settings.aws_access_key_id,
-                                        aws_secret_access_key=settings.aws_secret_access_key,
-                                        region_name=settings.aws_default_region)
+                                              region_name=settings.aws_default_region,
+                                              config=aws_executor.client_config('transcribe'))
+        self.s3_service = S3Service()
+        self.s3_client = self.s3_service.s3_client
         self.bucket_name = settings.s3_bucket_name
-    
+        self.poller = TranscribeJobPoller(self.transcribe_client)
+        self.transcript_cache = TranscriptCache()
+        self.inflight = SingleFlight("transcription")
+        self.event_listener = None
+        if settings.transcribe_events_queue_url:
+            self.event_listener = TranscribeEventListener(self.poller, settings.transcribe_events_queue_url)
+
     async def transcribe_audio(self, audio_file: UploadFile) -> str:
         """Transcribe audio file using Amazon Transcribe"""
+        uploaded = await self.upload_audio(audio_file)
+        return await self.transcribe_uploaded(uploaded)
+
+    async def transcribe_uploaded(self, uploaded: Dict[str, Any], patient_id: str = None) -> str:
+        """Transcribe a recording returned by upload_audio, reusing a cached transcript of identical audio"""
+        sha256 = uploaded.get("sha256")
+        if not sha256:
+            return await self._transcribe_uploaded(uploaded, patient_id)
+
+        # Identical audio already being transcribed shares that job; our own copy is not needed
+        transcript, shared = await self.inflight.do(sha256, lambda: self._transcribe_uploaded(uploaded, patient_id))
+        if shared:
+            uploaded["cache_hit"] = False
+            uploaded["coalesced"] = True
+            await self.s3_service.delete_object(uploaded["s3_key"])
+        return transcript
+
+    async def _transcribe_uploaded(self, uploaded: Dict[str, Any], patient_id: str = None) -> str:
+        cached = await self.transcript_cache.lookup(uploaded.get("sha256"))
+        if cached is not None:
+            uploaded["cache_hit"] = True
+            await self.s3_service.delete_object(uploaded["s3_key"])
+            return cached
+
+        uploaded["cache_hit"] = False
+        transcript = await self.transcribe_s3_object(
+            uploaded["s3_key"], uploaded["media_format"], job_name=uploaded["job_name"], size=uploaded.get("size")
+        )
+        await self.transcript_cache.store(uploaded.get("sha256"), uploaded, transcript, patient_id)
+        return transcript
+
+    def new_audio_object(self, filename: str) -> Dict[str, str]:
+        """Unique job name and S3 key for an incoming recording"""
+        job_name = f"{JOB_NAME_PREFIX}{uuid.uuid4().hex[:8]}"
+        media_format = filename.split('.')[-1].lower()
+        return {"job_name": job_name, "s3_key": f"audio/{job_name}.{media_format}", "media_format": media_format}
+
+    async def upload_audio(self, audio_file: UploadFile) -> Dict[str, Any]:
+        """Upload audio file to S3 and return its key and media format"""
         try:
-            # Generate unique job name
-            job_name = f"clinical-transcribe-{uuid.uuid4().hex[:8]}"
-            
-            # Upload audio to S3
-            s3_key = f"audio/{job_name}.{audio_file.filename.split('.')[-1]}"
-            
-            # Save file temporarily
-            temp_file = f"./source/{audio_file.filename}"
-            async with aiofiles.open(temp_file, 'wb') as f:
-                content = await audio_file.read()
-                await f.write(content)
-            
-            # Upload to S3
-            self.s3_client.upload_file(temp_file, self.bucket_name, s3_key)
-            
-            # Clean up temp file
-            os.remove(temp_file)
-            
-            # Start transcription job
-            media_uri = f"s3://{self.bucket_name}/{s3_key}"
-            
-            response = self.transcribe_client.start_transcription_job(
-                TranscriptionJobName=job_name,
-                Media={'MediaFileUri': media_uri},
-                MediaFormat=audio_file.filename.split('.')[-1].lower(),
-                LanguageCode='en-US',
-                Settings={
-                    'ShowSpeakerLabels': True,
-                    'MaxSpeakerLabels': 2,
-                    'ShowAlternatives': True,
-                    'MaxAlternatives': 2
-                }
+            if settings.audio_preprocess_enabled:
+                try:
+                    return await self._upload_preprocessed(audio_file)
+                except Exception as e:
+                    # Formats ffmpeg cannot read from a pipe are uploaded as they are
+                    logger.warning("Audio preprocessing failed, uploading original: %s", e)
+                    await audio_file.seek(0)
+
+            uploaded = self.new_audio_object(audio_file.filename)
+
+            # Stream audio to S3 chunk by chunk, never holding the whole file,
+            # and hash it on the way for the transcript cache
+            digest = hashlib.sha256()
+            upload = await self.s3_service.upload_stream(
+                hash_chunks(iter_upload_file(audio_file, settings.s3_upload_chunk_size), digest),
+                uploaded["s3_key"],
+                content_type=audio_file.content_type
             )
-            
-            # Wait for completion
-            while True:
-                status = self.transcribe_client.get_transcription_job(
-                    TranscriptionJobName=job_name
-                )
-                
-                if status['TranscriptionJob']['TranscriptionJobStatus'] == 'COMPLETED':
-                    # Get transcript
-                    transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-                    
-                    # Download and parse transcript
-                    import requests
-                    transcript_response = requests.get(transcript_uri)
-                    transcript_data = transcript_response.json()
-                    
-                    # Extract text
-                    transcript_text = transcript_data['results']['transcripts'][0]['transcript']
-                    
-                    # Clean up S3 object
-                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
-                    
-                    return transcript_text
-                
-                elif status['TranscriptionJob']['TranscriptionJobStatus'] == 'FAILED':
-                    raise Exception("Transcription job failed")
-                
-                # Wait before checking again
-                await asyncio.sleep(2)
-        
+            uploaded["size"] = upload["size"]
+            uploaded["sha256"] = digest.hexdigest()
+            uploaded["content_type"] = audio_file.content_type
+
+            return uploaded
+
+        except Exception as e:
+            raise Exception(f"Upload error: {str(e)}")
+
+    async def _upload_preprocessed(self, audio_file: UploadFile) -> Dict[str, Any]:
+        """Stream the upload through ffmpeg (mono, 16 kHz, silence-trimmed) into S3.
+
+        The cache hash is taken over the original bytes so duplicate uploads
+        still match; the savings are reported under "preprocessing".
+        """
+        output_format = settings.audio_preprocess_format
+        uploaded = self.new_audio_object(f"{audio_file.filename}.{output_format}")
+        digest = hashlib.sha256()
+        stats: Dict[str, int] = {}
+        started = time.perf_counter()
+        upload = await self.s3_service.upload_stream(
+            audio_processing.transcode_stream(
+                hash_chunks(iter_upload_file(audio_file, settings.s3_upload_chunk_size), digest),
+                audio_processing.preprocess_args(output_format),
+                stats
+            ),
+            uploaded["s3_key"],
+            content_type=f"audio/{output_format}"
+        )
+        uploaded["size"] = upload["size"]
+        uploaded["sha256"] = digest.hexdigest()
+        uploaded["content_type"] = audio_file.content_type
+        uploaded["preprocessing"] = {
+            "input_bytes": stats["input_bytes"],
+            "output_bytes": stats["output_bytes"],
+            "reduction_ratio": round(stats["input_bytes"] / stats["output_bytes"], 2) if stats["output_bytes"] else None,
+            "format": output_format,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        logger.info("Audio preprocessing for %s: %s", uploaded["s3_key"], uploaded["preprocessing"])
+        return uploaded
+
+    async def transcribe_s3_object(self, s3_key: str, media_format: str, job_name: str = None, size: int = None) -> str:
+        """Run a Transcribe job on an audio object already stored in S3"""
+        try:
+            job_name = job_name or f"{JOB_NAME_PREFIX}{uuid.uuid4().hex[:8]}"
+
+            transcript_data = None
+            if settings.transcribe_chunking_enabled:
+                transcript_data = await self._transcribe_chunked(s3_key, media_format, job_name, size)
+            if transcript_data is None:
+                transcript_data = await self._run_transcription_job(s3_key, media_format, job_name, size)
+
+            # Extract text
+            transcript_text = transcript_data['results']['transcripts'][0]['transcript']
+
+            # Clean up S3 object
+            await self.s3_service.delete_object(s3_key)
+
+            return transcript_text
+
         except Exception as e:
             raise Exception(f"Transcription error: {str(e)}")
-    
+
+    async def _transcribe_chunked(self, s3_key: str, media_format: str, job_name: str, size: int = None) -> Optional[Dict[str, Any]]:
+        """Transcribe a long recording as parallel overlapping chunks.
+
+        Returns None when the recording is too short to be worth splitting,
+        or when it cannot be analyzed, so the caller runs a single job.
+        Chunks are cut in silences, uploaded as FLAC next to the original and
+        transcribed concurrently (at most transcribe_chunk_concurrency jobs at
+        a time per recording), then stitched back into one Transcribe result.
+        If one chunk fails the others are cancelled.
+        """
+        try:
+            if size is None:
+                size = await self.s3_service.object_size(s3_key)
+            estimated = estimate_audio_duration(size, media_format)
+            if estimated is not None and estimated < settings.transcribe_chunking_min_duration / 2:
+                return None
+
+            source = self.s3_service.presign_download(s3_key)
+            audio = await audio_processing.analyze_silences(source)
+            if audio["duration"] < settings.transcribe_chunking_min_duration:
+                return None
+
+            chunks = audio_processing.plan_chunks(
+                audio["duration"], audio["silences"],
+                settings.transcribe_chunk_length, settings.transcribe_chunk_overlap
+            )
+        except Exception as e:
+            # ffmpeg cannot read every format; a single job still can
+            logger.warning("Chunk planning for %s failed, transcribing as one job: %s", s3_key, e)
+            return None
+        slots = asyncio.Semaphore(settings.transcribe_chunk_concurrency)
+
+        async def transcribe_chunk(index: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+            chunk_job_name = f"{job_name}-part{index}"
+            chunk_key = f"audio/{chunk_job_name}.flac"
+            async with slots:
+                upload = await self.s3_service.upload_stream(
+                    audio_processing.extract_chunk(source, chunk["start"], chunk["end"]),
+                    chunk_key,
+                    content_type="audio/flac"
+                )
+                try:
+                    chunk["transcript"] = await self._run_transcription_job(
+                        chunk_key, "flac", chunk_job_name, upload["size"],
+                        expected_duration=chunk["end"] - chunk["start"]
+                    )
+                finally:
+                    await self.s3_service.delete_object(chunk_key)
+            return chunk
+
+        tasks = [asyncio.ensure_future(transcribe_chunk(index, chunk)) for index, chunk in enumerate(chunks)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the sibling chunks and wait for their uploads to be cleaned up
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return stitch_transcripts(list(results))
+
+    async def _run_transcription_job(self, s3_key: str, media_format: str, job_name: str, size: int = None,
+                                     expected_duration: float = None) -> Dict[str, Any]:
+        """Start a Transcribe job, wait for it and return the transcript JSON"""
+        # Start transcription job
+        media_uri = f"s3://{self.bucket_name}/{s3_key}"
+
+        await aws_executor.run(
+            "transcribe",
+            self.transcribe_client.start_transcription_job,
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': media_uri},
+            MediaFormat=media_format,
+            LanguageCode='en-US',
+            Settings={
+                'ShowSpeakerLabels': True,
+                'MaxSpeakerLabels': 2,
+                'ShowAlternatives': True,
+                'MaxAlternatives': 2
+            }
+        )
+
+        # Wait for completion; the shared poller decides when to check
+        job = await self.poller.wait_for_job(
+            job_name, expected_duration or estimate_audio_duration(size, media_format)
+        )
+
+        # Download and parse transcript
+        transcript_uri = job['Transcript']['TranscriptFileUri']
+        return await aws_executor.run("s3", self._fetch_transcript, transcript_uri)
+
+    def _fetch_transcript(self, transcript_uri: str) -> Dict[str, Any]:
+        """Download the transcript JSON Transcribe wrote for a finished job"""
+        transcript_response = requests.get(transcript_uri, timeout=30)
+        transcript_response.raise_for_status()
+        return transcript_response.json()
+
     def cleanup_job(self, job_name: str):
         """Clean up transcription job"""
         try:
@@ -94,4 +264,4 @@ class TranscribeService:
                 TranscriptionJobName=job_name
             )
         except:
-            pass  # Job might already be deleted
\ No newline at end of file
+            pass  # Job might already be deleted
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+import boto3
+from config import settings
+from helper.aws_executor import aws_executor
+from helper.transcribe_poller import JOB_NAME_PREFIX
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("COMPLETED", "FAILED")
+
+def parse_job_state_change(body: str) -> Optional[Dict[str, str]]:
+    """Job name and status from an EventBridge "Transcribe Job State Change" message.
+
+    Accepts the event as delivered by an EventBridge -> SQS rule, or wrapped
+    in an SNS notification. Returns None for anything else.
+    """
+    try:
+        event = json.loads(body)
+        if "Message" in event and "detail" not in event:
+            event = json.loads(event["Message"])
+        detail = event["detail"]
+        return {
+            "job_name": detail["TranscriptionJobName"],
+            "status": detail["TranscriptionJobStatus"]
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
+
+class TranscribeEventListener:
+    """Consumes Transcribe job state-change events from SQS and wakes the poller.
+
+    EventBridge delivers "Transcribe Job State Change" events to the queue;
+    for every COMPLETED/FAILED job this worker is waiting on, the poller is
+    told to fetch the job right away. While the listener is healthy the
+    poller only checks jobs at the slow fallback interval, and it returns to
+    normal polling whenever the queue cannot be read.
+    """
+
+    def __init__(self, poller, queue_url: str):
+        self.poller = poller
+        self.queue_url = queue_url
+        self.sqs_client = boto3.client('sqs',
+                                       aws_access_key_id=settings.aws_access_key_id,
+                                       aws_secret_access_key=settings.aws_secret_access_key,
+                                       region_name=settings.aws_default_region,
+                                       endpoint_url=settings.sqs_endpoint_url,
+                                       config=aws_executor.client_config('sqs'))
+        self._task: Optional[asyncio.Task] = None
+        self.events_received = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.poller.events_enabled = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_url": self.queue_url,
+            "running": self._task is not None and not self._task.done(),
+            "events_received": self.events_received
+        }
+
+    async def _run(self):
+        retry_delay = 1
+        while True:
+            try:
+                response = await aws_executor.run(
+                    "sqs",
+                    self.sqs_client.receive_message,
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=20,
+                    AttributeNames=["ApproximateReceiveCount"]
+                )
+                self.poller.events_enabled = True
+                retry_delay = 1
+                for message in response.get("Messages", []):
+                    await self._handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Fall back to regular polling until the queue is readable again
+                logger.warning("Reading Transcribe events from SQS failed: %s", e)
+                self.poller.events_enabled = False
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+
+    async def _handle_message(self, message: Dict[str, Any]):
+        event = parse_job_state_change(message["Body"])
+        if event is not None and event["status"] in FINAL_STATUSES:
+            self.events_received += 1
+            if self.poller.is_waiting_for(event["job_name"]):
+                self.poller.notify(event["job_name"])
+            elif event["job_name"].startswith(JOB_NAME_PREFIX):
+                receive_count = int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1))
+                if receive_count < settings.transcribe_events_max_receives:
+                    # Probably another worker's job: let it see the message soon
+                    await aws_executor.run(
+                        "sqs",
+                        self.sqs_client.change_message_visibility,
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                        VisibilityTimeout=2
+                    )
+                    return
+
+        await aws_executor.run(
+            "sqs",
+            self.sqs_client.delete_message,
+            QueueUrl=self.queue_url,
+            ReceiptHandle=message["ReceiptHandle"]
+        )
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+from config import settings
+from helper.aws_executor import aws_executor
+from helper.resilience import CircuitOpenError, classify_error
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME_PREFIX = "clinical-transcribe-"
+
+# Rough bytes per second of audio, used to guess how long Transcribe will take
+AUDIO_BYTES_PER_SECOND = {
+    "wav": 88200,    # 16-bit mono 44.1 kHz
+    "flac": 48000,
+    "mp3": 16000,    # 128 kbps
+    "ogg": 12000,
+    "aac": 16000,
+}
+
+def estimate_audio_duration(size: Optional[int], media_format: str) -> Optional[float]:
+    """Estimated audio length in seconds from file size and format"""
+    if not size:
+        return None
+    return size / AUDIO_BYTES_PER_SECOND.get(media_format, 16000)
+
+class _PendingJob:
+    def __init__(self, future: asyncio.Future, first_check: float, interval: float, deadline: float):
+        self.future = future
+        self.next_check = first_check
+        self.interval = interval
+        self.deadline = deadline
+
+class TranscribeJobPoller:
+    """One background task per process that watches every pending Transcribe job.
+
+    Instead of each request calling get_transcription_job every 2 seconds,
+    callers await wait_for_job() and this poller decides when each job is
+    worth checking: the first check is scheduled from the expected audio
+    duration, later checks back off exponentially. When several jobs are due
+    at once, one list_transcription_jobs call per status tells which of them
+    are still running, and get_transcription_job is only called for jobs that
+    have left the queue.
+
+    When a TranscribeEventListener is feeding job state-change events,
+    events_enabled is set and polling drops to a slow safety net.
+    """
+
+    def __init__(self, transcribe_client):
+        self.transcribe_client = transcribe_client
+        self._pending: Dict[str, _PendingJob] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.api_calls = 0
+        self.events_enabled = False
+
+    async def wait_for_job(self, job_name: str, expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until the job completes and return its TranscriptionJob description"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        min_interval, max_interval = self._interval_bounds()
+        first_delay = min_interval
+        if expected_duration:
+            first_delay = max(first_delay, expected_duration * settings.transcribe_expected_speed_ratio)
+        pending = _PendingJob(
+            loop.create_future(),
+            now + min(first_delay, max_interval),
+            min_interval,
+            now + settings.transcribe_job_timeout_seconds
+        )
+        self._pending[job_name] = pending
+        self._ensure_running()
+        try:
+            return await pending.future
+        finally:
+            self._pending.pop(job_name, None)
+
+    def is_waiting_for(self, job_name: str) -> bool:
+        return job_name in self._pending
+
+    def notify(self, job_name: str):
+        """Check a job on the next loop iteration (e.g. after a state-change event)"""
+        pending = self._pending.get(job_name)
+        if pending is not None:
+            pending.next_check = time.monotonic()
+            self._wake()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_jobs": len(self._pending),
+            "api_calls": self.api_calls,
+            "events_enabled": self.events_enabled
+        }
+
+    def _interval_bounds(self):
+        if self.events_enabled:
+            fallback = settings.transcribe_events_fallback_interval
+            return fallback, max(fallback, settings.transcribe_poll_max_interval)
+        return settings.transcribe_poll_min_interval, settings.transcribe_poll_max_interval
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            active = [pending for pending in self._pending.values() if not pending.future.done()]
+            if not active:
+                break
+            now = time.monotonic()
+            next_check = min(pending.next_check for pending in active)
+            if next_check > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_check - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = [
+                name for name, pending in self._pending.items()
+                if pending.next_check <= now and not pending.future.done()
+            ]
+            try:
+                await self._check_jobs(due)
+            except Exception as e:
+                # Only the batched list call gets here; per-job errors are handled in _check_jobs
+                logger.warning("Transcribe status check failed: %s", e)
+                for name in due:
+                    self._back_off(name, factor=2)
+
+    async def _check_jobs(self, due: List[str]):
+        if len(due) >= settings.transcribe_poll_batch_threshold:
+            running = await self._list_running_jobs()
+        else:
+            running = set()
+
+        for name in due:
+            if name in running:
+                self._back_off(name)
+                continue
+            self.api_calls += 1
+            try:
+                response = await aws_executor.run(
+                    "transcribe",
+                    self.transcribe_client.get_transcription_job,
+                    TranscriptionJobName=name
+                )
+            except Exception as e:
+                self._check_failed(name, e)
+                continue
+            self._resolve(name, response["TranscriptionJob"])
+
+    def _check_failed(self, name: str, error: Exception):
+        """Back off a job after a throttled/transient error; fail its waiter on any other"""
+        if isinstance(error, CircuitOpenError) or classify_error(error) is not None:
+            logger.warning("Transcribe status check of %s failed: %s", name, error)
+            self._back_off(name, factor=2)
+            return
+        pending = self._pending.get(name)
+        if pending is not None and not pending.future.done():
+            pending.future.set_exception(Exception(f"Transcription job status error: {str(error)}"))
+
+    async def _list_running_jobs(self) -> Set[str]:
+        """Names of our jobs that are still queued or in progress"""
+        running = set()
+        for status in ("QUEUED", "IN_PROGRESS"):
+            kwargs = {"Status": status, "JobNameContains": JOB_NAME_PREFIX, "MaxResults": 100}
+            while True:
+                self.api_calls += 1
+                response = await aws_executor.run(
+                    "transcribe",
+                    self.transcribe_client.list_transcription_jobs,
+                    **kwargs
+                )
+                running.update(job["TranscriptionJobName"] for job in response.get("TranscriptionJobSummaries", []))
+                if not response.get("NextToken"):
+                    break
+                kwargs["NextToken"] = response["NextToken"]
+        return running
+
+    def _resolve(self, name: str, job: Dict[str, Any]):
+        pending = self._pending.get(name)
+        if pending is None or pending.future.done():
+            return
+        status = job["TranscriptionJobStatus"]
+        if status == "COMPLETED":
+            pending.future.set_result(job)
+        elif status == "FAILED":
+            pending.future.set_exception(
+                Exception(f"Transcription job failed: {job.get('FailureReason', 'unknown reason')}")
+            )
+        else:
+            self._back_off(name)
+
+    def _back_off(self, name: str, factor: float = None):
+        pending = self._pending.get(name)
+        if pending is None or pending.future.done():
+            return
+        now = time.monotonic()
+        if now >= pending.deadline:
+            pending.future.set_exception(TimeoutError(f"Transcription job {name} timed out"))
+            return
+        min_interval, max_interval = self._interval_bounds()
+        pending.interval = min(
+            max(pending.interval * (factor or settings.transcribe_poll_backoff), min_interval),
+            max_interval
+        )
+        pending.next_check = now + pending.interval
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from config import settings
+from database import SessionLocal
+from models import TranscriptionFile
+
+logger = logging.getLogger(__name__)
+
+class TranscriptCache:
+    """Content-addressed transcript cache in the transcription_files table.
+
+    Recordings are identified by the SHA-256 of their bytes, computed while
+    they stream to S3. A hit returns the stored transcript instead of running
+    another Transcribe job. Database problems are counted and treated as a
+    miss so they never fail a transcription.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = settings.transcript_cache_enabled if enabled is None else enabled
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def lookup(self, audio_sha256: Optional[str]) -> Optional[str]:
+        if not self.enabled or not audio_sha256:
+            return None
+        try:
+            transcript = await asyncio.to_thread(self._lookup, audio_sha256)
+        except Exception as e:
+            logger.warning("Transcript cache lookup failed: %s", e)
+            self.errors += 1
+            transcript = None
+        if transcript is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return transcript
+
+    async def store(self, audio_sha256: Optional[str], uploaded: Dict[str, Any], transcript: str, patient_id: str = None):
+        if not self.enabled or not audio_sha256:
+            return
+        try:
+            await asyncio.to_thread(self._store, audio_sha256, uploaded, transcript, patient_id)
+        except Exception as e:
+            logger.warning("Transcript cache store failed: %s", e)
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _lookup(self, audio_sha256: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(TranscriptionFile.transcription_text)
+                .filter(TranscriptionFile.audio_sha256 == audio_sha256, TranscriptionFile.processed.is_(True))
+                .first()
+            )
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    def _store(self, audio_sha256: str, uploaded: Dict[str, Any], transcript: str, patient_id: str = None):
+        db = SessionLocal()
+        try:
+            db.add(TranscriptionFile(
+                filename=uploaded["s3_key"],
+                content_type=uploaded.get("content_type") or "application/octet-stream",
+                size=uploaded.get("size") or 0,
+                transcription_text=transcript,
+                patient_id=patient_id,
+                processed=True,
+                audio_sha256=audio_sha256
+            ))
+            db.commit()
+        finally:
+            db.close()
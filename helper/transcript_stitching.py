@@ -0,0 +1,152 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+def _speaker_by_start_time(results: Dict[str, Any]) -> Dict[str, str]:
+    """Map item start_time -> speaker label from speaker_labels.segments"""
+    speakers = {}
+    for segment in results.get("speaker_labels", {}).get("segments", []):
+        for item in segment.get("items", []):
+            speakers[item["start_time"]] = item.get("speaker_label", segment.get("speaker_label"))
+    return speakers
+
+def _chunk_words(transcript_data: Dict[str, Any], offset: float) -> List[Dict[str, Any]]:
+    """Items of one chunk with absolute times and speaker labels.
+
+    Punctuation items carry no timing; they inherit the time and speaker of
+    the word before them so they stay attached to it when cutting.
+    """
+    results = transcript_data["results"]
+    speakers = _speaker_by_start_time(results)
+    words = []
+    for item in results.get("items", []):
+        alternative = item["alternatives"][0]
+        if item.get("type") == "punctuation":
+            if words:
+                words.append({**words[-1], "content": alternative["content"], "type": "punctuation"})
+            continue
+        start = float(item["start_time"])
+        words.append({
+            "content": alternative["content"],
+            "confidence": alternative.get("confidence"),
+            "type": "pronunciation",
+            "start": start + offset,
+            "end": float(item["end_time"]) + offset,
+            "speaker": item.get("speaker_label") or speakers.get(item["start_time"])
+        })
+    return words
+
+def _match_speakers(previous: List[Dict[str, Any]], current: List[Dict[str, Any]], known: List[str]) -> Dict[str, str]:
+    """Map the current chunk's speaker labels onto the labels used so far.
+
+    `previous` holds the previous chunk's words, already relabelled with the
+    global labels, and `known` every global label assigned so far.
+
+    Words both chunks transcribed in their overlap are paired by content and
+    start time; each local label takes the global label it co-occurs with
+    most often. Labels with no evidence take a previously seen speaker that
+    is not matched yet, or a new label when every known speaker is taken.
+    """
+    votes = Counter()
+    by_content = {}
+    for word in previous:
+        if word["type"] == "pronunciation" and word["speaker"]:
+            by_content.setdefault(word["content"].lower(), []).append(word)
+    for word in current:
+        if word["type"] != "pronunciation" or not word["speaker"]:
+            continue
+        for candidate in by_content.get(word["content"].lower(), []):
+            if abs(candidate["start"] - word["start"]) <= 0.3:
+                votes[(word["speaker"], candidate["speaker"])] += 1
+                break
+
+    local_mapping = {}
+    used = set()
+    for (local, global_label), _ in votes.most_common():
+        if local not in local_mapping and global_label not in used:
+            local_mapping[local] = global_label
+            used.add(global_label)
+
+    for word in current:
+        local = word["speaker"]
+        if local and local not in local_mapping:
+            free = [label for label in known if label not in used]
+            if free:
+                label = free[0]
+            else:
+                index = 0
+                while f"spk_{index}" in used or f"spk_{index}" in known:
+                    index += 1
+                label = f"spk_{index}"
+            local_mapping[local] = label
+            used.add(label)
+    return local_mapping
+
+def stitch_transcripts(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge per-chunk Transcribe results into one Transcribe-shaped result.
+
+    `chunks` are dicts with the chunk plan from audio_processing.plan_chunks
+    ("start", "keep_from", "keep_until") plus "transcript" (the Transcribe
+    JSON). Each word is taken from the chunk whose keep range contains its
+    midpoint, times are shifted onto the full recording and speaker labels
+    are made consistent across chunk boundaries.
+    """
+    items = []
+    previous_words: List[Dict[str, Any]] = []
+    known: List[str] = []
+    for index, chunk in enumerate(chunks):
+        words = _chunk_words(chunk["transcript"], chunk["start"])
+        if index == 0:
+            chunk_mapping = {word["speaker"]: word["speaker"] for word in words if word["speaker"]}
+        else:
+            chunk_mapping = _match_speakers(previous_words, words, known)
+        known = sorted(set(known) | set(chunk_mapping.values()))
+        for word in words:
+            midpoint = (word["start"] + word["end"]) / 2
+            if chunk["keep_from"] <= midpoint < chunk["keep_until"] or (
+                midpoint == chunk["keep_until"] and index == len(chunks) - 1
+            ):
+                items.append({**word, "speaker": chunk_mapping.get(word["speaker"], word["speaker"])})
+        previous_words = [{**word, "speaker": chunk_mapping.get(word["speaker"], word["speaker"])} for word in words]
+
+    return _to_transcribe_format(items)
+
+def _to_transcribe_format(words: List[Dict[str, Any]]) -> Dict[str, Any]:
+    text_parts: List[str] = []
+    items = []
+    segments = []
+    current: Optional[Dict[str, Any]] = None
+    for word in words:
+        if word["type"] == "punctuation":
+            text_parts.append(word["content"])
+            items.append({"type": "punctuation", "alternatives": [{"content": word["content"], "confidence": "0.0"}]})
+            continue
+
+        if text_parts:
+            text_parts.append(" ")
+        text_parts.append(word["content"])
+        start_time, end_time = f"{word['start']:.3f}", f"{word['end']:.3f}"
+        item = {
+            "type": "pronunciation",
+            "start_time": start_time,
+            "end_time": end_time,
+            "alternatives": [{"content": word["content"], "confidence": word["confidence"]}]
+        }
+        if word["speaker"]:
+            item["speaker_label"] = word["speaker"]
+            if current is None or current["speaker_label"] != word["speaker"]:
+                current = {"speaker_label": word["speaker"], "start_time": start_time, "end_time": end_time, "items": []}
+                segments.append(current)
+            current["end_time"] = end_time
+            current["items"].append({"speaker_label": word["speaker"], "start_time": start_time, "end_time": end_time})
+        items.append(item)
+
+    results = {
+        "transcripts": [{"transcript": "".join(text_parts)}],
+        "items": items
+    }
+    if segments:
+        results["speaker_labels"] = {
+            "speakers": len({segment["speaker_label"] for segment in segments}),
+            "segments": segments
+        }
+    return {"results": results}
@@ -1,11 +1,21 @@
-from fastapi import FastAPI,APIRouter, Request, Depends, HTTPException, Response, UploadFile, File
+from fastapi import FastAPI,APIRouter, Request, Depends, HTTPException, Response, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
 import helper.constant as constants
 import os
 from helper.trancribe_Service import TranscribeService
 from helper.comprehend_service import ComprehendService
-from model.clinical_model import ClinicalSummary, TranscriptionRequest
+from helper.job_service import JobService
+from helper.dictation_service import DictationService, STREAMING_ENCODINGS
+from helper.aws_executor import aws_executor
+from model.clinical_model import (
+    ClinicalSummary, CompleteUploadRequest, JobStatus, PresignUploadRequest,
+    S3TranscriptionRequest, TranscriptionRequest
+)
+import asyncio
 import uuid
+import json
 from database import initial_db, get_db
 
 app = FastAPI()
@@ -21,12 +31,33 @@ app.add_middleware(
 
 transcribe_service = TranscribeService()
 comprehend_service = ComprehendService()
+job_service = JobService(transcribe_service, comprehend_service)
+dictation_service = DictationService(comprehend_service)
 
 # initialize db on startup
 # @app.on_event(event_type="startup")
 # def startup():
 #     initial_db()
 
+@app.on_event("startup")
+async def start_transcribe_events():
+    if transcribe_service.event_listener:
+        transcribe_service.event_listener.start()
+
+@app.on_event("startup")
+async def load_clinical_dictionaries():
+    # Builds the memory-mapped ICD-10/CPT indexes if the tables changed and loads the
+    # drug dictionary, fast-path lexicon and PHI name dictionary, off the event loop
+    await asyncio.to_thread(comprehend_service.coder.load)
+    await asyncio.to_thread(comprehend_service.medication_normalizer.load)
+    await asyncio.to_thread(comprehend_service.fast_extractor.load)
+    await asyncio.to_thread(comprehend_service.phi_scanner.load)
+
+@app.on_event("shutdown")
+async def stop_transcribe_events():
+    if transcribe_service.event_listener:
+        await transcribe_service.event_listener.stop()
+
 @app.get("/")
 async def index():
     return {"Status": "Ready"}
@@ -37,7 +68,22 @@ async def health_check():
     return {
         "status": "healthy", 
         "service": "medical-transcription",
-        "ai_model": model_info
+        "ai_model": model_info,
+        "aws_io": aws_executor.stats(),
+        "transcribe_poller": transcribe_service.poller.stats(),
+        "transcript_cache": transcribe_service.transcript_cache.stats(),
+        "analysis_cache": comprehend_service.analysis_cache.stats(),
+        "clinical_coding": comprehend_service.coder.stats(),
+        "medication_normalization": comprehend_service.medication_normalizer.stats(),
+        "fast_path": comprehend_service.fast_extractor.stats(),
+        "phi_redaction": comprehend_service.phi_scanner.stats(),
+        "bedrock_usage": comprehend_service.usage_stats(),
+        "single_flight": {
+            "analysis": comprehend_service.inflight.stats(),
+            "transcription": transcribe_service.inflight.stats()
+        },
+        "transcribe_events": transcribe_service.event_listener.stats() if transcribe_service.event_listener else None,
+        "dictation": dictation_service.stats()
     }
 
 @app.get("/model-info")
@@ -52,8 +98,9 @@ async def create_upload_file(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only audio files are allowed")
 
         # Process transcription
-        result = await transcribe_service.transcribe_audio(file)
-        return {"transcription": result, "status": "success"}
+        uploaded = await transcribe_service.upload_audio(file)
+        result = await transcribe_service.transcribe_uploaded(uploaded)
+        return {"transcription": result, "audio_processing": uploaded.get("preprocessing"), "status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
@@ -64,21 +111,36 @@ async def diagnose(request: TranscriptionRequest):
         analysis = await comprehend_service.analyze_medical_text(request.text)
         
         # Generate clinical summary
-        summary = ClinicalSummary(
-            patient_id=request.patient_id,
-            session_id=str(uuid.uuid4()),
-            original_text=request.text,
-            medical_entities=analysis.get("entities", []),
-            diagnoses=analysis.get("diagnoses", []),
-            medications=analysis.get("medications", []),
-            procedures=analysis.get("procedures", []),
-            clinical_summary=analysis.get("summary", ""),
-            confidence_score=analysis.get("confidence", 0.0)
-        )
+        summary = ClinicalSummary.from_analysis(request.patient_id, request.text, analysis)
         return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
     
+@app.post("/analyze/stream")
+async def diagnose_stream(request: TranscriptionRequest):
+    """
+    Server-Sent Events variant of /analyze. Emits `summary_delta` events while
+    the summary is generated, `entity` / `diagnosis` / `medication` /
+    `procedure` events as each item completes, and a final `complete` event
+    carrying the same ClinicalSummary /analyze returns.
+    """
+    patient_id = request.patient_id or f"patient_{uuid.uuid4().hex[:8]}"
+
+    async def events():
+        async for event, data in comprehend_service.stream_medical_analysis(request.text):
+            if event == "analysis":
+                event = "complete"
+                data = ClinicalSummary.from_analysis(patient_id, request.text, data).model_dump(mode="json")
+            elif event == "summary_delta":
+                data = {"text": data}
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/transcribe_and_analyze")
 async def transcribe_and_analyze(file: UploadFile = File(...), patient_id: str = None):
     try:
@@ -86,7 +148,8 @@ async def transcribe_and_analyze(file: UploadFile = File(...), patient_id: str =
             raise HTTPException(status_code=400, detail="Only audio files are allowed")
         
         # get audio
-        transcription = await transcribe_service.transcribe_audio(file)
+        uploaded = await transcribe_service.upload_audio(file)
+        transcription = await transcribe_service.transcribe_uploaded(uploaded, patient_id=patient_id)
 
         # analyze text
         conversation = TranscriptionRequest(
@@ -97,23 +160,14 @@ async def transcribe_and_analyze(file: UploadFile = File(...), patient_id: str =
         analysis = await comprehend_service.analyze_medical_text(conversation.text)
         
         # Step 3: Generate complete clinical summary
-        summary = ClinicalSummary(
-            patient_id=conversation.patient_id,
-            session_id=str(uuid.uuid4()),
-            original_text=transcription,
-            medical_entities=analysis.get("entities", []),
-            diagnoses=analysis.get("diagnoses", []),
-            medications=analysis.get("medications", []),
-            procedures=analysis.get("procedures", []),
-            clinical_summary=analysis.get("summary", ""),
-            confidence_score=analysis.get("confidence", 0.0)
-        )
+        summary = ClinicalSummary.from_analysis(conversation.patient_id, transcription, analysis)
         
         return {
             "transcription": transcription,
             "medical_entities": summary.medical_entities,
             "summary": summary.clinical_summary,
             "clinical_analysis": summary,
+            "audio_processing": uploaded.get("preprocessing"),
             "status": "success"
         }
     except Exception as e:
@@ -136,3 +190,103 @@ async def transcribe_endpoint(request: TranscriptionRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.post("/jobs/transcribe_and_analyze", status_code=202)
+async def submit_transcribe_and_analyze_job(file: UploadFile = File(...), patient_id: str = None):
+    """
+    Job-based variant of /transcribe_and_analyze: returns a job id as soon as the
+    audio is in S3, transcription and analysis continue in the background
+    """
+    if file.content_type not in constants.ALLOWED_AUDIO_TYPES:
+        raise HTTPException(status_code=400, detail="Only audio files are allowed")
+
+    job = job_service.create_job(patient_id=patient_id)
+    try:
+        job_service.start_stage(job, "upload", filename=file.filename)
+        uploaded = await transcribe_service.upload_audio(file)
+        job_service.complete_stage(
+            job, "upload", s3_key=uploaded["s3_key"], audio_processing=uploaded.get("preprocessing")
+        )
+    except Exception as e:
+        job_service.fail_job(job, str(e))
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    job_service.submit_transcription(job, uploaded)
+    return {"job_id": job.job_id, "status": job.status, "status_url": f"/jobs/{job.job_id}"}
+
+@app.post("/uploads/presign")
+async def presign_upload(request: PresignUploadRequest):
+    """
+    Presigned S3 URL(s) so the client uploads audio directly to the bucket.
+    Multipart uploads must be finished with /uploads/complete.
+    """
+    if request.content_type not in constants.ALLOWED_AUDIO_TYPES:
+        raise HTTPException(status_code=400, detail="Only audio files are allowed")
+    try:
+        audio_object = transcribe_service.new_audio_object(request.filename)
+        presigned = await transcribe_service.s3_service.presign_upload(
+            audio_object["s3_key"], request.content_type, request.size
+        )
+        return {**presigned, "media_format": audio_object["media_format"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Presigning failed: {str(e)}")
+
+@app.post("/uploads/complete")
+async def complete_upload(request: CompleteUploadRequest):
+    """Complete a presigned multipart upload"""
+    if not transcribe_service.s3_service.verify_upload_token(request.s3_key, request.upload_token):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload token for s3_key")
+    try:
+        await transcribe_service.s3_service.complete_multipart_upload(
+            request.s3_key,
+            request.upload_id,
+            [{"PartNumber": part.part_number, "ETag": part.etag} for part in request.parts]
+        )
+        return {"s3_key": request.s3_key, "status": "success"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Completing upload failed: {str(e)}")
+
+@app.post("/jobs/transcribe_from_s3", status_code=202)
+async def submit_s3_transcription_job(request: S3TranscriptionRequest):
+    """Start transcription and analysis of audio already uploaded through /uploads/presign"""
+    # Only keys this client got from /uploads/presign, not e.g. other callers' temporary objects
+    if not transcribe_service.s3_service.verify_upload_token(request.s3_key, request.upload_token):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload token for s3_key")
+    size = await transcribe_service.s3_service.object_size(request.s3_key)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Audio object not found")
+
+    uploaded = transcribe_service.new_audio_object(request.s3_key)
+    uploaded["s3_key"] = request.s3_key
+    uploaded["size"] = size
+    job = job_service.create_job(patient_id=request.patient_id, stages=["transcribe", "analyze"])
+    job_service.submit_transcription(job, uploaded)
+    return {"job_id": job.job_id, "status": job.status, "status_url": f"/jobs/{job.job_id}"}
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Status, per-stage progress and (once completed) the clinical summary of a job"""
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.websocket("/ws/dictation")
+async def dictation(websocket: WebSocket, encoding: str = "pcm", sample_rate: int = 16000):
+    """
+    Live dictation: binary audio frames in, partial/final transcript segments
+    and per-segment clinical analysis out (see helper/dictation_service.py)
+    """
+    await websocket.accept()
+    if encoding not in STREAMING_ENCODINGS:
+        await websocket.send_json({"type": "error", "detail": f"Unsupported encoding: {encoding}"})
+        await websocket.close(code=1003)
+        return
+    try:
+        await dictation_service.run_session(websocket, media_encoding=encoding, sample_rate=sample_rate)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.send_json({"type": "error", "detail": f"Dictation failed: {str(e)}"})
+            await websocket.close(code=1011)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Dict, Any
 from datetime import datetime
+import uuid
+from helper.constant import TRANSCRIBE_MAX_MEDIA_SIZE
 
 class TranscriptionRequest(BaseModel):
     text: str
@@ -15,9 +17,15 @@ class MedicalEntity(BaseModel):
     begin_offset: int
     end_offset: int
 
+class CodeMatch(BaseModel):
+    code: str
+    description: str
+    score: float
+
 class Diagnosis(BaseModel):
     name: str
     icd10_code: Optional[str] = None
+    icd10_candidates: List[CodeMatch] = []
     confidence: float
 
 class Medication(BaseModel):
@@ -25,12 +33,38 @@ class Medication(BaseModel):
     dosage: Optional[str] = None
     frequency: Optional[str] = None
     confidence: float
+    # Filled by helper/medication_normalizer.py
+    rxcui: Optional[str] = None
+    normalized_name: Optional[str] = None
+    dose_value: Optional[float] = None
+    dose_unit: Optional[str] = None
+    route: Optional[str] = None
+    frequency_code: Optional[str] = None
+    doses_per_day: Optional[float] = None
+    as_needed: Optional[bool] = None
 
 class Procedure(BaseModel):
     name: str
     cpt_code: Optional[str] = None
+    cpt_candidates: List[CodeMatch] = []
     confidence: float
 
+# Compact tool output generated by the model and expanded by helper/analysis_expansion.py;
+# the docstrings and field descriptions below are part of the tool schema the model sees
+class CompactEntity(BaseModel):
+    """A medical entity mentioned in the transcription"""
+    t: str = Field(description="entity text exactly as written in the transcription")
+    c: Literal["C", "M", "P", "S"] = Field(description="category: C condition, M medication, P procedure, S symptom")
+    y: Optional[str] = Field(None, description="specific type, omit when it adds nothing to the category")
+    p: float = Field(description="confidence 0-1")
+
+class CompactAnalysis(BaseModel):
+    """Clinical analysis of a medical transcription"""
+    e: List[CompactEntity] = Field(description="every medical entity, in order of appearance")
+    dx: List[int] = Field(description="indexes into e of the conditions that are diagnoses")
+    s: str = Field(description="concise clinical summary")
+    p: float = Field(description="overall confidence 0-1")
+
 class ClinicalSummary(BaseModel):
     patient_id: str
     session_id: str
@@ -42,8 +76,61 @@ class ClinicalSummary(BaseModel):
     procedures: List[Procedure]
     clinical_summary: str
     confidence_score: float
+
+    @classmethod
+    def from_analysis(cls, patient_id: str, text: str, analysis: Dict[str, Any]) -> "ClinicalSummary":
+        """Build a summary from the dict returned by ComprehendService"""
+        return cls(
+            patient_id=patient_id,
+            session_id=str(uuid.uuid4()),
+            original_text=text,
+            medical_entities=analysis.get("entities", []),
+            diagnoses=analysis.get("diagnoses", []),
+            medications=analysis.get("medications", []),
+            procedures=analysis.get("procedures", []),
+            clinical_summary=analysis.get("summary", ""),
+            confidence_score=analysis.get("confidence", 0.0)
+        )
     
     class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat()
-        }
\ No newline at end of file
+        }
+
+class JobStage(BaseModel):
+    name: str
+    status: str = "pending"  # pending | running | completed | failed
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    detail: Dict[str, Any] = {}
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str = "queued"  # queued | running | completed | failed
+    patient_id: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    stages: List[JobStage]
+    transcription: Optional[str] = None
+    result: Optional[ClinicalSummary] = None
+    error: Optional[str] = None
+
+class PresignUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: int = Field(gt=0, le=TRANSCRIBE_MAX_MEDIA_SIZE)  # bytes; signed into the upload URL(s)
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class CompleteUploadRequest(BaseModel):
+    s3_key: str
+    upload_token: str
+    upload_id: str
+    parts: List[UploadedPart]
+
+class S3TranscriptionRequest(BaseModel):
+    s3_key: str
+    upload_token: str
+    patient_id: Optional[str] = None
@@ -28,6 +28,7 @@ class ClinicalSummary(Base):
     procedures = Column(String, nullable=True)        # JSON string of procedures
     clinical_summary = Column(String, nullable=True)
     confidence_score = Column(Float, nullable=True)
+    analysis_version = Column(String, index=True, nullable=True)  # model:prompt version of the stored analysis
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class TranscriptionFile(Base):
@@ -39,4 +40,5 @@ class TranscriptionFile(Base):
     upload_date = Column(DateTime, default=datetime.utcnow)
     transcription_text = Column(String, nullable=True)
     patient_id = Column(String, index=True, nullable=True)
-    processed = Column(Boolean, default=False)
\ No newline at end of file
+    processed = Column(Boolean, default=False)
+    audio_sha256 = Column(String(64), index=True, nullable=True)  # transcript cache key
\ No newline at end of file
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Redact PHI in stored clinical summaries with the local PHI scanner
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+from database import SessionLocal
+from models import ClinicalSummary as ClinicalSummaryRow
+from helper.phi_scanner import PHIScanner, PLACEHOLDER_RE
+
+JSON_COLUMNS = ("diagnoses", "medications", "procedures")
+# Columns scrub_row may rewrite; their old values go to the backup file before any write
+SCRUBBED_COLUMNS = ("original_text", "medical_entities") + JSON_COLUMNS + ("clinical_summary",)
+
+def scrub_row(scanner: PHIScanner, row: ClinicalSummaryRow) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    """Update mapping with the row's PHI replaced by placeholders and the placeholder map, or None if it has none.
+
+    The transcript, entity texts and offsets, the item lists and the summary
+    share one placeholder map, so a name is the same "[NAME_1]" everywhere.
+    """
+    redaction = scanner.redact(row.original_text)
+    placeholders = redaction.placeholders
+
+    def redact(value: str) -> str:
+        return scanner.redact(value, placeholders).text
+
+    mapping = {"id": row.id, "original_text": redaction.text}
+    if row.medical_entities:
+        entities = json.loads(row.medical_entities)
+        for entity in entities:
+            begin, end = entity.get("begin_offset", 0), entity.get("end_offset", 0)
+            if end > begin and row.original_text[begin:end] == entity.get("text"):
+                entity["begin_offset"] = redaction.to_redacted(begin)
+                entity["end_offset"] = redaction.to_redacted(end)
+                entity["text"] = redaction.text[entity["begin_offset"]:entity["end_offset"]]
+            else:
+                entity["text"] = redact(entity.get("text", ""))
+        mapping["medical_entities"] = json.dumps(entities)
+    for column in JSON_COLUMNS:
+        value = getattr(row, column)
+        if value:
+            items = json.loads(value)
+            for item in items:
+                for key, field in item.items():
+                    if isinstance(field, str):
+                        item[key] = redact(field)
+            mapping[column] = json.dumps(items)
+    if row.clinical_summary:
+        mapping["clinical_summary"] = redact(row.clinical_summary)
+    # Values found only in the derived fields were added to the shared map too
+    if not placeholders:
+        return None
+    return mapping, placeholders
+
+def restore(path: str, batch_size: int) -> int:
+    """Write the original values saved in a backup file back to their rows"""
+    restored = 0
+    db = SessionLocal()
+    try:
+        with open(path, encoding="utf-8") as backup:
+            mappings = []
+            for line in backup:
+                if line.strip():
+                    mappings.append(json.loads(line))
+                if len(mappings) >= batch_size:
+                    db.bulk_update_mappings(ClinicalSummaryRow, mappings)
+                    db.commit()
+                    restored += len(mappings)
+                    mappings = []
+            if mappings:
+                db.bulk_update_mappings(ClinicalSummaryRow, mappings)
+                db.commit()
+                restored += len(mappings)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Restore failed after {restored} rows: {str(e)}")
+        return 1
+    finally:
+        db.close()
+    print(f"Restored {restored} rows from {path}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace PHI in clinical_summaries rows with typed placeholders")
+    parser.add_argument("--apply", action="store_true", help="write the redacted rows (default: report only)")
+    parser.add_argument("--backup", help="new file the original values of rewritten rows are saved to (required with --apply)")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation before writing")
+    parser.add_argument("--restore", metavar="BACKUP", help="undo a scrub from its backup file and exit")
+    parser.add_argument("--limit", type=int, help="scan at most this many rows")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per page and per update")
+    args = parser.parse_args()
+
+    if args.restore:
+        return restore(args.restore, args.batch_size)
+    backup = None
+    if args.apply:
+        # The placeholder values are not stored, so the backup is the only way back
+        if not args.backup:
+            print("❌ --apply rewrites rows in place and needs --backup FILE to keep the original values")
+            return 1
+        if not args.yes:
+            answer = input(f"Replace PHI in clinical_summaries in place (originals saved to {args.backup})? Type 'scrub' to continue: ")
+            if answer.strip() != "scrub":
+                print("Aborted")
+                return 1
+        try:
+            backup = open(args.backup, "x", encoding="utf-8")
+        except OSError as e:
+            print(f"❌ Cannot create backup file: {str(e)}")
+            return 1
+
+    scanner = PHIScanner()
+    scanner.load()
+    counts = Counter()
+    kinds = Counter()
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while args.limit is None or counts["scanned"] < args.limit:
+            size = args.batch_size if args.limit is None else min(args.batch_size, args.limit - counts["scanned"])
+            rows = (
+                db.query(ClinicalSummaryRow)
+                .filter(ClinicalSummaryRow.id > last_id)
+                .order_by(ClinicalSummaryRow.id)
+                .limit(size)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+            mappings = []
+            for row in rows:
+                counts["scanned"] += 1
+                scrubbed = scrub_row(scanner, row)
+                if scrubbed is None:
+                    continue
+                mapping, placeholders = scrubbed
+                counts["with_phi"] += 1
+                kinds.update(PLACEHOLDER_RE.fullmatch(placeholder).group(1) for placeholder in placeholders.values())
+                mappings.append(mapping)
+            if args.apply and mappings:
+                originals = {row.id: row for row in rows}
+                for mapping in mappings:
+                    row = originals[mapping["id"]]
+                    saved = {"id": row.id, **{column: getattr(row, column) for column in SCRUBBED_COLUMNS}}
+                    backup.write(json.dumps(saved) + "\n")
+                backup.flush()
+                os.fsync(backup.fileno())
+                db.bulk_update_mappings(ClinicalSummaryRow, mappings)
+                db.commit()
+                counts["updated"] += len(mappings)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ PHI scrub failed: {str(e)}")
+        return 1
+    finally:
+        db.close()
+        if backup is not None:
+            backup.close()
+
+    print(f"Scanned {counts['scanned']} rows, {counts['with_phi']} with PHI"
+          + (f", updated {counts['updated']} (originals in {args.backup})" if args.apply
+             else " (dry run, rerun with --apply --backup FILE to write)"))
+    for kind, count in sorted(kinds.items()):
+        print(f"  {kind}: {count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time; give the required ones harmless values and keep
+# caches and indexes out of the working tree. Data paths are relative, so run pytest from
+# the repo root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="clinical-tests-")
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "S3_BUCKET_NAME": "test-bucket",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "test",
+    "DB_USERNAME": "test",
+    "DB_PASSWORD": "test",
+    "ANALYSIS_CACHE_PATH": os.path.join(SCRATCH, "analysis_cache.sqlite3"),
+    "CODE_INDEX_DIR": os.path.join(SCRATCH, "code_index"),
+    "BATCH_CHECKPOINT_DIR": os.path.join(SCRATCH, "batch"),
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, ROOT)
@@ -0,0 +1,49 @@
+from helper.analysis_expansion import EntityLocator, align_entities
+
+TEXT = "Chest pain since Monday.\nChest  pain worse on exertion; X-ray ordered. Has headaches and nausia, BP 140 / 90."
+
+def located(locator, mention):
+    begin, end = locator.locate(mention)
+    return TEXT[begin:end]
+
+def test_locate_ignores_case_whitespace_and_punctuation():
+    locator = EntityLocator(TEXT)
+    assert located(locator, "chest pain") == "Chest pain"
+    assert located(locator, "x ray") == "X-ray"
+    assert located(locator, "140/90") == "140 / 90"
+
+def test_repeated_mentions_map_to_successive_occurrences():
+    locator = EntityLocator(TEXT)
+    first = locator.locate("chest pain")
+    second = locator.locate("chest pain")
+    assert first == (0, 10)
+    assert TEXT[second[0]:second[1]] == "Chest  pain" and second[0] > first[0]
+    # Every occurrence is taken; a third mention reuses one rather than failing
+    assert locator.locate("chest pain") in (first, second)
+
+def test_locate_falls_back_to_near_matches():
+    locator = EntityLocator(TEXT)
+    assert located(locator, "headache") == "headaches"
+    assert located(locator, "nausea") == "nausia"
+    assert locator.locate("pneumothorax") == (0, 0)
+    assert locator.locate("") == (0, 0)
+
+def test_claim_accepts_only_free_whole_token_spans():
+    locator = EntityLocator(TEXT)
+    assert locator.claim(0, 10)
+    assert not locator.claim(0, 10)
+    assert not locator.claim(1, 10)
+    # The claimed occurrence is skipped by later lookups
+    assert located(locator, "chest pain") == "Chest  pain"
+
+def test_align_entities_keeps_placed_entities_and_relocates_the_rest():
+    second = TEXT.index("Chest  pain")
+    analysis = {"entities": [
+        {"text": "chest pain", "begin_offset": second, "end_offset": second + len("Chest  pain")},
+        {"text": "chest pain", "begin_offset": 0, "end_offset": 0},
+        {"text": "X-ray", "begin_offset": 3, "end_offset": 9},
+    ]}
+    entities = align_entities(analysis, TEXT)["entities"]
+    assert [(entity["begin_offset"], entity["end_offset"]) for entity in entities] == [
+        (second, second + len("Chest  pain")), (0, 10), (TEXT.index("X-ray"), TEXT.index("X-ray") + 5)
+    ]
@@ -0,0 +1,179 @@
+import asyncio
+import io
+import json
+import pytest
+from botocore.exceptions import ClientError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import helper.batch_analysis as batch_analysis
+import models
+from config import settings
+from helper.batch_analysis import BatchAnalysisService
+from helper.comprehend_service import ComprehendService
+
+TEXTS = [
+    "Patient reports chest pain since this morning.",
+    "Follow-up for hypertension, blood pressure 150/95 today.",
+    "Complains of headache and nausea for two days.",
+]
+
+class FakeS3:
+    """In-memory stand-in for the S3 calls the batch service makes"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        return {"Contents": [{"Key": key} for key in sorted(self.objects) if key.startswith(Prefix)], "IsTruncated": False}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+class FakeBedrock:
+    """Batch jobs that finish after `polls` status checks, answering every record from its input"""
+
+    def __init__(self, s3: FakeS3, polls: int = 1):
+        self.s3 = s3
+        self.polls = polls
+        self.jobs = {}
+        self.quota_full = False
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        if self.quota_full:
+            raise ClientError({"Error": {"Code": "ServiceQuotaExceededException", "Message": "quota"}}, "CreateModelInvocationJob")
+        arn = f"arn:aws:bedrock:us-east-1:0:model-invocation-job/{jobName}"
+        self.jobs[arn] = {
+            "input": inputDataConfig["s3InputDataConfig"]["s3Uri"],
+            "output": outputDataConfig["s3OutputDataConfig"]["s3Uri"],
+            "polls": 0,
+            "status": "InProgress"
+        }
+        return {"jobArn": arn}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        job = self.jobs[jobIdentifier]
+        job["polls"] += 1
+        if job["status"] == "InProgress" and job["polls"] >= self.polls:
+            self.complete(jobIdentifier)
+        return {"status": job["status"]}
+
+    def complete(self, arn: str):
+        job = self.jobs[arn]
+        prefix = f"s3://{settings.s3_bucket_name}/"
+        lines = []
+        for line in self.s3.objects[job["input"][len(prefix):]].decode("utf-8").splitlines():
+            record = json.loads(line)
+            text = record["modelInput"]["messages"][0]["content"][0]["text"]
+            term = next(term for term in ("chest pain", "hypertension", "headache") if term in text)
+            output = {"e": [{"t": term, "c": "S", "p": 0.9}], "dx": [], "s": f"Batch summary: {term}", "p": 0.9}
+            lines.append(json.dumps({
+                "recordId": record["recordId"],
+                "modelInput": record["modelInput"],
+                "modelOutput": {"output": {"message": {"content": [{"toolUse": {"toolUseId": "1", "name": "a", "input": output}}]}}}
+            }))
+        self.s3.objects[f"{job['output'][len(prefix):]}job/input.jsonl.out"] = ("\n".join(lines) + "\n").encode("utf-8")
+        job["status"] = "Completed"
+
+@pytest.fixture(scope="module")
+def comprehend_service():
+    return ComprehendService()
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'clinical.sqlite3'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    for index, text in enumerate(TEXTS, start=1):
+        db.add(models.ClinicalSummary(id=index, patient_id="p1", session_id=f"s{index}", original_text=text))
+    db.commit()
+    db.close()
+    monkeypatch.setattr(batch_analysis, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def batch_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "batch_checkpoint_dir", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(settings, "batch_role_arn", "arn:aws:iam::0:role/batch")
+    monkeypatch.setattr(settings, "batch_job_min_records", 1)
+    monkeypatch.setattr(settings, "batch_job_max_records", 2)
+    monkeypatch.setattr(settings, "batch_poll_interval", 0.0)
+
+@pytest.fixture
+def fakes():
+    s3 = FakeS3()
+    return s3, FakeBedrock(s3, polls=2)
+
+def make_service(comprehend_service, fakes) -> BatchAnalysisService:
+    service = BatchAnalysisService(comprehend_service)
+    service.s3_service.s3_client, service.bedrock_client = fakes
+    return service
+
+def stored_rows(session_factory):
+    db = session_factory()
+    try:
+        return {row.id: row for row in db.query(models.ClinicalSummary).order_by(models.ClinicalSummary.id)}
+    finally:
+        db.close()
+
+def test_run_plans_exports_submits_and_merges(comprehend_service, session_factory, batch_settings, fakes):
+    service = make_service(comprehend_service, fakes)
+    state = asyncio.run(service.run("full"))
+
+    assert [part["records"] for part in state["parts"]] == [2, 1]
+    assert all(part["status"] == "merged" and part["merged"] == part["records"] for part in state["parts"])
+    assert len(fakes[1].jobs) == 2
+    exported = fakes[0].objects["batch-analysis/full/input/part-00001.jsonl"].decode("utf-8").splitlines()
+    assert [json.loads(line)["recordId"].split("-")[0] for line in exported] == ["1", "2"]
+
+    rows = stored_rows(session_factory)
+    assert all(row.analysis_version == service.version for row in rows.values())
+    assert rows[1].clinical_summary == "Batch summary: chest pain"
+    entity = json.loads(rows[1].medical_entities)[0]
+    assert TEXTS[0][entity["begin_offset"]:entity["end_offset"]] == "chest pain"
+    assert service.load_checkpoint("full")["parts"] == state["parts"]
+
+def test_run_resumes_from_checkpoint(comprehend_service, session_factory, batch_settings, fakes):
+    first = make_service(comprehend_service, fakes)
+    state = asyncio.run(first.run("resume", wait=False))
+    assert [part["status"] for part in state["parts"]] == ["submitted", "submitted"]
+
+    # A new process picks the run up from its checkpoint without planning or submitting again
+    second = make_service(comprehend_service, fakes)
+    state = asyncio.run(second.run("resume"))
+    assert [part["status"] for part in state["parts"]] == ["merged", "merged"]
+    assert len(fakes[1].jobs) == 2
+    assert all(row.analysis_version == second.version for row in stored_rows(session_factory).values())
+
+def test_waits_for_quota_before_submitting(comprehend_service, session_factory, batch_settings, fakes):
+    fakes[1].quota_full = True
+    service = make_service(comprehend_service, fakes)
+    state = asyncio.run(service.run("quota", wait=False))
+    assert [part["status"] for part in state["parts"]] == ["exported", "exported"]
+
+    fakes[1].quota_full = False
+    state = asyncio.run(service.run("quota"))
+    assert [part["status"] for part in state["parts"]] == ["merged", "merged"]
+
+def test_row_edited_after_export_stays_pending(comprehend_service, session_factory, batch_settings, fakes):
+    service = make_service(comprehend_service, fakes)
+    asyncio.run(service.run("stale", wait=False))
+
+    db = session_factory()
+    db.query(models.ClinicalSummary).filter(models.ClinicalSummary.id == 2).update(
+        {"original_text": "Follow-up for hypertension, now 130/85 on lisinopril."}
+    )
+    db.commit()
+    db.close()
+
+    state = asyncio.run(service.run("stale"))
+    first = state["parts"][0]
+    assert (first["merged"], first["stale"]) == (1, 1)
+    rows = stored_rows(session_factory)
+    assert rows[2].analysis_version is None and rows[2].clinical_summary is None
+    assert rows[1].analysis_version == service.version
+    # The edited row is picked up by the next run
+    assert service._pending_ids() == [2]
@@ -0,0 +1,68 @@
+import os
+import pytest
+from config import settings
+from helper.code_index import ClinicalCoder, CodeIndex, build_code_index, load_code_table, open_code_index
+
+TABLE = """# code<TAB>description<TAB>alternates
+E11.9\tType 2 diabetes mellitus without complications\ttype 2 diabetes
+I10\tEssential (primary) hypertension\thigh blood pressure
+I48.91\tUnspecified atrial fibrillation
+J18.9\tPneumonia, unspecified organism\tpneumonia
+R07.9\tChest pain, unspecified
+R51.9\tHeadache, unspecified
+"""
+
+@pytest.fixture
+def table(tmp_path):
+    path = tmp_path / "icd10.tsv"
+    path.write_text(TABLE, encoding="utf-8")
+    return str(path)
+
+@pytest.fixture
+def index(table, tmp_path):
+    path = str(tmp_path / "icd10.idx")
+    build_code_index(load_code_table(table), path)
+    return CodeIndex(path)
+
+def top_code(index, *tokens):
+    results = index.search(tokens, 3)
+    return results[0]["code"] if results else None
+
+def test_lookup_finds_exact_codes_only(index):
+    assert index.entry_count == 6
+    assert index.lookup("I10") == "Essential (primary) hypertension"
+    assert index.lookup("I1") is None
+
+def test_search_ranks_descriptions_and_alternates(index):
+    assert top_code(index, "chest", "pain") == "R07.9"
+    assert top_code(index, "high", "blood", "pressur") == "I10"
+    assert index.search(("chest", "pain"), 3)[0]["score"] == 1.0
+
+def test_search_tolerates_truncated_and_misspelled_words(index):
+    assert top_code(index, "pneumon") == "J18.9"
+    assert top_code(index, "atrial", "fibrilation") == "I48.91"
+    assert top_code(index, "zzzz") is None
+
+def test_index_is_rebuilt_when_the_table_changes(table, tmp_path):
+    path = str(tmp_path / "icd10.idx")
+    assert open_code_index(table, path).lookup("Z00.00") is None
+
+    with open(table, "a", encoding="utf-8") as source:
+        source.write("Z00.00\tEncounter for general adult medical examination\n")
+    os.utime(table, (os.path.getmtime(path) + 10, os.path.getmtime(path) + 10))
+    assert open_code_index(table, path).lookup("Z00.00") == "Encounter for general adult medical examination"
+
+def test_coder_expands_abbreviations_and_fills_codes(table, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "icd10_codes_path", table)
+    monkeypatch.setattr(settings, "cpt_codes_path", str(tmp_path / "missing.tsv"))
+    monkeypatch.setattr(settings, "code_index_dir", str(tmp_path / "indexes"))
+    coder = ClinicalCoder()
+
+    analysis = coder.annotate({"diagnoses": [{"name": "HTN"}, {"name": "chest pains"}, {"name": "broken toaster"}], "procedures": [{"name": "ECG"}]})
+    diagnoses = analysis["diagnoses"]
+    assert [diagnosis.get("icd10_code") for diagnosis in diagnoses] == ["I10", "R07.9", None]
+    assert diagnoses[0]["icd10_candidates"][0]["description"] == "Essential (primary) hypertension"
+    assert diagnoses[2]["icd10_candidates"] == []
+    # No CPT table: procedures are left alone
+    assert analysis["procedures"] == [{"name": "ECG"}]
+    assert coder.stats()["coded"] == 2
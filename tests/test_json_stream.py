@@ -0,0 +1,44 @@
+import pytest
+from helper.json_stream import JsonStreamScanner, parse_partial_json
+
+DOCUMENT = '{"s": "Chest pain \\"sharp\\"\\u00e9", "e": [{"t": "chest pain", "c": "S"}, {"t": "aspirin", "c": "M"}], "p": 0.9}'
+
+def scan_in_pieces(text, size):
+    scanner = JsonStreamScanner(string_keys=["s"], array_keys=["e"])
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(scanner.feed(text[start:start + size]))
+    return scanner, events
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(DOCUMENT)])
+def test_scanner_reports_string_deltas_and_items_for_any_split(size):
+    scanner, events = scan_in_pieces(DOCUMENT, size)
+
+    assert "".join(text for kind, key, text in events if kind == "delta" and key == "s") == 'Chest pain "sharp"é'
+    assert [item for kind, key, item in events if kind == "item"] == [
+        {"t": "chest pain", "c": "S"}, {"t": "aspirin", "c": "M"}
+    ]
+    assert scanner.done
+
+def test_scanner_reports_items_as_soon_as_they_close():
+    scanner = JsonStreamScanner(array_keys=["e"])
+
+    assert scanner.feed('{"e": [{"t": "cough"}, {"t": "fev') == [("item", "e", {"t": "cough"})]
+    assert scanner.feed('er"}') == [("item", "e", {"t": "fever"})]
+
+def test_scanner_skips_fences_and_ignores_other_and_nested_keys():
+    scanner = JsonStreamScanner(string_keys=["s"], array_keys=["e"])
+    events = scanner.feed('```json\n{"x": {"s": "inner", "e": [{"a": 1}]}, "dx": [{"i": 0}], "s": "outer"}\n```{"s": "after"}')
+
+    assert events == [("delta", "s", "outer")]
+    assert scanner.done
+
+def test_parse_partial_json_closes_truncated_output():
+    assert parse_partial_json('Here you go: {"s": "summary", "e": [{"t": "cough", "c": "S"}, {"t": "fev') == {
+        "s": "summary", "e": [{"t": "cough", "c": "S"}]
+    }
+    assert parse_partial_json('```json\n{"p": 0.5}\n```') == {"p": 0.5}
+
+def test_parse_partial_json_without_an_object_raises():
+    with pytest.raises(ValueError):
+        parse_partial_json("no json here")
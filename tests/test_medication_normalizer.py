@@ -0,0 +1,48 @@
+import pytest
+from helper.medication_normalizer import parse_sig
+
+@pytest.mark.parametrize("text, expected", [
+    ("81mg PO daily", {
+        "dose_value": 81.0, "dose_unit": "mg", "dosage": "81mg", "route": "oral",
+        "frequency_code": "QD", "doses_per_day": 1.0, "frequency": "daily"
+    }),
+    ("metformin 500 mg by mouth twice a day", {
+        "dose_value": 500.0, "dose_unit": "mg", "dosage": "500 mg", "route": "oral",
+        "frequency_code": "BID", "doses_per_day": 2.0, "frequency": "twice a day"
+    }),
+    ("insulin 10 units subq at bedtime", {
+        "dose_value": 10.0, "dose_unit": "unit", "dosage": "10 units", "route": "subcutaneous",
+        "frequency_code": "QHS", "doses_per_day": 1.0, "frequency": "at bedtime"
+    }),
+    ("amoxicillin 250 mg/5 ml q8h", {
+        "dose_value": 250.0, "dose_unit": "mg", "dosage": "250 mg",
+        "frequency_code": "Q8H", "doses_per_day": 3.0, "frequency": "q8h"
+    }),
+    ("take one tablet three times a day", {
+        "dose_value": 1.0, "dose_unit": "tablet", "dosage": "one tablet",
+        "frequency_code": "TID", "doses_per_day": 3.0, "frequency": "three times a day"
+    }),
+    ("half tab every other day", {
+        "dose_value": 0.5, "dose_unit": "tablet", "dosage": "half tab",
+        "frequency_code": "QOD", "doses_per_day": 0.5, "frequency": "every other day"
+    }),
+])
+def test_parse_sig_reads_dose_route_and_frequency(text, expected):
+    assert parse_sig(text) == expected
+
+def test_parse_sig_reads_hour_intervals_and_prn():
+    sig = parse_sig("oxycodone 5 mg every 4-6 hours as needed for pain")
+    assert (sig["frequency_code"], sig["doses_per_day"]) == ("Q4H", 6.0)
+    assert sig["as_needed"] is True
+    assert sig["frequency"] == "every 4-6 hours as needed"
+
+def test_parse_sig_reads_concentrations_and_fractions():
+    assert parse_sig("lidocaine 2% topical")["dose_unit"] == "%"
+    assert parse_sig("10 mg/ml solution")["dose_unit"] == "mg/mL"
+    assert parse_sig("1/2 tab nightly")["dose_value"] == 0.5
+
+def test_parse_sig_returns_only_what_it_finds():
+    assert parse_sig("albuterol inhaler prn") == {"route": "inhalation", "as_needed": True, "frequency": "prn"}
+    assert parse_sig("continue current regimen") == {}
+    # A number without a unit is not a dose; a version number is not one either
+    assert "dose_value" not in parse_sig("seen 2 weeks ago, protocol v2.5mg")
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from botocore.exceptions import ClientError
+import helper.resilience as resilience
+from helper.resilience import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, UpstreamGuard
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Converse")
+
+class FakeClock:
+    # Rates in these tests are powers of two, so the token refill arithmetic stays exact
+    def __init__(self, now=1024.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.monotonic; asyncio.sleep in the module advances it instead of waiting"""
+    clock = FakeClock()
+
+    async def sleep(seconds):
+        clock.now += seconds
+
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    return clock
+
+def test_limiter_increases_additively_up_to_the_maximum():
+    limiter = AdaptiveRateLimiter(rate=5.0, max_rate=6.0, min_rate=0.5, increase=0.25, decrease=0.5)
+    limiter.on_success()
+    assert limiter.rate == 5.25
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == 6.0
+
+def test_limiter_decreases_multiplicatively_once_per_second(clock):
+    limiter = AdaptiveRateLimiter(rate=8.0, max_rate=50.0, min_rate=0.5, increase=0.25, decrease=0.5)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 4.0
+
+    clock.now += 1.0
+    limiter.on_throttle()
+    assert limiter.rate == 2.0
+    for _ in range(5):
+        clock.now += 1.0
+        limiter.on_throttle()
+    assert limiter.rate == 0.5
+
+def test_limiter_paces_acquires_to_the_rate(clock):
+    limiter = AdaptiveRateLimiter(rate=16.0, max_rate=50.0, min_rate=0.5, increase=0.25, decrease=0.5)
+
+    async def acquire_all():
+        for _ in range(5):
+            await limiter.acquire()
+
+    # One token is ready; the other four arrive at 16 per second
+    started = clock.now
+    asyncio.run(acquire_all())
+    assert clock.now - started == 0.25
+
+def test_guard_slows_down_and_retries_on_throttling(clock, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    limiter = AdaptiveRateLimiter(rate=8.0, max_rate=50.0, min_rate=0.5, increase=0.25, decrease=0.5)
+    guard = UpstreamGuard(limiter, CircuitBreaker(failure_threshold=3, reset_seconds=30.0), max_attempts=3, base_delay=0.125, max_delay=1.0)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise client_error("ThrottlingException")
+        return "ok"
+
+    assert asyncio.run(guard.call(flaky)) == "ok"
+    assert (guard.throttles, guard.retries) == (1, 1)
+    assert clock.now == 1024.25
+    assert limiter.rate == 4.25
+    assert guard.breaker.state == "closed"
+
+def test_guard_opens_the_circuit_after_repeated_failures(clock):
+    limiter = AdaptiveRateLimiter(rate=8.0, max_rate=8.0, min_rate=0.5, increase=0.25, decrease=0.5)
+    guard = UpstreamGuard(limiter, CircuitBreaker(failure_threshold=2, reset_seconds=30.0), max_attempts=1, base_delay=0.125, max_delay=1.0)
+
+    async def failing():
+        raise client_error("ServiceUnavailableException")
+
+    async def validation():
+        raise client_error("ValidationException")
+
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            asyncio.run(guard.call(failing))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(guard.call(failing))
+
+    # After the reset time one probe goes through; an answer from upstream closes the circuit
+    clock.now += 30.0
+    with pytest.raises(ClientError):
+        asyncio.run(guard.call(validation))
+    assert guard.breaker.state == "closed"
@@ -0,0 +1,69 @@
+import pytest
+from helper.audio_processing import plan_chunks
+from helper.transcript_stitching import stitch_transcripts
+
+def transcribe_result(words):
+    """Transcribe JSON for (content, start, end, speaker) words; start None marks punctuation"""
+    items = []
+    for content, start, end, speaker in words:
+        if start is None:
+            items.append({"type": "punctuation", "alternatives": [{"content": content, "confidence": "0.0"}]})
+        else:
+            items.append({
+                "type": "pronunciation",
+                "start_time": f"{start}",
+                "end_time": f"{end}",
+                "speaker_label": speaker,
+                "alternatives": [{"content": content, "confidence": "0.99"}]
+            })
+    return {"results": {"items": items}}
+
+def test_plan_chunks_cuts_in_the_nearest_silence():
+    chunks = plan_chunks(22.0, [(3.0, 3.5), (9.0, 9.4), (11.5, 12.5)], target_length=10.0, overlap=2.0)
+
+    assert [(chunk["keep_from"], chunk["keep_until"]) for chunk in chunks] == [(0.0, 9.2), (9.2, 22.0)]
+    assert (chunks[0]["start"], chunks[0]["end"]) == (0.0, 11.2)
+    assert (chunks[1]["start"], chunks[1]["end"]) == pytest.approx((7.2, 22.0))
+
+def test_plan_chunks_cuts_at_the_ideal_point_without_silence():
+    chunks = plan_chunks(22.0, [], target_length=10.0, overlap=2.0)
+
+    assert [(chunk["keep_from"], chunk["keep_until"]) for chunk in chunks] == [(0.0, 10.0), (10.0, 22.0)]
+
+def test_plan_chunks_keeps_short_recordings_whole():
+    assert plan_chunks(12.0, [], target_length=10.0, overlap=2.0) == [
+        {"start": 0.0, "end": 12.0, "keep_from": 0.0, "keep_until": 12.0}
+    ]
+
+def test_stitch_drops_overlap_duplicates_and_shifts_times():
+    chunks = [
+        {"start": 0.0, "keep_from": 0.0, "keep_until": 10.0, "transcript": transcribe_result([
+            ("hello", 1.0, 1.5, "spk_0"), ("doctor", 2.0, 2.5, "spk_0"), (".", None, None, None),
+            ("pain", 9.0, 9.4, "spk_1"), ("here", 11.0, 11.4, "spk_1"),
+        ])},
+        {"start": 8.0, "keep_from": 10.0, "keep_until": 20.0, "transcript": transcribe_result([
+            ("pain", 1.0, 1.4, "spk_1"), ("here", 3.0, 3.4, "spk_1"), ("thanks", 8.0, 8.5, "spk_0"),
+        ])},
+    ]
+    results = stitch_transcripts(chunks)["results"]
+
+    assert results["transcripts"][0]["transcript"] == "hello doctor. pain here thanks"
+    times = [(item["start_time"], item["end_time"]) for item in results["items"] if item["type"] == "pronunciation"]
+    assert times == [("1.000", "1.500"), ("2.000", "2.500"), ("9.000", "9.400"), ("11.000", "11.400"), ("16.000", "16.500")]
+
+def test_stitch_keeps_speaker_labels_consistent_across_chunks():
+    # The second job labelled the speakers the other way round
+    chunks = [
+        {"start": 0.0, "keep_from": 0.0, "keep_until": 10.0, "transcript": transcribe_result([
+            ("hello", 1.0, 1.5, "spk_0"), ("pain", 9.0, 9.4, "spk_1"), ("here", 11.0, 11.4, "spk_1"),
+        ])},
+        {"start": 8.0, "keep_from": 10.0, "keep_until": 20.0, "transcript": transcribe_result([
+            ("pain", 1.0, 1.4, "spk_0"), ("here", 3.0, 3.4, "spk_0"), ("thanks", 8.0, 8.5, "spk_1"),
+        ])},
+    ]
+    results = stitch_transcripts(chunks)["results"]
+
+    speakers = [item["speaker_label"] for item in results["items"]]
+    assert speakers == ["spk_0", "spk_1", "spk_1", "spk_0"]
+    assert [segment["speaker_label"] for segment in results["speaker_labels"]["segments"]] == ["spk_0", "spk_1", "spk_0"]
+    assert results["speaker_labels"]["speakers"] == 2